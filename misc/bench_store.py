@@ -0,0 +1,58 @@
+"""DataStore ordered index benchmark
+
+usage: PYTHONPATH=src python misc/bench_store.py [num_keys]
+"""
+import random
+import sys
+import time
+
+from consensus.store import DataStore
+
+
+BATCH_SIZE = 1000
+
+
+def bench(title: str, count: int, fn) -> None:
+    now = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - now
+    print(f'{title}: {count / elapsed:,.0f} ops/s ({elapsed:.3f}s)')
+
+
+def main(num_keys: int) -> None:
+    store = DataStore()
+    keys = [f'key/{i:010d}' for i in range(num_keys)]
+    random.shuffle(keys)
+
+    def load() -> None:
+        for i in range(0, num_keys, BATCH_SIZE):
+            store.apply([
+                {'op': 'set', 'key': key, 'value': key}
+                for key in keys[i:i + BATCH_SIZE]
+            ])
+
+    def get() -> None:
+        for key in keys[:100000]:
+            store.get(key)
+
+    def scan() -> None:
+        for key in keys[:10000]:
+            store.scan(key, None, 100)
+
+    def scan_prefix() -> None:
+        for key in keys[:10000]:
+            store.scan_prefix(key[:-2], 100)
+
+    def delete() -> None:
+        for key in keys[:100000]:
+            store.apply([{'op': 'del', 'key': key}])
+
+    bench(f'load {num_keys} keys', num_keys, load)
+    bench('get', min(num_keys, 100000), get)
+    bench('scan (100 keys)', min(num_keys, 10000), scan)
+    bench('prefix (100 keys)', min(num_keys, 10000), scan_prefix)
+    bench('del', min(num_keys, 100000), delete)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000)
@@ -0,0 +1,299 @@
+"""Micro benchmarks of per-message hot paths, with regression check
+
+each benchmark is calibrated to run at least MIN_RUN_TIME seconds, warmed
+up, then measured for several runs with gc disabled. results are
+compared with a stored baseline, and exits with 1 when a benchmark
+regressed more than the threshold. a benchmark regresses when both its
+fastest run and its median are slower than those of the baseline by
+threshold, so a noisy run alone doesn't fail.
+
+usage:
+    PYTHONPATH=src python misc/microbench.py --save     # store baseline
+    PYTHONPATH=src python misc/microbench.py -k parse --save  # update one
+    PYTHONPATH=src python misc/microbench.py            # compare
+    PYTHONPATH=src python misc/microbench.py -k parse   # filter by name
+"""
+import argparse
+import asyncio
+import gc
+import inspect
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+
+import core.logger as logger
+from consensus.raft.base import StateMachine
+from consensus.raft.journal import TransitionJournal
+from consensus.raft.state_machine import RaftStateMachine
+from consensus.raft.state_machine import STATES
+from consensus.session import SessionTable
+from consensus.snapshot import decode_chunk
+from consensus.snapshot import encode_record
+from consensus.store import DataStore
+from transport.tcp import parse_message
+from transport.tcp import response_err
+from transport.tcp import response_ok
+
+
+MIN_RUN_TIME = .1
+DEFAULT_BASELINE = '.microbench.json'
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(name: str) -> Callable:
+    """Register benchmark, which runs its primitive `n` times
+
+    benchmark can be a coroutine function, it runs on a shared loop.
+    """
+
+    def _decorator(fn: Callable) -> Callable:
+        BENCHMARKS[name] = fn
+        return fn
+
+    return _decorator
+
+
+async def _noop(*args: Any) -> None:
+    pass
+
+
+COMMANDS = {
+    'heartbeat': (_noop, 3),
+    'set': (_noop, 2),
+    'request': (_noop, 3),
+    'journal': (_noop, 0),
+}
+
+
+@benchmark('tcp.parse_message.heartbeat')
+def bench_parse_heartbeat(n: int) -> None:
+    message = 'heartbeat 12 0.050000 raft-1\n'
+    for _ in range(n):
+        parse_message(COMMANDS, message)
+
+
+@benchmark('tcp.parse_message.set')
+def bench_parse_set(n: int) -> None:
+    message = f'set key/0000000001 {"v" * 100}\n'
+    for _ in range(n):
+        parse_message(COMMANDS, message)
+
+
+@benchmark('tcp.parse_message.request')
+def bench_parse_request(n: int) -> None:
+    message = f'request 12 3 set key/0000000001 {"v" * 100}\n'
+    for _ in range(n):
+        parse_message(COMMANDS, message)
+
+
+@benchmark('tcp.response_ok')
+def bench_response_ok(n: int) -> None:
+    for _ in range(n):
+        response_ok('raft-1')
+
+
+@benchmark('tcp.response_err')
+def bench_response_err(n: int) -> None:
+    for _ in range(n):
+        response_err('TERM_IS_LOWER 12')
+
+
+class _Machine(StateMachine):
+    @StateMachine.synchronized
+    @StateMachine.before_states(['running'])
+    def touch(self) -> None:
+        pass
+
+
+@benchmark('raft.synchronized_before_states')
+async def bench_synchronized(n: int) -> None:
+    machine = _Machine('running')
+    for _ in range(n):
+        await machine.touch()
+
+
+@benchmark('raft.heartbeat_from_leader')
+async def bench_heartbeat(n: int) -> None:
+    context = RaftStateMachine('raft-2', ['127.0.0.1:2468'])
+    await context.heartbeat_from_leader(1, 'raft-1')
+    for _ in range(n):
+        await context.heartbeat_from_leader(1, 'raft-1')
+
+
+@benchmark('raft.journal_record')
+def bench_journal_record(n: int) -> None:
+    journal = TransitionJournal(STATES, size=1024)
+    for _ in range(n):
+        journal.record(1, 'FOLLOWER', 'CANDIDATE', None, 'election_timeout')
+
+
+@benchmark('store.apply')
+def bench_store_apply(n: int) -> None:
+    store = DataStore()
+    entries = [
+        [{'op': 'set', 'key': f'key/{i:010d}', 'value': 'v' * 100}]
+        for i in range(1024)
+    ]
+    for i in range(n):
+        store.apply(entries[i & 1023])
+
+
+@benchmark('snapshot.encode_record')
+def bench_encode_record(n: int) -> None:
+    value = 'v' * 100
+    for _ in range(n):
+        encode_record('key/0000000001', value)
+
+
+@benchmark('snapshot.decode_chunk')
+def bench_decode_chunk(n: int) -> None:
+    # a chunk of 64 records
+    chunk = b'[' + b','.join(
+        encode_record(f'key/{i:010d}', 'v' * 100) for i in range(64)) + b']'
+    for _ in range(n):
+        decode_chunk(chunk)
+
+
+@benchmark('session.lookup')
+def bench_session_lookup(n: int) -> None:
+    table = SessionTable(max_sessions=1024)
+    for session_id in range(1024):
+        table.register(session_id, 0.0)
+        table.record(session_id, 3, {'ok': True})
+    for i in range(n):
+        table.lookup(i & 1023, 3)
+
+
+@benchmark('logger.trace_disabled')
+def bench_trace_disabled(n: int) -> None:
+    term = 1
+    for _ in range(n):
+        logger.trace(f'got heartbeat message: {term=}')
+
+
+@benchmark('logger.info')
+def bench_info(n: int) -> None:
+    term = 1
+    for _ in range(n):
+        logger.info(f'new leader elected to [{term=}]')
+
+
+def run_once(loop: asyncio.AbstractEventLoop, fn: Callable, n: int) -> float:
+    gc.disable()
+    try:
+        started_at = time.perf_counter()
+        if inspect.iscoroutinefunction(fn):
+            loop.run_until_complete(fn(n))
+        else:
+            fn(n)
+
+        return time.perf_counter() - started_at
+
+    finally:
+        gc.enable()
+
+
+def measure(loop: asyncio.AbstractEventLoop, fn: Callable,
+            runs: int, warmup: int) -> List[float]:
+    """Returns nanoseconds per operation of each run
+    """
+
+    n = 1
+    while (elapsed := run_once(loop, fn, n)) < MIN_RUN_TIME:
+        n *= 2 if elapsed * 10 < MIN_RUN_TIME else 1.2
+        n = int(n) + 1
+
+    for _ in range(warmup):
+        run_once(loop, fn, n)
+
+    return [run_once(loop, fn, n) / n * 1e9 for _ in range(runs)]
+
+
+def is_regressed(samples: List[float], baseline: List[float],
+                 threshold: float) -> bool:
+    limit = 1 + threshold
+    median = statistics.median
+
+    return (min(samples) > min(baseline) * limit
+            and median(samples) > median(baseline) * limit)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='microbench')
+
+    parser.add_argument('-k', '--filter', default='',
+                        help='run benchmarks containing the name')
+    parser.add_argument('-b', '--baseline', default=DEFAULT_BASELINE,
+                        help=f'baseline path (default = {DEFAULT_BASELINE})')
+    parser.add_argument('-s', '--save', action='store_true',
+                        help=('store results to baseline, results of other'
+                              ' benchmarks are kept'))
+    parser.add_argument('-t', '--threshold', type=float, default=10.0,
+                        help='regression threshold percent (default = 10)')
+    parser.add_argument('-r', '--runs', type=int, default=9)
+    parser.add_argument('-w', '--warmup', type=int, default=3)
+
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace) -> int:
+    # logs are formatted and written, but to devnull
+    logger.set_logger('microbench', 'INFO', color=False)
+    logging.getLogger().handlers[-1].setStream(open(os.devnull, 'w'))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    loop = asyncio.new_event_loop()
+    results = {}
+    regressions = []
+
+    for (name, fn) in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+
+        samples = measure(loop, fn, args.runs, args.warmup)
+        results[name] = samples
+
+        best = min(samples)
+        line = (f'{name:40s} {best:10.1f} ns/op'
+                f' (median {statistics.median(samples):.1f})')
+
+        if name in baseline and not args.save:
+            line += f' {(best / min(baseline[name]) - 1) * 100:+7.1f}%'
+
+            if is_regressed(samples, baseline[name], args.threshold / 100):
+                regressions.append(name)
+                line += ' REGRESSED'
+
+        print(line, flush=True)
+
+    loop.close()
+
+    if args.save:
+        # filtered run only replaces baseline of benchmarks it ran
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f'baseline stored to {args.baseline}')
+
+    if regressions:
+        print(f'{len(regressions)} regressed over {args.threshold}%:'
+              f' {", ".join(regressions)}')
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
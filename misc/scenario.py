@@ -0,0 +1,237 @@
+"""Fault scenario benchmark, runs members behind a fault injecting proxy
+
+scenario `partition-leader` cuts every link of the leader while the
+leader is under write load, and measures time until a new leader is
+elected. the old leader should step down by check quorum.
+
+`--unix` runs members and proxy links on unix sockets in the workdir,
+to measure failover without loopback TCP overhead.
+
+usage: PYTHONPATH=src python misc/scenario.py [--latency 0.0025] ...
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from transport.address import UNIX
+from transport.address import parse_address
+from transport.proxy import FaultProxy
+from transport.transmission import call
+
+
+SERVER = os.path.join(os.path.dirname(__file__), '..', 'src', 'server.py')
+POLL_INTERVAL = .01
+
+Address = Tuple[str, Union[int, str]]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='scenario')
+
+    parser.add_argument('--members', type=int, default=3)
+    parser.add_argument('--port', type=int, default=2468)
+    parser.add_argument('--proxy-port', type=int, default=3468)
+    parser.add_argument(
+        '--unix', action='store_true',
+        help='listen unix sockets in the workdir instead of ports')
+    parser.add_argument('--latency', type=float, default=.0025)
+    parser.add_argument('--jitter', type=float, default=.0005)
+    parser.add_argument('--drop', type=float, default=0.0)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--settle', type=float, default=1.0)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument(
+        '--scenario', default='partition-leader',
+        choices=('partition-leader', 'oneway-leader'))
+
+    return parser.parse_args()
+
+
+async def journal(address: Address) -> List[dict]:
+    try:
+        response = await asyncio.wait_for(call(*address, 'journal'), 1.0)
+
+    except (asyncio.TimeoutError, OSError):
+        return []
+
+    return json.loads(response.strip()[len('+OK:'):])
+
+
+async def leader_since(addresses: Dict[str, Address],
+                       since: float) -> Optional[Tuple[str, float]]:
+    """Returns member which became leader after since, and the time
+    """
+
+    for (name, address) in addresses.items():
+        for event in reversed(await journal(address)):
+            if event['timestamp'] < since:
+                break
+
+            if event['new_state'] == 'LEADER':
+                return (name, event['timestamp'])
+
+    return None
+
+
+async def wait_leader(addresses: Dict[str, Address], since: float,
+                      timeout: float) -> Optional[Tuple[str, float]]:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if leader := await leader_since(addresses, since):
+            return leader
+
+        await asyncio.sleep(POLL_INTERVAL)
+
+    return None
+
+
+async def find_leader(addresses: Dict[str, Address]) -> Optional[str]:
+    """Returns member which is leader of the highest term
+    """
+
+    leaders = []
+    for (name, address) in addresses.items():
+        if (events := await journal(address)) and (
+                events[-1]['new_state'] == 'LEADER'):
+            leaders.append((events[-1]['term'], name))
+
+    return max(leaders)[1] if leaders else None
+
+
+async def load(address: Address, stopped: asyncio.Event,
+               counts: List[int]) -> None:
+    i = 0
+    while not stopped.is_set():
+        try:
+            response = await call(*address, f'set load/{i % 1000} {i}')
+
+        except OSError:
+            response = ''
+
+        # writes fail when the node is not leader anymore
+        if response.startswith('+'):
+            counts[0] += 1
+        else:
+            counts[1] += 1
+            await asyncio.sleep(POLL_INTERVAL)
+
+        i += 1
+
+
+async def run(args: argparse.Namespace) -> None:
+    names = [f'raft-{i + 1}' for i in range(args.members)]
+    workdir = tempfile.mkdtemp(prefix='raft-scenario-')
+
+    # listen address and port options of members
+    if args.unix:
+        listen = {
+            name: (f'{UNIX}:{os.path.join(workdir, f"{name}.sock")}', 0)
+            for name in names
+        }
+        proxy_addr = f'{UNIX}:{workdir}'
+    else:
+        listen = {
+            name: ('127.0.0.1', args.port + i)
+            for (i, name) in enumerate(names)
+        }
+        proxy_addr = '127.0.0.1'
+
+    addresses = {
+        name: parse_address(addr if args.unix else f'{addr}:{port}')
+        for (name, (addr, port)) in listen.items()
+    }
+    members = ','.join(
+        f'{name}:{host}:{port}' for (name, (host, port)) in addresses.items())
+
+    proxy = FaultProxy(members, proxy_addr, base_port=args.proxy_port)
+    proxy.set_faults('*', '*', latency=args.latency, jitter=args.jitter,
+                     drop=args.drop)
+    proxy_task = asyncio.create_task(proxy.run())
+
+    config = os.path.join(workdir, 'raft.ini')
+    with open(config, 'w') as f:
+        f.write('[DEFAULT]\n')
+
+    processes = [
+        subprocess.Popen(
+            [sys.executable, SERVER, '--name', name,
+             '--addr', listen[name][0], '--port', str(listen[name][1]),
+             '--members', proxy.members_of(name),
+             '--config', config, '--datadir', os.path.join(workdir, name),
+             '--no-color'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for name in names
+    ]
+
+    results = []
+    try:
+        if not await wait_leader(addresses, 0, args.timeout):
+            raise RuntimeError('no leader elected')
+
+        for _ in range(args.rounds):
+            await asyncio.sleep(args.settle)
+
+            if (leader := await find_leader(addresses)) is None:
+                raise RuntimeError('no leader after heal')
+
+            others = {n: a for (n, a) in addresses.items() if n != leader}
+
+            stopped = asyncio.Event()
+            counts = [0, 0]
+            clients = [
+                asyncio.create_task(load(addresses[leader], stopped, counts))
+                for _ in range(args.clients)
+            ]
+            await asyncio.sleep(args.settle)
+
+            cut_at = time.time()
+            for other in others:
+                proxy.partition(leader, other,
+                                oneway=args.scenario == 'oneway-leader')
+
+            found = await wait_leader(others, cut_at, args.timeout)
+
+            stopped.set()
+            await asyncio.gather(*clients)
+            proxy.heal()
+
+            if found is None:
+                print(f'{leader} partitioned: no new leader'
+                      f' in {args.timeout:.1f}s')
+                continue
+
+            (new_leader, elected_at) = found
+            failover = elected_at - cut_at
+            results.append(failover)
+            print(f'{leader} partitioned: {new_leader} elected'
+                  f' in {failover * 1000:.1f}ms'
+                  f' (load {counts[0]} ok / {counts[1]} err)')
+
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+        proxy_task.cancel()
+        await asyncio.gather(proxy_task, return_exceptions=True)
+
+    if results:
+        print(f'failover: min {min(results) * 1000:.1f}ms'
+              f' max {max(results) * 1000:.1f}ms'
+              f' avg {sum(results) / len(results) * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    asyncio.run(run(parse_args()))
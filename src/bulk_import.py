@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""Bulk import of key values, through a snapshot instead of writes
+
+build a sorted, chunked snapshot file of NDJSON or length prefixed
+binary records offline, then install it on every member at once.
+
+    python bulk_import.py build data.ndjson data.snap
+    python bulk_import.py build data.bin data.snap --format binary
+    python bulk_import.py install data.snap --leader 127.0.0.1:2468
+
+snapshot path of install is opened by the leader, and should be in its
+data dir. a relative path is relative to the data dir.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from consensus.snapshot import FORMAT_NDJSON
+from consensus.snapshot import MAX_CHUNK_BYTES
+from consensus.snapshot import READERS
+from consensus.snapshot import RUN_SIZE
+from consensus.snapshot import SnapshotFormatError
+from consensus.snapshot import build_snapshot
+from transport.address import parse_address
+from transport.transmission import call
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='BulkImport')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='build snapshot file')
+    build.add_argument('input', help='key value records, `-` for stdin')
+    build.add_argument('snapshot', help='snapshot path to write')
+    build.add_argument(
+        '-f', '--format', choices=sorted(READERS), default=FORMAT_NDJSON,
+        help=f'record format (default = {FORMAT_NDJSON})')
+    build.add_argument(
+        '--run-size', type=int, default=RUN_SIZE,
+        help=f'records sorted in memory at once (default = {RUN_SIZE})')
+    build.add_argument(
+        '--tmp-dir', help='directory of sort runs (default = snapshot dir)')
+    build.add_argument(
+        '--max-chunk-bytes', type=int, default=MAX_CHUNK_BYTES,
+        help=('largest encoded chunk, less than max message size of'
+              f' members (default = {MAX_CHUNK_BYTES})'))
+
+    install = commands.add_parser(
+        'install', help='install snapshot on every member')
+    install.add_argument(
+        'snapshot', help='snapshot path in the data dir of the leader')
+    install.add_argument(
+        '-l', '--leader', default='127.0.0.1:2468',
+        help='leader address, `ip:port` or `unix:/path`')
+
+    return parser.parse_args()
+
+
+def build(args: argparse.Namespace) -> int:
+    read_records = READERS[args.format]
+    started_at = time.perf_counter()
+
+    try:
+        if args.input == '-':
+            count = build_snapshot(
+                read_records(sys.stdin.buffer), args.snapshot,
+                run_size=args.run_size, tmp_dir=args.tmp_dir,
+                max_chunk_bytes=args.max_chunk_bytes)
+        else:
+            with open(args.input, 'rb', buffering=1024 * 1024) as f:
+                count = build_snapshot(
+                    read_records(f), args.snapshot,
+                    run_size=args.run_size, tmp_dir=args.tmp_dir,
+                    max_chunk_bytes=args.max_chunk_bytes)
+
+    except SnapshotFormatError as e:
+        print(f'invalid records: {e}', file=sys.stderr)
+        return 1
+
+    elapsed = time.perf_counter() - started_at
+    print(f'{count} keys written to {args.snapshot} in {elapsed:.1f}s')
+
+    return 0
+
+
+def install(args: argparse.Namespace) -> int:
+    (ip, port) = parse_address(args.leader)
+    response = asyncio.run(call(ip, port, f'import {args.snapshot}')).strip()
+    print(response)
+
+    return 0 if response.startswith('+') else 1
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.command == 'build':
+        sys.exit(build(args))
+    else:
+        sys.exit(install(args))
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from typing import Any
+
+import core.logger as logger
+from consensus.raft.state_machine import RaftStateMachine
+from consensus.raft.state_machine import STATE_LEADER
+from consensus.pipeline import ApplyPipeline
+from consensus.store import DataStore
+from consensus.store import OP_EXPIRE
+
+
+class KeyExpirer(object):
+    """Proposes batched expire entries of expired keys as a leader
+
+    expire entries go through the apply pipeline, in order with writes.
+    """
+
+    _context: RaftStateMachine
+    _store: DataStore
+    _pipeline: ApplyPipeline
+    _expire_interval: float
+    _expire_batch_size: int
+
+    def __init__(self, context: RaftStateMachine, store: DataStore,
+                 pipeline: ApplyPipeline, expire_interval: float,
+                 expire_batch_size: int) -> None:
+
+        self._context = context
+        self._store = store
+        self._pipeline = pipeline
+        self._expire_interval = expire_interval
+        self._expire_batch_size = expire_batch_size
+
+    async def expire(self) -> int:
+        await self._pipeline.settled()
+
+        expired = self._store.expired(time.time(), self._expire_batch_size)
+        if not expired:
+            return 0
+
+        await self._pipeline.apply([
+            {'op': OP_EXPIRE, 'key': key, 'version': version}
+            for (key, version) in expired
+        ])
+        logger.debug(f'expire keys [count={len(expired)}]')
+
+        return len(expired)
+
+    def create_expirer(self) -> Any:
+        async def run_expirer() -> None:
+            logger.info(f'start key expirer [{self._expire_interval=}]')
+
+            while True:
+                try:
+                    if (self._context._state == STATE_LEADER
+                            and not self._context._transferring):
+                        # drain full batches without waiting interval
+                        while await self.expire() == (
+                                self._expire_batch_size):
+                            await asyncio.sleep(0)
+
+                    await asyncio.sleep(self._expire_interval)
+
+                except asyncio.exceptions.CancelledError:
+                    logger.trace('stop expirer')
+                    break
+
+            logger.info('expirer stopped')
+
+        return run_expirer()
@@ -0,0 +1,316 @@
+import asyncio
+import os
+import secrets
+import tempfile
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+import core.logger as logger
+from consensus.pipeline import ApplyPipeline
+from consensus.raft.state_machine import ERR_NOT_CURRENT_LEADER
+from consensus.raft.state_machine import ERR_NOT_LEADER
+from consensus.raft.state_machine import RaftStateMachine
+from consensus.raft.state_machine import STATE_LEADER
+from consensus.snapshot import SnapshotWriter
+from consensus.snapshot import build_state
+from consensus.snapshot import check_snapshot
+from consensus.snapshot import read_chunks
+from consensus.store import DataStore
+from consensus.watch import WatchHub
+from transport.address import open_connection
+from transport.address import parse_address
+from transport.transmission import broadcast
+from transport.transmission import call
+
+
+ERR_UNKNOWN_TRANSFER = 'UNKNOWN_TRANSFER'
+ERR_STAGE_FAILED = 'STAGE_FAILED'
+ERR_COMMIT_FAILED = 'COMMIT_FAILED'
+ERR_STALE_INDEX = 'STALE_INDEX'
+ERR_INVALID_PATH = 'INVALID_PATH'
+
+# chunks sent to a peer before waiting for their responses
+INSTALL_WINDOW = 16
+INSTALL_TIMEOUT = 30.0
+
+
+class SnapshotInstallError(RuntimeError):
+    pass
+
+
+class SnapshotInstaller(object):
+    """Installs a snapshot file on every member at a single index
+
+    leader streams chunks of the snapshot to peers, which stage them.
+    when every peer staged the snapshot, leader installs it at its next
+    index, and peers install the staged snapshot at the same index.
+
+    chunks are staged to a file in the data dir as received, and decoded
+    when state is built. the install runs as an exclusive task of the
+    apply pipeline, so writes wait for it but the event loop is not
+    blocked while state is built.
+
+    peers only stage a transfer of the current leader at the current
+    term, and commit it while that leader is still current. snapshot
+    files are read from the data dir of the leader only.
+    """
+
+    _context: RaftStateMachine
+    _store: DataStore
+    _pipeline: ApplyPipeline
+    _watch_hub: WatchHub
+    _data_dir: str
+
+    # transfer id -> term and name of the leader, and staged file.
+    # a new transfer drops unfinished ones
+    _staged: Dict[str, Tuple[int, str, SnapshotWriter]]
+
+    def __init__(self, context: RaftStateMachine, store: DataStore,
+                 pipeline: ApplyPipeline, watch_hub: WatchHub,
+                 data_dir: str) -> None:
+        self._context = context
+        self._store = store
+        self._pipeline = pipeline
+        self._watch_hub = watch_hub
+        self._data_dir = data_dir
+
+        self._staged = {}
+
+    def _check_leader(self, term: int, leader_name: str) -> None:
+        context = self._context
+
+        if (context._term != term or context._leader != leader_name
+                or leader_name == context._name):
+            raise SnapshotInstallError(ERR_NOT_CURRENT_LEADER)
+
+    def begin(self, transfer_id: str, term: int, leader_name: str) -> None:
+        """Start staging a transfer of the leader `leader_name` at term
+        """
+
+        self._check_leader(term, leader_name)
+
+        for staged in list(self._staged):
+            self.abort(staged)
+
+        # file name is not derived from transfer id of the request
+        (fd, path) = tempfile.mkstemp(suffix='.staged', dir=self._data_dir)
+        os.close(fd)
+
+        self._staged[transfer_id] = (term, leader_name, SnapshotWriter(path))
+
+    def stage(self, transfer_id: str, raw: str) -> int:
+        """Stage a chunk, returns number of staged chunks
+        """
+
+        if (staged := self._staged.get(transfer_id)) is None:
+            raise SnapshotInstallError(ERR_UNKNOWN_TRANSFER)
+
+        (_, _, writer) = staged
+
+        return writer.write(raw.encode())
+
+    def abort(self, transfer_id: str) -> None:
+        if (staged := self._staged.pop(transfer_id, None)) is not None:
+            (_, _, writer) = staged
+            writer.close()
+            os.unlink(writer.path)
+
+    async def commit(self, transfer_id: str, index: int) -> int:
+        """Install staged snapshot at index, returns number of keys
+
+        raises SnapshotInstallError when the leader of the transfer is not
+        current anymore, or index is lower than the store index.
+        """
+
+        if (staged := self._staged.pop(transfer_id, None)) is None:
+            raise SnapshotInstallError(ERR_UNKNOWN_TRANSFER)
+
+        (term, leader_name, writer) = staged
+        writer.close()
+
+        try:
+            self._check_leader(term, leader_name)
+
+            (_, keys) = await self._install(read_chunks(writer.path), index)
+
+        finally:
+            os.unlink(writer.path)
+
+        return keys
+
+    async def _install(self, chunks: Iterable[Union[bytes, str]],
+                       index: Optional[int]) -> Tuple[int, int]:
+        """Install chunks at index, or at the next index of the store
+
+        returns installed index and number of keys.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        async def _run() -> Tuple[int, int]:
+            at = self._store.index + 1 if index is None else index
+            if at < self._store.index:
+                raise SnapshotInstallError(ERR_STALE_INDEX)
+
+            # build state off the loop, then swap it at once
+            (data, keys) = await loop.run_in_executor(
+                None, build_state, chunks, at)
+
+            self._store.install(data, keys, at)
+            self._watch_hub.reset()
+
+            logger.info(f'snapshot installed [index={at}] [keys={len(data)}]')
+
+            return (at, len(data))
+
+        installed: Tuple[int, int] = await self._pipeline.run_exclusive(_run)
+
+        return installed
+
+    async def _send(self, peer: str, transfer_id: str, term: int,
+                    path: str) -> bool:
+        """Stream chunks of snapshot to peer, returns whether staged
+        """
+
+        (ip, port) = parse_address(peer)
+
+        try:
+            (reader, writer) = await open_connection(
+                ip, port, bind=self._context._bind)
+
+        except OSError as e:
+            logger.warn(f'snapshot transfer failed [{peer=}] [{e!r}]')
+            return False
+
+        async def _expect_ok() -> None:
+            response = await asyncio.wait_for(
+                reader.readline(), INSTALL_TIMEOUT)
+            if not response.startswith(b'+'):
+                raise SnapshotInstallError(response.decode().strip())
+
+        try:
+            writer.write(
+                f'install_begin {transfer_id} {term}'
+                f' {self._context._name}\n'.encode())
+            await _expect_ok()
+
+            prefix = f'install_chunk {transfer_id} '.encode()
+            outstanding = 0
+
+            for raw in read_chunks(path):
+                writer.write(prefix + raw + b'\n')
+                await writer.drain()
+
+                if (outstanding := outstanding + 1) >= INSTALL_WINDOW:
+                    await _expect_ok()
+                    outstanding -= 1
+
+            for _ in range(outstanding):
+                await _expect_ok()
+
+            return True
+
+        except (SnapshotInstallError, asyncio.TimeoutError, OSError) as e:
+            logger.warn(f'snapshot transfer failed [{peer=}] [{e!r}]')
+            return False
+
+        finally:
+            writer.close()
+
+    async def _commit(self, peer: str, transfer_id: str, index: int) -> bool:
+        """Install staged snapshot of peer at index, returns whether done
+        """
+
+        (ip, port) = parse_address(peer)
+
+        try:
+            response = await asyncio.wait_for(
+                call(ip, port, f'install_commit {transfer_id} {index}',
+                     bind=self._context._bind),
+                INSTALL_TIMEOUT)
+
+        except (asyncio.TimeoutError, OSError) as e:
+            logger.warn(f'snapshot commit failed [{peer=}] [{e!r}]')
+            return False
+
+        if not response.startswith('+'):
+            logger.warn(f'snapshot commit failed [{peer=}] [{response=}]')
+            return False
+
+        return True
+
+    def resolve_path(self, path: str) -> str:
+        """Returns real path of snapshot file in the data dir, relative
+        path is relative to the data dir
+
+        raises SnapshotInstallError for a path out of the data dir.
+        """
+
+        data_dir = os.path.realpath(self._data_dir)
+        real_path = os.path.realpath(os.path.join(data_dir, path))
+
+        if os.path.commonpath([data_dir, real_path]) != data_dir:
+            raise SnapshotInstallError(ERR_INVALID_PATH)
+
+        return real_path
+
+    async def import_snapshot(self, path: str) -> dict:
+        """As a leader, install snapshot file in the data dir on every
+        member
+
+        raises SnapshotInstallError when not a leader, path is out of the
+        data dir, or any peer failed to stage the snapshot, and
+        SnapshotFormatError of invalid file. staged transfers of peers
+        are aborted on errors.
+
+        when peers failed to install after the leader installed, raises
+        COMMIT_FAILED with the index and failed peers. the snapshot should
+        be imported again, as those peers have different state.
+        """
+
+        if self._context._state != STATE_LEADER:
+            raise SnapshotInstallError(ERR_NOT_LEADER)
+
+        path = self.resolve_path(path)
+        check_snapshot(path)
+
+        # peers only accept the transfer of the leader at this term
+        term = self._context._term
+        transfer_id = f'{self._context._name}-{secrets.token_hex(8)}'
+        peers = self._context._peers
+
+        try:
+            staged = await asyncio.gather(*[
+                self._send(peer, transfer_id, term, path) for peer in peers
+            ])
+
+            failed = [peer for (peer, ok) in zip(peers, staged) if not ok]
+            if failed or self._context._state != STATE_LEADER or (
+                    self._context._term != term):
+                raise SnapshotInstallError(
+                    f'{ERR_STAGE_FAILED} {",".join(failed)}')
+
+            # the file is read again in the executor, chunks are not kept
+            (index, keys) = await self._install(read_chunks(path), None)
+
+        except Exception:
+            await broadcast(
+                peers, f'install_abort {transfer_id}',
+                timeout=INSTALL_TIMEOUT, bind=self._context._bind)
+            raise
+
+        committed = await asyncio.gather(
+            *[self._commit(peer, transfer_id, index) for peer in peers])
+
+        if failed := [peer for (peer, ok) in zip(peers, committed) if not ok]:
+            raise SnapshotInstallError(
+                f'{ERR_COMMIT_FAILED} {index} {",".join(failed)}')
+
+        return {
+            'index': index,
+            'keys': keys,
+            'peers': len(peers),
+        }
@@ -0,0 +1,127 @@
+from bisect import bisect_left
+from bisect import bisect_right
+from bisect import insort
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+
+class SortedKeys(object):
+    """Ordered key index, list of sorted key chunks
+
+    keys are kept in chunks of bounded size, so insertion and deletion
+    only moves a single chunk instead of the whole key list.
+    `_maxes` holds the last key of each chunk to locate chunk by bisect.
+    """
+
+    _load: int
+    _length: int
+    _chunks: List[List[str]]
+    _maxes: List[str]
+
+    def __init__(self, load: int = 1000) -> None:
+        self._load = load
+        self._length = 0
+        self._chunks = []
+        self._maxes = []
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk in self._chunks:
+            yield from chunk
+
+    def add(self, key: str) -> None:
+        """Add key to index, key should not be in the index
+        """
+
+        self._length += 1
+
+        if not self._maxes:
+            self._chunks.append([key])
+            self._maxes.append(key)
+            return
+
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            pos -= 1
+            self._chunks[pos].append(key)
+            self._maxes[pos] = key
+        else:
+            insort(self._chunks[pos], key)
+
+        chunk = self._chunks[pos]
+        if len(chunk) > self._load * 2:
+            self._chunks[pos:pos + 1] = [
+                chunk[:self._load], chunk[self._load:]]
+            self._maxes[pos:pos + 1] = [chunk[self._load - 1], chunk[-1]]
+
+    def extend_sorted(self, keys: List[str]) -> None:
+        """Append sorted keys, which are greater than every indexed key
+
+        used to build index in bulk, raises ValueError when keys are not
+        sorted.
+        """
+
+        if not keys:
+            return
+
+        last = self._maxes[-1] if self._maxes else None
+        if (last is not None and keys[0] <= last) or any(
+                a >= b for (a, b) in zip(keys, keys[1:])):
+            raise ValueError(keys[0])
+
+        pos = 0
+        if self._chunks and (room := self._load - len(self._chunks[-1])) > 0:
+            self._chunks[-1].extend(keys[:room])
+            self._maxes[-1] = self._chunks[-1][-1]
+            pos = room
+
+        for i in range(pos, len(keys), self._load):
+            chunk = keys[i:i + self._load]
+            self._chunks.append(chunk)
+            self._maxes.append(chunk[-1])
+
+        self._length += len(keys)
+
+    def discard(self, key: str) -> None:
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            return
+
+        chunk = self._chunks[pos]
+        i = bisect_left(chunk, key)
+        if chunk[i] != key:
+            return
+
+        self._length -= 1
+        del chunk[i]
+
+        if not chunk:
+            del self._chunks[pos]
+            del self._maxes[pos]
+        else:
+            self._maxes[pos] = chunk[-1]
+
+    def irange(self, start: str, end: Optional[str] = None,
+               exclusive_start: bool = False) -> Iterator[str]:
+        """Iterate keys in range [start, end)
+
+        index should not be changed while iterating.
+        """
+
+        bisect = bisect_right if exclusive_start else bisect_left
+
+        pos = bisect(self._maxes, start)
+        if pos == len(self._maxes):
+            return
+
+        i = bisect(self._chunks[pos], start)
+
+        for p in range(pos, len(self._chunks)):
+            for key in self._chunks[p][i:]:
+                if end is not None and key >= end:
+                    return
+                yield key
+            i = 0
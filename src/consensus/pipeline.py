@@ -0,0 +1,324 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import core.logger as logger
+from consensus.store import DataStore
+from consensus.store import validate_op
+
+
+# session id and sequence of an entry
+Session = Tuple[int, int]
+
+# store index after the entry, whether applied, and results of operations
+Applied = Tuple[int, bool, List[dict]]
+
+# operations, session and result of an entry written in partitions
+Routed = Tuple[List[dict], Optional[Session], asyncio.Future]
+
+
+class ApplyPipeline(object):
+    """Applies entries to the store in submitted order
+
+    handlers submit entries and await their results. the applier drains
+    queued entries in groups of up to `batch_size`, and yields the event
+    loop between groups, so a burst of writes delays consensus traffic
+    by a group at most.
+
+    each entry is applied atomically and in order, so reads and watchers
+    observe entry boundaries. entries with a client session are checked
+    against the session table in the applier, so concurrent retries of a
+    sequence are applied once.
+
+    an entry carries the time it is proposed at, and the session table
+    expires sessions against the time of each applied entry.
+
+    exclusive tasks, e.g. snapshot install, run in order too, and later
+    entries wait until the task is done. every mutation of the store,
+    including session registration and key expiry, goes through the
+    pipeline, so an exclusive task sees the index it started from.
+
+    with `partitions`, operations of a group are written by worker
+    threads partitioned by key hash, in order within each partition,
+    while the event loop serves other traffic. the group is published in
+    order at the barrier after every partition is written, so reads
+    wait for `settled` to observe entry boundaries. exclusive tasks,
+    entries with version guards, and the next entry of a session in the
+    group are applied after a barrier, as they depend on earlier entries.
+    """
+
+    _store: DataStore
+    _batch_size: int
+    _queue: asyncio.Queue
+
+    _partitions: int
+    _executor: Optional[ThreadPoolExecutor]
+    # cleared while partitions are written, not published yet
+    _settled: asyncio.Event
+
+    def __init__(self, store: DataStore, batch_size: int = 64,
+                 queue_size: int = 10000, partitions: int = 1) -> None:
+        self._store = store
+        self._batch_size = batch_size
+        self._queue = asyncio.Queue(maxsize=queue_size)
+
+        self._partitions = partitions
+        self._executor = ThreadPoolExecutor(
+            max_workers=partitions, thread_name_prefix='apply',
+        ) if partitions > 1 else None
+        self._settled = asyncio.Event()
+        self._settled.set()
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    async def apply(self, ops: List[dict],
+                    session: Optional[Session] = None,
+                    at: Optional[float] = None) -> Applied:
+        """Submit entry proposed at `at`, now by default, and wait until
+        it is applied
+
+        raises errors of store apply, and session errors when the
+        session is expired or the sequence is stale.
+        """
+
+        if at is None:
+            at = time.time()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((ops, session, at, future))
+
+        applied: Applied = await future
+
+        return applied
+
+    async def settled(self) -> None:
+        """Wait until written partitions are published, reads of the store
+        should wait for it
+        """
+
+        while not self._settled.is_set():
+            await self._settled.wait()
+
+    async def run_exclusive(self, task: Callable[[], Awaitable[Any]]) -> Any:
+        """Run task after queued entries, later entries wait for it
+        """
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((task, None, None, future))
+
+        return await future
+
+    async def register_session(self, at: Optional[float] = None) -> int:
+        """Register client session in order with entries, returns the id
+        """
+
+        registered_at = time.time() if at is None else at
+
+        async def _register() -> int:
+            return self._store.register_session(registered_at)
+
+        session_id: int = await self.run_exclusive(_register)
+
+        return session_id
+
+    def _apply(self, ops: List[dict], session: Optional[Session],
+               at: float) -> Applied:
+        store = self._store
+        store.sessions.expire(at)
+
+        if session is None:
+            (applied, results) = store.apply(ops)
+            return (store.index, applied, results)
+
+        (session_id, seq) = session
+        cached: Optional[Applied] = store.sessions.lookup(session_id, seq)
+        if cached is not None:
+            return cached
+
+        (applied, results) = store.apply(ops)
+        entry = (store.index, applied, results)
+
+        # rejected entries are not applied, so they can be retried
+        if applied:
+            store.sessions.record(session_id, seq, entry)
+
+        return entry
+
+    def _apply_entry(self, ops: List[dict], session: Optional[Session],
+                     at: float, future: asyncio.Future) -> None:
+        try:
+            result = self._apply(ops, session, at)
+
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+
+        else:
+            # the entry is applied even when its client is gone
+            if not future.done():
+                future.set_result(result)
+
+    async def _apply_partitioned(self, group: List[tuple]) -> None:
+        """Applies group, entries without version guard in partitions
+        """
+
+        segment = []  # type: List[Routed]
+        store = self._store
+
+        for (entry, session, at, future) in group:
+            if callable(entry):
+                await self._flush(segment)
+                await self._run_task(entry, future)
+                continue
+
+            guarded = any(
+                isinstance(op, dict) and op.get('version') is not None
+                for op in entry)
+            if guarded or (session is not None and any(
+                    routed[1] is not None and routed[1][0] == session[0]
+                    for routed in segment)):
+                await self._flush(segment)
+
+            if guarded:
+                self._apply_entry(entry, session, at, future)
+                continue
+
+            try:
+                store.sessions.expire(at)
+
+                cached = None  # type: Optional[Applied]
+                if session is not None:
+                    cached = store.sessions.lookup(*session)
+
+                if cached is None:
+                    for op in entry:
+                        validate_op(op)
+
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+
+            if cached is not None:
+                if not future.done():
+                    future.set_result(cached)
+                continue
+
+            segment.append((entry, session, future))
+
+        await self._flush(segment)
+
+    async def _flush(self, segment: List[Routed]) -> None:
+        """Write entries of segment in partitions, and publish them in
+        order after every partition is written
+        """
+
+        if not segment:
+            return
+
+        store = self._store
+
+        # writes of each partition, and their positions of each entry
+        writes = {}  # type: Dict[int, List[Tuple[int, dict]]]
+        slots = []  # type: List[List[Tuple[int, int]]]
+
+        index = store.index
+        for (ops, _, _) in segment:
+            index += 1
+            entry_slots = []
+            for op in ops:
+                p = hash(op['key']) % self._partitions
+                partition = writes.setdefault(p, [])
+                entry_slots.append((p, len(partition)))
+                partition.append((index, op))
+            slots.append(entry_slots)
+
+        loop = asyncio.get_running_loop()
+        self._settled.clear()
+
+        try:
+            written = dict(zip(writes, await asyncio.gather(*[
+                loop.run_in_executor(self._executor, store.write, partition)
+                for partition in writes.values()
+            ])))
+
+        except Exception as e:
+            for (_, _, future) in segment:
+                if not future.done():
+                    future.set_exception(e)
+
+        else:
+            for ((ops, session, future), entry_slots) in zip(segment, slots):
+                results = [written[p][i] for (p, i) in entry_slots]
+                store.publish(store.index + 1, ops, results)
+
+                applied = (store.index, True, results)  # type: Applied
+                if session is not None:
+                    store.sessions.record(*session, applied)
+
+                if not future.done():
+                    future.set_result(applied)
+
+        finally:
+            segment.clear()
+            self._settled.set()
+
+    async def _run_task(self, task: Callable[[], Awaitable[Any]],
+                        future: asyncio.Future) -> None:
+        try:
+            result = await task()
+
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    def create_applier(self) -> Any:
+        async def run_applier() -> None:
+            logger.info(
+                f'start apply pipeline [{self._batch_size=}'
+                f' {self._partitions=}]')
+
+            while True:
+                try:
+                    group = [await self._queue.get()]
+                    while len(group) < self._batch_size and (
+                            not self._queue.empty()):
+                        group.append(self._queue.get_nowait())
+
+                    # queued item is an entry, or an exclusive task
+                    if self._executor is not None:
+                        await self._apply_partitioned(group)
+
+                    else:
+                        for (entry, session, at, future) in group:
+                            if callable(entry):
+                                await self._run_task(entry, future)
+                            else:
+                                self._apply_entry(
+                                    entry, session, at, future)
+
+                    # let consensus traffic run between groups
+                    await asyncio.sleep(0)
+
+                except asyncio.exceptions.CancelledError:
+                    logger.trace('stop applier')
+                    break
+
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+
+            logger.info('applier stopped')
+
+        return run_applier()
@@ -1,14 +1,30 @@
 import asyncio
-import random
+import time
 from typing import Any
 from typing import List
+from typing import Optional
+from typing import Tuple
 
 import core.logger as logger
+from transport.address import parse_address
 from transport.transmission import broadcast
+from transport.transmission import call
+from consensus.raft.base import WrongStateConditionError
+from consensus.raft.state_machine import ERR_LOWER_TERM
+from consensus.raft.state_machine import ERR_NOT_LEADER
+from consensus.raft.state_machine import ERR_TRANSFERRING
+from consensus.raft.state_machine import LeadershipTransferError
 from consensus.raft.state_machine import RaftStateMachine
+from consensus.raft.state_machine import StatePromotionError
 from consensus.raft.state_machine import STATE_FOLLOWER
 from consensus.raft.state_machine import STATE_CANDIDATE
 from consensus.raft.state_machine import STATE_LEADER
+from consensus.raft.timing import RaftTiming
+
+
+ERR_TRANSFER_FAILED = 'TRANSFER_FAILED'
+
+TRANSFER_POLL_INTERVAL = .01
 
 
 class LeaderTimeoutError(RuntimeError):
@@ -24,26 +40,37 @@ async def timeout(task: asyncio.Task, duration: float) -> None:
     task.cancel()
 
 
+def count_responses(messages: List[str]) -> Tuple[int, int]:
+    """Returns count of granted responses and the highest term of
+    rejected responses.
+    """
+
+    granted = 0
+    higher_term = 0
+    lower_term_err = f'-ERR:{ERR_LOWER_TERM} '
+
+    for message in messages:
+        if message.startswith('+'):
+            granted += 1
+
+        elif message.startswith(lower_term_err):
+            term = int(message[len(lower_term_err):])
+            higher_term = max(higher_term, term)
+
+    return granted, higher_term
+
+
 class RaftActor(object):
     _context: RaftStateMachine
     _event: asyncio.Event
+    _timing: RaftTiming
 
-    _leader_timeout: float
-    _election_timeout_jitter: float
-    _vote_interval: float
-    _heartbeat_interval: float
-
-    def __init__(
-            self, context: RaftStateMachine, event: asyncio.Event,
-            leader_timeout: float, election_timeout_jitter: float,
-            vote_interval: float, heartbeat_interval: float):
+    def __init__(self, context: RaftStateMachine, event: asyncio.Event,
+                 timing: RaftTiming):
 
         self._context = context
         self._event = event
-        self._leader_timeout = leader_timeout
-        self._election_timeout_jitter = election_timeout_jitter
-        self._vote_interval = vote_interval
-        self._heartbeat_interval = heartbeat_interval
+        self._timing = timing
 
     async def _wait_for_leader(self, timeout_seconds: float) -> bool:
         try:
@@ -80,77 +107,210 @@ class RaftActor(object):
         logger.info(f'run as {STATE_FOLLOWER} state')
 
         while self._context._state == STATE_FOLLOWER:
-            logger.debug((
-                'waiting heartbeat'
-                f' [{self._leader_timeout=}s]'
-            ))
+            leader_timeout = self._timing.leader_timeout
+            logger.debug(f'waiting heartbeat [{leader_timeout=}s]')
 
             try:
-                await self._wait_for_leader(self._leader_timeout)
-                logger.debug('heartbeat received.')
+                await self._wait_for_leader(leader_timeout)
+                await self._check_timeout_now()
                 continue
 
             except LeaderTimeoutError:
                 logger.warn('leader timeout.')
 
             try:
-                election_timeout = random.uniform(
-                    0, self._election_timeout_jitter)
+                election_timeout = self._timing.election_timeout()
                 logger.warn((
                     'wait for election timeout.',
                     f' [{election_timeout=}]'
                 ))
                 await self._wait_for_leader(election_timeout)
+                await self._check_timeout_now()
                 continue
 
             except LeaderTimeoutError:
                 logger.warn('election timeout.')
+
+            if await self._pre_vote():
                 await self._context.promote_to_candidate()
 
+    async def _check_timeout_now(self) -> None:
+        """Start election immediately, when leader transfers leadership
+        """
+
+        if self._context._timeout_now:
+            logger.info('leadership is transferred from leader.')
+            await self._context.promote_to_candidate('timeout_now')
+
+    async def _pre_vote(self) -> bool:
+        """Check whether this node can win the election, without
+        increasing the term.
+        """
+
+        term = self._context._term + 1
+        logger.debug(f'sending pre-vote requests. [{term=}]')
+        messages = await broadcast(
+            self._context._peers,
+            f'prevote {term} {self._context._name}',
+            observe=self._timing.observe_rtt,
+            timeout=self._timing.leader_timeout,
+            bind=self._context._bind
+        )
+        (granted, higher_term) = count_responses(messages)
+        await self._context.observe_term(higher_term)
+
+        # count myself
+        votes = granted + 1
+        if votes < self._context.quorum:
+            logger.warn(f'pre-vote is not granted. [{votes=}]')
+            return False
+
+        return self._context._state == STATE_FOLLOWER
+
     async def _act_as_candidate(self) -> None:
         logger.info(
             f'run as {STATE_CANDIDATE} state')
 
         while self._context._state == STATE_CANDIDATE:
-            logger.debug((
-                'sending vote requests.'
-                f' [{self._vote_interval=}s]'
-            ))
+            term = self._context._term
+            logger.debug(f'sending vote requests. [{term=}]')
             messages = await broadcast(
                 self._context._peers,
-                f'vote {self._context._term} {self._context._name}'
+                f'vote {term} {self._context._name}',
+                observe=self._timing.observe_rtt,
+                timeout=self._timing.leader_timeout,
+                bind=self._context._bind
             )
-            votes = len([m for m in messages if m.startswith('+')])
+            (granted, higher_term) = count_responses(messages)
+            await self._context.observe_term(higher_term)
+
+            # count myself
+            votes = granted + 1
+            if votes >= self._context.quorum:
+                try:
+                    await self._context.promote_to_leader(term)
+
+                except (WrongStateConditionError, StatePromotionError):
+                    logger.warn('state is changed while voting')
 
-            if votes > 0:
-                await self._context.promote_to_leader()
                 # exit candidate loop
                 break
 
-            logger.warn('wait for the next vote')
-
-            await asyncio.sleep(self._vote_interval)
+            if self._context._state == STATE_CANDIDATE:
+                # step down, and retry after leader timeout with pre-vote
+                logger.warn(f'election failed. [{votes=}]')
+                await self._context.step_down('election_failed')
 
     async def _act_as_leader(self) -> None:
         logger.info(f'run as {STATE_LEADER} state')
 
+        quorum_at = time.monotonic()
+
         while self._context._state == STATE_LEADER:
-            await self.send_heartbeats_to_peers()
-            await asyncio.sleep(self._heartbeat_interval)
-
-    async def send_heartbeats_to_peers(self) -> List[str]:
-        logger.debug((
-            'sending heartbeats.'
-            f' [{self._heartbeat_interval=}s]'
-        ))
+            heartbeat_interval = self._timing.heartbeat_interval
+            messages = await self.send_heartbeats_to_peers(heartbeat_interval)
+
+            (granted, higher_term) = count_responses(messages)
+            await self._context.observe_term(higher_term)
+
+            # check quorum, step down when majority is not reachable
+            now = time.monotonic()
+            if granted + 1 >= self._context.quorum:
+                quorum_at = now
+
+            elif now - quorum_at > self._timing.leader_timeout:
+                if self._context._state == STATE_LEADER:
+                    logger.warn('lost contact with majority.')
+                    await self._context.step_down('check_quorum')
+                break
+
+            await asyncio.sleep(heartbeat_interval)
+
+    async def send_heartbeats_to_peers(
+            self, heartbeat_interval: float) -> List[str]:
+        logger.debug(f'sending heartbeats. [{heartbeat_interval=}s]')
+
+        # leader times out as a follower with its own interval
+        self._timing.observe_leader_interval(heartbeat_interval)
+
         responses = await broadcast(
             self._context._peers,
-            f'heartbeat {self._context._term} {self._context._name}'
+            (f'heartbeat {self._context._term} {heartbeat_interval:.6f}'
+             f' {self._context._name}'),
+            observe=self._timing.observe_rtt,
+            timeout=heartbeat_interval,
+            bind=self._context._bind
         )  # type: List[str]
         logger.debug(f'[{responses=}]')
 
         return responses
 
+    async def transfer_leadership(self, target: Optional[str] = None) -> str:
+        """Transfer leadership to target, or the fastest caught-up peer
+
+        stops accepting proposals, ensures the target is up to date with a
+        heartbeat, and sends `timeout_now` to let it start election
+        immediately. returns the peer which took over leadership.
+        """
+
+        if self._context._state != STATE_LEADER:
+            raise LeadershipTransferError(ERR_NOT_LEADER)
+
+        if self._context._transferring:
+            raise LeadershipTransferError(ERR_TRANSFERRING)
+
+        peers = [target] if target else self._timing.sort_by_rtt(
+            self._context._peers)
+
+        self._context._transferring = True
+        try:
+            for peer in peers:
+                if await self._transfer_to(peer):
+                    logger.info(f'leadership is transferred to {peer}')
+                    return peer
+
+        finally:
+            self._context._transferring = False
+
+        raise LeadershipTransferError(ERR_TRANSFER_FAILED)
+
+    async def _transfer_to(self, peer: str) -> bool:
+        term = self._context._term
+        name = self._context._name
+        call_timeout = self._timing.leader_timeout
+        heartbeat_interval = self._timing.heartbeat_interval
+
+        (ip, port) = parse_address(peer)
+
+        try:
+            messages = [
+                f'heartbeat {term} {heartbeat_interval:.6f} {name}',
+                f'timeout_now {term} {name}',
+            ]
+            for message in messages:
+                response = await asyncio.wait_for(
+                    call(ip, port, message, bind=self._context._bind),
+                    call_timeout)
+
+                if not response.startswith('+'):
+                    logger.warn(f'transfer rejected. [{peer=} {response=}]')
+                    return False
+
+        except (asyncio.TimeoutError, OSError):
+            logger.warn(f'transfer target is not reachable. [{peer=}]')
+            return False
+
+        # wait until target is elected, and steps me down
+        deadline = time.monotonic() + call_timeout
+        while self._context._state == STATE_LEADER:
+            if time.monotonic() > deadline:
+                logger.warn(f'transfer timeout. [{peer=}]')
+                return False
+
+            await asyncio.sleep(TRANSFER_POLL_INTERVAL)
+
+        return True
+
     def create_worker(self) -> Any:
         async def run_worker() -> None:
             logger.info('start raft worker')
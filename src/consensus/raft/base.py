@@ -2,7 +2,6 @@ import asyncio
 from typing import Any
 from typing import List
 from typing import Callable
-from core import logger
 
 
 class WrongStateConditionError(RuntimeError):
@@ -24,15 +23,9 @@ class StateMachine(object):
 
         async def _wrap(self: StateMachine,
                         *args: tuple, **kwargs: dict) -> Any:
-            logger.trace(f'synchronized [fn={fn.__name__}] acquire lock')
-            await self._lock.acquire()
-            try:
+            async with self._lock:
                 return fn(self, *args, **kwargs)
 
-            finally:
-                logger.trace(f'synchronized [fn={fn.__name__}] release lock')
-                self._lock.release()
-
         _wrap.__name__ = fn.__name__
         return _wrap
 
@@ -40,11 +33,6 @@ class StateMachine(object):
     def before_states(states: List[str]) -> Callable:
         def _decorator(fn: Callable) -> Callable:
             def _wrap(self: StateMachine, *args: tuple, **kwargs: dict) -> Any:
-                logger.trace((
-                    f'before_states [fn={fn.__name__}]'
-                    f' [state={self._state}] [desired={states}]'
-                ))
-
                 if self._state not in states:
                     raise WrongStateConditionError()
 
@@ -0,0 +1,77 @@
+import json
+import time
+from array import array
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+
+class TransitionJournal(object):
+    """Fixed size ring buffer of state transition events
+
+    events are stored into preallocated arrays, so recording an event
+    doesn't allocate and costs only a few array stores.
+    """
+
+    _size: int
+    _count: int
+    _states: Sequence[str]
+    _state_codes: dict
+
+    _timestamps: array
+    _terms: array
+    _old_states: array
+    _new_states: array
+    _leaders: List[Optional[str]]
+    _causes: List[Optional[str]]
+
+    def __init__(self, states: Sequence[str], size: int = 1024) -> None:
+        self._size = size
+        self._count = 0
+        self._states = states
+        self._state_codes = {state: code for code, state in enumerate(states)}
+
+        self._timestamps = array('d', bytes(8 * size))
+        self._terms = array('q', bytes(8 * size))
+        self._old_states = array('b', bytes(size))
+        self._new_states = array('b', bytes(size))
+        self._leaders = [None] * size
+        self._causes = [None] * size
+
+    def __len__(self) -> int:
+        return min(self._count, self._size)
+
+    def record(self, term: int, old_state: str, new_state: str,
+               leader: Optional[str], cause: str) -> None:
+        i = self._count % self._size
+        self._count += 1
+
+        self._timestamps[i] = time.time()
+        self._terms[i] = term
+        self._old_states[i] = self._state_codes[old_state]
+        self._new_states[i] = self._state_codes[new_state]
+        self._leaders[i] = leader
+        self._causes[i] = cause
+
+    def events(self) -> List[dict]:
+        """Returns recorded events, oldest first
+        """
+
+        start = self._count - len(self)
+
+        return [
+            {
+                'seq': seq,
+                'timestamp': self._timestamps[i],
+                'term': self._terms[i],
+                'old_state': self._states[self._old_states[i]],
+                'new_state': self._states[self._new_states[i]],
+                'leader': self._leaders[i],
+                'cause': self._causes[i],
+            }
+            for seq in range(start, self._count)
+            for i in (seq % self._size,)
+        ]
+
+    def dumps(self) -> str:
+        return json.dumps(self.events(), separators=(',', ':'))
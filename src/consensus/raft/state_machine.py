@@ -1,14 +1,23 @@
-from typing import Any
+import time
+from typing import Dict
 from typing import List
 from typing import Optional
 
 import core.logger as logger
 from consensus.raft.base import StateMachine
+from consensus.raft.journal import TransitionJournal
 
 
 STATE_FOLLOWER = 'FOLLOWER'
 STATE_CANDIDATE = 'CANDIDATE'
 STATE_LEADER = 'LEADER'
+STATES = (STATE_FOLLOWER, STATE_CANDIDATE, STATE_LEADER)
+
+# error codes of responses, shared by server and actor
+ERR_LOWER_TERM = 'TERM_IS_LOWER'
+ERR_NOT_LEADER = 'NOT_LEADER'
+ERR_NOT_CURRENT_LEADER = 'NOT_CURRENT_LEADER'
+ERR_TRANSFERRING = 'TRANSFERRING'
 
 
 class StatePromotionError(RuntimeError):
@@ -19,6 +28,18 @@ class TermIsLowerThanCurrent(RuntimeError):
     pass
 
 
+class AlreadyVoted(RuntimeError):
+    pass
+
+
+class LeaderIsAlive(RuntimeError):
+    pass
+
+
+class LeadershipTransferError(RuntimeError):
+    pass
+
+
 class RaftStateMachine(StateMachine):
     """Raft Concensus state machine
     """
@@ -26,21 +47,66 @@ class RaftStateMachine(StateMachine):
     _name: str
     _leader: Optional[str]
     _term: int
+    _voted_for: Optional[str]
     _peers: List[str]
-
-    def __init__(self, name: str, peers: List[str]):
+    _addresses: Dict[str, str]
+    _bind: Optional[str]
+    _journal: TransitionJournal
+
+    # monotonic time of the last accepted heartbeat
+    _heartbeat_at: float
+
+    # leader stops accepting proposals while transferring leadership
+    _transferring: bool
+    # follower starts election immediately, requested by leader
+    _timeout_now: bool
+
+    def __init__(self, name: str, peers: List[str], journal_size: int = 1024,
+                 addresses: Optional[Dict[str, str]] = None,
+                 bind: Optional[str] = None):
+        """`addresses` are peer addresses by name, to redirect clients.
+        connections to peers are bound to `bind` unix address, so peers
+        can tell them apart from clients.
+        """
 
         # initialized as follower node
         super().__init__(STATE_FOLLOWER)
 
         self._name = name
         self._peers = peers
+        self._addresses = addresses or {}
+        self._bind = bind
         self._leader = None
         self._term = 0
+        self._voted_for = None
+        self._journal = TransitionJournal(STATES, size=journal_size)
+        self._heartbeat_at = 0.0
+        self._transferring = False
+        self._timeout_now = False
+
+    @property
+    def journal(self) -> TransitionJournal:
+        return self._journal
 
-    def __setattr__(self, __name: str, __value: Any) -> None:
-        logger.trace(f'set {__name} as {__value!r}')
-        super().__setattr__(__name, __value)
+    def _transit(self, state: str, cause: str) -> None:
+        self._journal.record(
+            self._term, self._state, state, self._leader, cause)
+        self._state = state
+        self._timeout_now = False
+
+    @property
+    def leader_address(self) -> Optional[str]:
+        """Address of the known leader, None when unknown or myself
+        """
+
+        return self._addresses.get(self._leader) if self._leader else None
+
+    @property
+    def quorum(self) -> int:
+        """Majority of members, including myself
+        """
+
+        return (len(self._peers) + 1) // 2 + 1
 
     @property
     def log_header(self) -> str:
@@ -48,30 +114,54 @@ class RaftStateMachine(StateMachine):
 
     @StateMachine.synchronized
     @StateMachine.before_states([STATE_FOLLOWER])
-    def promote_to_candidate(self) -> None:
+    def promote_to_candidate(self, cause: str = 'election_timeout') -> None:
         self._term += 1
         self._leader = None
-        self._state = STATE_CANDIDATE
+        self._voted_for = self._name
+        self._transit(STATE_CANDIDATE, cause)
 
     @StateMachine.synchronized
     @StateMachine.before_states([STATE_CANDIDATE])
-    def promote_to_leader(self) -> None:
+    def promote_to_leader(self, term: int) -> None:
+        """Promote to leader, when elected at the current term
+        """
+
+        if self._term != term:
+            raise StatePromotionError()
+
+        self._leader = self._name
+        self._transit(STATE_LEADER, 'elected')
+
+    @StateMachine.synchronized
+    def step_down(self, cause: str = 'step_down') -> None:
         self._leader = None
-        self._state = STATE_LEADER
+        self._transit(STATE_FOLLOWER, cause)
 
     @StateMachine.synchronized
-    def step_down(self) -> None:
-        self._state = STATE_FOLLOWER
+    def observe_term(self, term: int) -> None:
+        """Step down as a follower when higher term is observed
+        """
+
+        if term <= self._term:
+            return
+
+        self._term = term
+        self._leader = None
+        self._voted_for = None
+        self._transit(STATE_FOLLOWER, 'higher_term')
 
     @StateMachine.synchronized
-    def set_leader(self, term: int, leader_name: str) -> None:
+    def set_leader(self, term: int, leader_name: str, cause: str) -> None:
         """Set leader and step-down state
         """
 
         logger.info(f'new leader elected to [{term=}] [{leader_name=}]')
+        if term != self._term:
+            self._voted_for = None
+
         self._term = term
         self._leader = leader_name
-        self._state = STATE_FOLLOWER
+        self._transit(STATE_FOLLOWER, cause)
 
     async def heartbeat_from_leader(self, term: int, leader_name: str) -> str:
         """as a follower, ensure mystate is follower
@@ -82,22 +172,67 @@ class RaftStateMachine(StateMachine):
         if self._term > term:
             raise TermIsLowerThanCurrent()
 
-        if self._leader != leader_name:
-            await self.set_leader(term, leader_name)
+        if self._leader != leader_name or self._term != term:
+            await self.set_leader(term, leader_name, 'heartbeat')
+
+        self._heartbeat_at = time.monotonic()
 
         return self._name
 
-    @StateMachine.before_states([STATE_FOLLOWER])
-    async def vote_from_candidate(self, term: int, candidate_name: str) -> str:
-        """as a follower, response vote message to candidate.
+    @StateMachine.synchronized
+    def vote_from_candidate(self, term: int, candidate_name: str) -> str:
+        """response vote message to candidate.
 
-        if leader is not elected, accept voting from candidate.
+        vote is granted once a term, steps down when the term is higher.
         """
-        logger.trace(f'got vote request: {candidate_name=}')
+        logger.trace(f'got vote request: {term=} {candidate_name=}')
 
         if self._term > term:
             raise TermIsLowerThanCurrent()
 
-        await self.set_leader(term, candidate_name)
+        if self._term < term:
+            self._term = term
+            self._leader = None
+            self._voted_for = None
+
+            if self._state != STATE_FOLLOWER:
+                self._transit(STATE_FOLLOWER, 'higher_term')
+
+        if self._voted_for not in (None, candidate_name):
+            raise AlreadyVoted()
+
+        self._voted_for = candidate_name
+
+        return self._name
+
+    def prevote_from_candidate(self, term: int, candidate_name: str,
+                               leader_timeout: float) -> str:
+        """response pre-vote message to candidate.
+
+        pre-vote doesn't change any state. it is granted only if the
+        candidate term is higher, and no leader is alive.
+        """
+        logger.trace(f'got pre-vote request: {term=} {candidate_name=}')
+
+        if self._term >= term:
+            raise TermIsLowerThanCurrent()
+
+        heartbeat_elapsed = time.monotonic() - self._heartbeat_at
+        if self._state == STATE_LEADER or (
+                self._leader and heartbeat_elapsed < leader_timeout):
+            raise LeaderIsAlive()
+
+        return self._name
+
+    @StateMachine.before_states([STATE_FOLLOWER])
+    def timeout_now_from_leader(self, term: int, leader_name: str) -> str:
+        """as a follower, accept leadership transfer from current leader.
+        """
+        logger.trace(f'got timeout now request: {term=} {leader_name=}')
+
+        if self._term != term or self._leader != leader_name:
+            raise LeadershipTransferError()
+
+        self._timeout_now = True
 
         return self._name
@@ -1,36 +1,141 @@
 import asyncio
+import contextvars
+import json
+import time
 from typing import Any
+from typing import AsyncIterator
+from typing import Awaitable
 from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
 
 from core import logger
+from core.profiling import LoopMonitor
+from core.profiling import Profiler
+from core.profiling import ProfilerBusyError
 from consensus.raft.base import WrongStateConditionError
+from consensus.raft.state_machine import AlreadyVoted
+from consensus.raft.state_machine import ERR_LOWER_TERM
+from consensus.raft.state_machine import ERR_NOT_CURRENT_LEADER
+from consensus.raft.state_machine import ERR_NOT_LEADER
+from consensus.raft.state_machine import ERR_TRANSFERRING
+from consensus.raft.state_machine import LeaderIsAlive
+from consensus.raft.state_machine import LeadershipTransferError
 from consensus.raft.state_machine import RaftStateMachine
+from consensus.raft.state_machine import STATE_LEADER
 from consensus.raft.state_machine import TermIsLowerThanCurrent
+from consensus.raft.timing import RaftTiming
+from consensus.importer import SnapshotInstaller
+from consensus.importer import SnapshotInstallError
+from consensus.pipeline import Applied
+from consensus.pipeline import ApplyPipeline
+from consensus.pipeline import Session
+from consensus.session import ERR_SESSION_EXPIRED
+from consensus.session import ERR_STALE_SEQUENCE
+from consensus.session import SessionExpiredError
+from consensus.session import StaleSequenceError
+from consensus.snapshot import SnapshotFormatError
+from consensus.store import DataStore
+from consensus.store import InvalidOperationError
+from consensus.store import OP_DEL
+from consensus.store import OP_SET
+from consensus.store import resolve_ttl
+from consensus.watch import HistoryCompactedError
+from consensus.watch import RESYNC
+from consensus.watch import Watcher
+from consensus.watch import WatchHub
+from transport.address import member_key
+from transport.admission import AdmissionControl
+from transport.admission import AdmissionLimits
+from transport.tcp import parse_message
 from transport.tcp import run_server
 from transport.tcp import response_ok
 from transport.tcp import response_err
 
 
 ERR_WRONG_STATE = 'WRONG_STATE'
-ERR_LOWER_TERM = 'TERM_IS_LOWER'
+ERR_ALREADY_VOTED = 'ALREADY_VOTED'
+ERR_LEADER_ALIVE = 'LEADER_IS_ALIVE'
+ERR_PROFILER_BUSY = 'PROFILER_BUSY'
+ERR_INVALID_ARGUMENT = 'INVALID_ARGUMENT'
+ERR_NOT_FOUND = 'NOT_FOUND'
+ERR_INVALID_BATCH = 'INVALID_BATCH'
+ERR_INVALID_TTL = 'INVALID_TTL'
+ERR_COMPACTED = 'COMPACTED'
+ERR_RESYNC = 'RESYNC'
+ERR_INVALID_SNAPSHOT = 'INVALID_SNAPSHOT'
+
+SCAN_PAGE_SIZE = 100
+SCAN_DEFAULT_LIMIT = 1000
+SCAN_OPEN_END = '*'
+WATCH_PREFIX = '*'
+
+# consensus commands of peers bypass admission control limits
+PRIORITY_COMMANDS = ('heartbeat', 'vote', 'prevote', 'timeout_now')
+
+# client session of the write command being handled
+_session: contextvars.ContextVar[Optional[Session]] = contextvars.ContextVar(
+    '_session', default=None)
 
 
 class RaftTCPServer(object):
     _context: RaftStateMachine
     _event: asyncio.Event
+    _timing: RaftTiming
+    _store: DataStore
+    _pipeline: ApplyPipeline
+    _watch_hub: WatchHub
 
     _addr: str
     _port: int
+    _admission: AdmissionControl
+    _transfer_leadership: Callable[[Optional[str]], Awaitable[str]]
+    _profiler: Profiler
+    _monitor: LoopMonitor
+    _installer: SnapshotInstaller
+
+    _write_commands: dict
 
     def __init__(self, context: RaftStateMachine,
-                 event: asyncio.Event, addr: str, port: int):
+                 event: asyncio.Event, timing: RaftTiming,
+                 store: DataStore, pipeline: ApplyPipeline,
+                 watch_hub: WatchHub, addr: str, port: int,
+                 admission_limits: AdmissionLimits,
+                 transfer_leadership: Callable[
+                     [Optional[str]], Awaitable[str]],
+                 profiler: Profiler, monitor: LoopMonitor,
+                 installer: SnapshotInstaller):
         self._context = context
         self._event = event
+        self._timing = timing
+        self._store = store
+        self._pipeline = pipeline
+        self._watch_hub = watch_hub
         self._addr = addr
         self._port = port
+        self._admission = AdmissionControl(
+            admission_limits, priority=PRIORITY_COMMANDS,
+            peers=[member_key(peer) for peer in context._peers])
+        self._transfer_leadership = transfer_leadership
+        self._profiler = profiler
+        self._monitor = monitor
+        self._installer = installer
 
-    async def handle_heartbeat(self, term: int, leader_name: str) -> bytes:
+        # write commands, which can be requested in a client session
+        self._write_commands = {
+            'set': (self.handle_set, 2),
+            'setex': (self.handle_setex, 3),
+            'del': (self.handle_del, 1),
+            'batch': (self.handle_batch, 1),
+        }
+
+    async def handle_heartbeat(self, term: int, interval: str,
+                               leader_name: str) -> bytes:
         """as a follower, ensure mystate is follower
+
+        `interval` is the heartbeat interval of the leader.
         """
         logger.trace(f'tcp: handle heartbeat message: {term=} {leader_name=}')
 
@@ -43,23 +148,26 @@ class RaftTCPServer(object):
                 term, leader_name)
             handler = response_ok
 
+            self._timing.observe_leader_interval(float(interval))
+
         except WrongStateConditionError:
             message = ERR_WRONG_STATE
 
         except TermIsLowerThanCurrent:
-            message = ERR_LOWER_TERM
+            message = f'{ERR_LOWER_TERM} {self._context._term}'
 
-        logger.trace('emit event')
-        self._event.set()
+        if handler is response_ok:
+            logger.trace('emit event')
+            self._event.set()
 
         response = handler(message)  # type: bytes
 
         return response
 
     async def handle_vote(self, term: int, candidate_name: str) -> bytes:
-        """as a follower, response vote message to candidate.
+        """response vote message to candidate.
 
-        if leader is not elected, accept voting from candidate.
+        vote is granted once a term. granting vote resets leader timeout.
         """
         logger.trace(f'tcp: got vote request: {term=} {candidate_name=}')
 
@@ -72,21 +180,493 @@ class RaftTCPServer(object):
                 term, candidate_name)
             handler = response_ok
 
-        except WrongStateConditionError:
-            message = ERR_WRONG_STATE
+            self._event.set()
+
+        except AlreadyVoted:
+            message = ERR_ALREADY_VOTED
 
         except TermIsLowerThanCurrent:
+            message = f'{ERR_LOWER_TERM} {self._context._term}'
+
+        response = handler(message)  # type: bytes
+
+        return response
+
+    async def handle_prevote(self, term: int, candidate_name: str) -> bytes:
+        """response pre-vote message to candidate.
+
+        `term` is the term candidate will use for the election.
+        """
+        logger.trace(f'tcp: got pre-vote request: {term=} {candidate_name=}')
+
+        term = int(term)
+        message: str
+        handler = response_err  # type: Callable
+
+        try:
+            message = self._context.prevote_from_candidate(
+                term, candidate_name, self._timing.leader_timeout)
+            handler = response_ok
+
+        except LeaderIsAlive:
+            message = ERR_LEADER_ALIVE
+
+        except TermIsLowerThanCurrent:
+            message = f'{ERR_LOWER_TERM} {self._context._term}'
+
+        response = handler(message)  # type: bytes
+
+        return response
+
+    async def handle_timeout_now(self, term: int, leader_name: str) -> bytes:
+        """as a follower, start election immediately by leader request.
+        """
+        logger.trace(f'tcp: got timeout now request: {term=} {leader_name=}')
+
+        term = int(term)
+        message: str
+        handler = response_err  # type: Callable
+
+        try:
+            message = self._context.timeout_now_from_leader(term, leader_name)
+            handler = response_ok
+
+            # wake up actor waiting heartbeat
+            self._event.set()
+
+        except WrongStateConditionError:
             message = ERR_WRONG_STATE
 
+        except LeadershipTransferError:
+            message = ERR_NOT_CURRENT_LEADER
+
         response = handler(message)  # type: bytes
 
         return response
 
+    async def handle_transfer(self, target: Optional[str] = None) -> bytes:
+        """admin command, transfers leadership to target peer `ip:port`
+
+        without target, the fastest caught-up peer is selected.
+        """
+
+        try:
+            peer = await self._transfer_leadership(target)
+
+        except LeadershipTransferError as e:
+            return response_err(str(e))
+
+        return response_ok(peer)
+
+    async def handle_get(self, key: str) -> bytes:
+        await self._pipeline.settled()
+
+        if (value_version := self._store.get(key)) is None:
+            return response_err(ERR_NOT_FOUND)
+
+        return response_ok(value_version[0])
+
+    def _check_writable(self) -> Optional[bytes]:
+        """returns error response when writes can't be accepted
+
+        only the leader accepts writes, and it stops while transferring
+        leadership. NOT_LEADER error has the address of known leader.
+        """
+
+        if self._context._state != STATE_LEADER:
+            if (leader := self._context.leader_address) is None:
+                return response_err(ERR_NOT_LEADER)
+
+            return response_err(f'{ERR_NOT_LEADER} {leader}')
+
+        if self._context._transferring:
+            return response_err(ERR_TRANSFERRING)
+
+        return None
+
+    async def _apply(self, ops: List[dict]) -> Applied:
+        """apply entry through the pipeline, in the current client session
+        """
+
+        return await self._pipeline.apply(ops, _session.get())
+
+    async def handle_set(self, key: str, value: str) -> bytes:
+        if (error := self._check_writable()) is not None:
+            return error
+
+        (_, _, results) = await self._apply([
+            {'op': OP_SET, 'key': key, 'value': value}])
+
+        return response_ok(str(results[0]['version']))
+
+    async def handle_setex(self, key: str, ttl: str, value: str) -> bytes:
+        """set value which expires after ttl seconds
+        """
+
+        if (error := self._check_writable()) is not None:
+            return error
+
+        try:
+            ops = [{'op': OP_SET, 'key': key, 'value': value,
+                    'ttl': float(ttl)}]
+            resolve_ttl(ops, time.time())
+
+        except (ValueError, InvalidOperationError):
+            return response_err(ERR_INVALID_TTL)
+
+        (_, _, results) = await self._apply(ops)
+
+        return response_ok(str(results[0]['version']))
+
+    async def handle_del(self, key: str) -> bytes:
+        if (error := self._check_writable()) is not None:
+            return error
+
+        (index, _, results) = await self._apply([{'op': OP_DEL, 'key': key}])
+
+        if not results[0]['deleted']:
+            return response_err(ERR_NOT_FOUND)
+
+        return response_ok(str(index))
+
+    async def handle_batch(self, raw_ops: str) -> bytes:
+        """apply json encoded set/del operations atomically
+
+        e.g. `batch [{"op": "set", "key": "a", "value": "1", "version": 0}]`
+        set operation may have `ttl` seconds.
+        """
+
+        if (error := self._check_writable()) is not None:
+            return error
+
+        try:
+            ops = json.loads(raw_ops)
+            if not isinstance(ops, list) or not ops:
+                raise InvalidOperationError(ops)
+
+            resolve_ttl(ops, time.time())
+
+            (_, applied, results) = await self._apply(ops)
+
+        except (ValueError, InvalidOperationError):
+            return response_err(ERR_INVALID_BATCH)
+
+        handler = response_ok if applied else response_err
+        return handler(json.dumps(results, separators=(',', ':')))
+
+    async def handle_session(self) -> bytes:
+        """register client session, responds the session id
+        """
+
+        if (error := self._check_writable()) is not None:
+            return error
+
+        session_id = await self._pipeline.register_session()
+
+        return response_ok(str(session_id))
+
+    async def handle_request(self, session_id: str, seq: str,
+                             command: str) -> bytes:
+        """apply write command once per session sequence
+
+        e.g. `request 12 3 set a 1`. retry of an applied sequence is
+        answered from the cached result, without applying again.
+        """
+
+        try:
+            session = (int(session_id), int(seq))
+
+        except ValueError:
+            return response_err(ERR_INVALID_ARGUMENT)
+
+        (method, args) = parse_message(self._write_commands, command)
+
+        token = _session.set(session)
+        try:
+            response: bytes = await method(*args)
+
+            return response
+
+        except SessionExpiredError:
+            return response_err(ERR_SESSION_EXPIRED)
+
+        except StaleSequenceError:
+            return response_err(ERR_STALE_SEQUENCE)
+
+        finally:
+            _session.reset(token)
+
+    async def handle_scan(self, start: str, end: str,
+                          limit: str = str(SCAN_DEFAULT_LIMIT)
+                          ) -> AsyncIterator[bytes]:
+        """stream key value pairs in range [start, end) as pages
+
+        `*` as end means no upper bound.
+        """
+
+        range_end = None if end == SCAN_OPEN_END else end
+
+        def _scan(after: Optional[str], size: int) -> List[Tuple[str, str]]:
+            if after is None:
+                return self._store.scan(start, range_end, size)
+
+            return self._store.scan(
+                after, range_end, size, exclusive_start=True)
+
+        return stream_pages(_scan, int(limit), self._pipeline.settled)
+
+    async def handle_prefix(self, prefix: str,
+                            limit: str = str(SCAN_DEFAULT_LIMIT),
+                            start: Optional[str] = None
+                            ) -> AsyncIterator[bytes]:
+        """stream key value pairs under prefix as pages
+
+        `start` is the `next` key of previous scan to continue.
+        """
+
+        def _scan(after: Optional[str], size: int) -> List[Tuple[str, str]]:
+            if after is None:
+                return self._store.scan_prefix(prefix, size, start=start)
+
+            return self._store.scan_prefix(
+                prefix, size, start=after, exclusive_start=True)
+
+        return stream_pages(_scan, int(limit), self._pipeline.settled)
+
+    async def handle_watch(self, key: str, from_index: Optional[str] = None
+                           ) -> Union[bytes, AsyncIterator[bytes]]:
+        """stream changes of key, or keys under prefix ends with `*`
+
+        replays changes from `from_index` if the index is retained.
+        """
+
+        prefix = key.endswith(WATCH_PREFIX)
+        if prefix:
+            key = key[:-len(WATCH_PREFIX)]
+
+        try:
+            watcher = self._watch_hub.watch(
+                key, prefix,
+                from_index=None if from_index is None else int(from_index))
+
+        except HistoryCompactedError:
+            return response_err(f'{ERR_COMPACTED} {self._store.index}')
+
+        return stream_watch(self._watch_hub, watcher)
+
+    async def handle_journal(self) -> bytes:
+        """admin command, dumps state transition journal
+        """
+
+        return response_ok(self._context.journal.dumps())
+
+    async def handle_profile(self, mode: str, seconds: str) -> bytes:
+        """admin command, profiles for seconds with `cpu` or `sample` mode
+
+        responds the path of dumped profile, after profiling is done.
+        """
+
+        try:
+            path = await self._profiler.profile(mode, float(seconds))
+
+        except ValueError:
+            return response_err(ERR_INVALID_ARGUMENT)
+
+        except ProfilerBusyError:
+            return response_err(ERR_PROFILER_BUSY)
+
+        return response_ok(path)
+
+    async def handle_tracemalloc(self, action: str) -> bytes:
+        """admin command, `start`, `stop` tracemalloc or take `snapshot`
+        """
+
+        try:
+            result = self._profiler.tracemalloc(action)
+
+        except ValueError:
+            return response_err(ERR_INVALID_ARGUMENT)
+
+        return response_ok(json.dumps(result, separators=(',', ':')))
+
+    async def handle_tasks(self) -> bytes:
+        """admin command, reports count of running tasks
+        """
+
+        tasks = self._profiler.tasks()
+
+        return response_ok(json.dumps(tasks, separators=(',', ':')))
+
+    async def handle_stalls(self) -> bytes:
+        """admin command, reports recorded event loop stalls
+        """
+
+        stalls = self._monitor.stalls
+
+        return response_ok(json.dumps(stalls, separators=(',', ':')))
+
+    async def handle_import(self, path: str) -> bytes:
+        """admin command, installs snapshot file on every member
+
+        leader only, and path should be in the data dir of the leader.
+        responds the installed index, number of keys and number of peers
+        installed.
+        """
+
+        if self._context._transferring:
+            return response_err(ERR_TRANSFERRING)
+
+        try:
+            result = await self._installer.import_snapshot(path)
+
+        except SnapshotInstallError as e:
+            return response_err(str(e))
+
+        except (SnapshotFormatError, OSError) as e:
+            return response_err(f'{ERR_INVALID_SNAPSHOT} {e}')
+
+        return response_ok(json.dumps(result, separators=(',', ':')))
+
+    async def handle_install_begin(self, transfer_id: str, term: str,
+                                   leader_name: str) -> bytes:
+        """start staging snapshot chunks streamed by the current leader
+        """
+
+        try:
+            self._installer.begin(transfer_id, int(term), leader_name)
+
+        except SnapshotInstallError as e:
+            return response_err(str(e))
+
+        except ValueError:
+            return response_err(ERR_INVALID_ARGUMENT)
+
+        return response_ok(transfer_id)
+
+    async def handle_install_chunk(self, transfer_id: str,
+                                   raw_chunk: str) -> bytes:
+        try:
+            count = self._installer.stage(transfer_id, raw_chunk)
+
+        except SnapshotInstallError as e:
+            return response_err(str(e))
+
+        return response_ok(str(count))
+
+    async def handle_install_commit(self, transfer_id: str,
+                                    index: str) -> bytes:
+        """install staged snapshot at the index of the leader
+        """
+
+        try:
+            count = await self._installer.commit(transfer_id, int(index))
+
+        except SnapshotInstallError as e:
+            return response_err(str(e))
+
+        except (SnapshotFormatError, ValueError):
+            return response_err(ERR_INVALID_SNAPSHOT)
+
+        return response_ok(str(count))
+
+    async def handle_install_abort(self, transfer_id: str) -> bytes:
+        self._installer.abort(transfer_id)
+
+        return response_ok(transfer_id)
+
     def create_server(self) -> Any:
         return run_server(
             name='consensus', addr=self._addr, port=self._port,
             commands={
-                'heartbeat': (self.handle_heartbeat, 2),
+                'heartbeat': (self.handle_heartbeat, 3),
                 'vote': (self.handle_vote, 2),
-            }
+                'prevote': (self.handle_prevote, 2),
+                'timeout_now': (self.handle_timeout_now, 2),
+                'get': (self.handle_get, 1),
+                **self._write_commands,
+                'session': (self.handle_session, 0),
+                'request': (self.handle_request, 3),
+                'scan': (self.handle_scan, 3),
+                'prefix': (self.handle_prefix, 3),
+                'watch': (self.handle_watch, 2),
+                'journal': (self.handle_journal, 0),
+                'transfer': (self.handle_transfer, 1),
+                'profile': (self.handle_profile, 2),
+                'tracemalloc': (self.handle_tracemalloc, 1),
+                'tasks': (self.handle_tasks, 0),
+                'stalls': (self.handle_stalls, 0),
+                'import': (self.handle_import, 1),
+                'install_begin': (self.handle_install_begin, 3),
+                'install_chunk': (self.handle_install_chunk, 2),
+                'install_commit': (self.handle_install_commit, 2),
+                'install_abort': (self.handle_install_abort, 1),
+            },
+            admission=self._admission
         )
+
+
+async def stream_pages(
+        scan: Callable[[Optional[str], int], List[Tuple[str, str]]],
+        limit: int,
+        settled: Callable[[], Awaitable[None]]) -> AsyncIterator[bytes]:
+    """Yields scan results as json pages
+
+    each page is scanned after the last key of previous page, so writes
+    between pages are allowed. pages are scanned when `settled`, so each
+    page observes entry boundaries. last page has `done` flag, and `next`
+    key to continue the scan when the limit is reached.
+    """
+
+    after = None  # type: Optional[str]
+    remains = max(limit, 0)
+
+    while True:
+        size = min(SCAN_PAGE_SIZE, remains)
+
+        await settled()
+        items = scan(after, size + 1)
+
+        more = len(items) > size
+        page_items = items[:size]
+        remains -= len(page_items)
+
+        done = not more or remains <= 0
+        page = {'items': page_items, 'done': done}  # type: dict
+        if done:
+            page['next'] = items[size][0] if more else None
+
+        yield response_ok(json.dumps(page, separators=(',', ':')))
+
+        if done:
+            break
+
+        after = page_items[-1][0]
+
+
+async def stream_watch(hub: WatchHub,
+                       watcher: Watcher) -> AsyncIterator[bytes]:
+    """Yields change events of watcher
+
+    first message is the store index when the watch is started.
+    when the watcher is dropped, yields RESYNC error with the index.
+    """
+
+    try:
+        yield response_ok(
+            json.dumps({'index': watcher.index}, separators=(',', ':')))
+
+        for event in watcher.replay:
+            yield response_ok(json.dumps(event, separators=(',', ':')))
+        watcher.replay = []
+
+        while True:
+            event = await watcher.queue.get()
+
+            if event is RESYNC:
+                yield response_err(f'{ERR_RESYNC} {hub.index}')
+                break
+
+            yield response_ok(json.dumps(event, separators=(',', ':')))
+
+    finally:
+        hub.unwatch(watcher)
@@ -0,0 +1,165 @@
+import random
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+
+# RTT smoothing gains of RFC 6298
+RTT_ALPHA = 1 / 8
+RTT_BETA = 1 / 4
+RTT_VAR_FACTOR = 4
+# retransmission timeout per call timeout of timed out peer
+TIMEOUT_BACKOFF = 2.0
+
+# heartbeat interval per retransmission timeout of slowest peer
+HEARTBEAT_RTO_FACTOR = 4
+# leader timeout per heartbeat interval of leader
+LEADER_TIMEOUT_FACTOR = 3
+
+
+def clamp(value: float, floor: float, ceiling: float) -> float:
+    return min(max(value, floor), ceiling)
+
+
+class RaftTiming(object):
+    """Election and heartbeat timing, derived from measured peer RTT
+
+    leader derives heartbeat interval from smoothed RTT and its variance
+    of each peer, and sends the interval with heartbeats. followers
+    derive leader timeout from the interval of the leader.
+
+    static config values are used as ceilings, and as is when adaptive
+    timing is disabled or nothing is measured yet.
+
+    with `quorum_peers`, timing covers the fastest peers needed for
+    majority, so an unreachable peer does not slow down the others.
+    """
+
+    _adaptive: bool
+
+    _leader_timeout: float
+    _election_timeout_jitter: float
+    _heartbeat_interval: float
+
+    _min_leader_timeout: float
+    _min_heartbeat_interval: float
+    _quorum_peers: Optional[int]
+
+    _rtts: Dict[str, Tuple[float, float]]
+    _backoffs: Dict[str, float]
+    _leader_heartbeat_interval: Optional[float]
+
+    def __init__(
+            self, leader_timeout: float, election_timeout_jitter: float,
+            heartbeat_interval: float, min_leader_timeout: float,
+            min_heartbeat_interval: float,
+            adaptive: bool = True,
+            quorum_peers: Optional[int] = None) -> None:
+
+        self._adaptive = adaptive
+
+        self._leader_timeout = leader_timeout
+        self._election_timeout_jitter = election_timeout_jitter
+        self._heartbeat_interval = heartbeat_interval
+
+        self._min_leader_timeout = min(min_leader_timeout, leader_timeout)
+        self._min_heartbeat_interval = min(
+            min_heartbeat_interval, heartbeat_interval)
+        self._quorum_peers = quorum_peers
+
+        self._rtts = {}
+        self._backoffs = {}
+        self._leader_heartbeat_interval = None
+
+    def observe_rtt(
+            self, peer: str, rtt: float, timed_out: bool = False) -> None:
+        """Update smoothed RTT and RTT variance of peer
+
+        timed out call is not a sample. it backs off retransmission timeout
+        of the peer to the timeout times `TIMEOUT_BACKOFF`, until the next
+        response of the peer, as RFC 6298 does.
+        """
+
+        if timed_out:
+            self._backoffs[peer] = rtt * TIMEOUT_BACKOFF
+            return
+
+        self._backoffs.pop(peer, None)
+
+        if (srtt_rttvar := self._rtts.get(peer)) is None:
+            self._rtts[peer] = (rtt, rtt / 2)
+            return
+
+        (srtt, rttvar) = srtt_rttvar
+        rttvar = (1 - RTT_BETA) * rttvar + RTT_BETA * abs(srtt - rtt)
+        srtt = (1 - RTT_ALPHA) * srtt + RTT_ALPHA * rtt
+
+        self._rtts[peer] = (srtt, rttvar)
+
+    def sort_by_rtt(self, peers: List[str]) -> List[str]:
+        """Returns peers ordered by smoothed RTT, unmeasured peers last
+        """
+
+        def _srtt(peer: str) -> float:
+            return self._rtts.get(peer, (float('inf'), 0.0))[0]
+
+        return sorted(peers, key=_srtt)
+
+    def observe_leader_interval(self, interval: float) -> None:
+        self._leader_heartbeat_interval = interval
+
+    @property
+    def rto(self) -> Optional[float]:
+        """Retransmission timeout of the slowest peer, or the slowest of
+        the fastest peers needed for majority with `quorum_peers`
+        """
+
+        rtos_by_peer = {
+            peer: srtt + RTT_VAR_FACTOR * rttvar
+            for (peer, (srtt, rttvar)) in self._rtts.items()
+        }
+        for (peer, backoff) in self._backoffs.items():
+            rtos_by_peer[peer] = max(rtos_by_peer.get(peer, 0.0), backoff)
+
+        if not rtos_by_peer:
+            return None
+
+        rtos = sorted(rtos_by_peer.values())
+
+        if not self._quorum_peers:
+            return rtos[-1]
+
+        return rtos[min(self._quorum_peers, len(rtos)) - 1]
+
+    @property
+    def heartbeat_interval(self) -> float:
+        if not self._adaptive or (rto := self.rto) is None:
+            return self._heartbeat_interval
+
+        return clamp(
+            rto * HEARTBEAT_RTO_FACTOR,
+            self._min_heartbeat_interval, self._heartbeat_interval)
+
+    @property
+    def leader_timeout(self) -> float:
+        interval = self._leader_heartbeat_interval
+        if not self._adaptive or interval is None:
+            return self._leader_timeout
+
+        return clamp(
+            interval * LEADER_TIMEOUT_FACTOR,
+            self._min_leader_timeout, self._leader_timeout)
+
+    def election_timeout(self) -> float:
+        """Randomized election timeout after leader timeout
+
+        with adaptive timing, jitter is up to the leader timeout, but not
+        larger than the configured jitter.
+        """
+
+        jitter = self._election_timeout_jitter
+        if self._adaptive:
+            jitter = min(jitter, self.leader_timeout)
+
+        return random.uniform(0, jitter)
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from typing import Any
+from typing import Tuple
+
+
+ERR_SESSION_EXPIRED = 'SESSION_EXPIRED'
+ERR_STALE_SEQUENCE = 'STALE_SEQUENCE'
+
+
+class SessionExpiredError(RuntimeError):
+    pass
+
+
+class StaleSequenceError(RuntimeError):
+    pass
+
+
+class SessionTable(object):
+    """Last applied sequence and its result of each client session
+
+    a client numbers its requests in a session, and retries a request
+    with the same sequence. a retry of the last applied sequence is
+    answered with the cached result, instead of being applied again.
+
+    sessions are kept in order of last activity. sessions idle for `ttl`
+    seconds, or least recently active ones over `max_sessions`, are
+    expired, and their clients should register a new session.
+
+    time of the table is the proposed time carried in applied entries,
+    never the clock of the node, so replicas applying the same entries
+    expire the same sessions. it never goes backward.
+    """
+
+    _max_sessions: int
+    _ttl: float
+    _now: float
+
+    # session id -> (last sequence, result, last active at)
+    _sessions: 'OrderedDict[int, Tuple[int, Any, float]]'
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 600.0) -> None:
+        self._max_sessions = max_sessions
+        self._ttl = ttl
+        self._now = 0.0
+
+        self._sessions = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: int) -> bool:
+        return session_id in self._sessions
+
+    def register(self, session_id: int, at: float) -> None:
+        self._now = max(self._now, at)
+        self._sessions[session_id] = (0, None, self._now)
+        self.expire(at)
+
+    def lookup(self, session_id: int, seq: int) -> Any:
+        """Returns cached result when seq is already applied
+
+        raises SessionExpiredError for unknown session, and
+        StaleSequenceError when seq is older than the last applied one,
+        as its result is not cached anymore. sessions should be expired
+        at time of the entry beforehand.
+        """
+
+        if (session := self._sessions.get(session_id)) is None:
+            raise SessionExpiredError(session_id)
+
+        (last_seq, result, _) = session
+        if seq < last_seq:
+            raise StaleSequenceError(seq)
+
+        self._sessions[session_id] = (last_seq, result, self._now)
+        self._sessions.move_to_end(session_id)
+
+        return result if seq == last_seq else None
+
+    def record(self, session_id: int, seq: int, result: Any) -> None:
+        if session_id not in self._sessions:
+            return
+
+        self._sessions[session_id] = (seq, result, self._now)
+        self._sessions.move_to_end(session_id)
+
+    def expire(self, at: float) -> int:
+        """Advance time to entry time `at`, and remove idle and overflown
+        sessions, returns removed count
+        """
+
+        self._now = max(self._now, at)
+
+        removed = 0
+        sessions = self._sessions
+
+        while sessions and (
+                len(sessions) > self._max_sessions
+                or next(iter(sessions.values()))[2] + self._ttl <= self._now):
+            sessions.popitem(last=False)
+            removed += 1
+
+        return removed
+
+    def clear(self) -> None:
+        self._sessions.clear()
@@ -0,0 +1,328 @@
+import heapq
+import json
+import os
+import struct
+import tempfile
+from typing import Dict
+from typing import IO
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from consensus.index import SortedKeys
+
+
+SNAPSHOT_MAGIC = b'RAFTSNAP1\n'
+
+# encoded size of a chunk. encoded chunk is sent as a single message, so
+# the largest chunk should be less than max message size of members
+CHUNK_BYTES = 16 * 1024
+MAX_CHUNK_BYTES = 60 * 1024
+# records sorted in memory before spilled to a run file
+RUN_SIZE = 1_000_000
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_BINARY = 'binary'
+
+BUFFER_SIZE = 1024 * 1024
+
+_LENGTH = struct.Struct('>I')
+
+
+class SnapshotFormatError(ValueError):
+    pass
+
+
+def _read_frame(f: IO[bytes]) -> Optional[bytes]:
+    if not (header := f.read(_LENGTH.size)):
+        return None
+
+    if len(header) < _LENGTH.size:
+        raise SnapshotFormatError('truncated frame header')
+
+    (length,) = _LENGTH.unpack(header)
+    if len(data := f.read(length)) < length:
+        raise SnapshotFormatError('truncated frame')
+
+    return data
+
+
+def _write_frame(f: IO[bytes], data: bytes) -> None:
+    f.write(_LENGTH.pack(len(data)))
+    f.write(data)
+
+
+def read_ndjson(f: IO[bytes]) -> Iterator[Tuple[str, str]]:
+    """Yields key value records of `{"key": ..., "value": ...}` lines
+    """
+
+    for line in f:
+        if not line.strip():
+            continue
+
+        try:
+            record = json.loads(line)
+            (key, value) = (record['key'], record['value'])
+
+        except (ValueError, KeyError, TypeError):
+            raise SnapshotFormatError(line[:100])
+
+        if not isinstance(key, str) or not isinstance(value, str):
+            raise SnapshotFormatError(line[:100])
+
+        yield (key, value)
+
+
+def read_binary(f: IO[bytes]) -> Iterator[Tuple[str, str]]:
+    """Yields key value records of length prefixed binary
+
+    a record is utf-8 key and value, each prefixed by big endian u32
+    length.
+    """
+
+    while (key := _read_frame(f)) is not None:
+        if (value := _read_frame(f)) is None:
+            raise SnapshotFormatError('record without value')
+
+        yield (key.decode(), value.decode())
+
+
+def write_binary(f: IO[bytes], records: Iterable[Tuple[str, str]]) -> None:
+    for (key, value) in records:
+        _write_frame(f, key.encode())
+        _write_frame(f, value.encode())
+
+
+READERS = {
+    FORMAT_NDJSON: read_ndjson,
+    FORMAT_BINARY: read_binary,
+}
+
+
+class SnapshotWriter(object):
+    """Writes encoded chunks to a snapshot file, readable by read_chunks
+    after closed
+    """
+
+    path: str
+    chunks: int
+
+    _file: IO[bytes]
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.chunks = 0
+
+        self._file = open(path, 'wb', buffering=BUFFER_SIZE)
+        self._file.write(SNAPSHOT_MAGIC)
+
+    def write(self, raw: bytes) -> int:
+        """Append encoded chunk, returns number of written chunks
+        """
+
+        _write_frame(self._file, raw)
+        self.chunks += 1
+
+        return self.chunks
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _spill_runs(records: Iterable[Tuple[str, str]], run_size: int,
+                tmp_dir: str, runs: List[str]) -> None:
+    """Spill sorted runs of records, appends paths of runs to `runs`
+    """
+
+    run = {}  # type: Dict[str, str]
+
+    def _spill() -> None:
+        (fd, path) = tempfile.mkstemp(suffix='.run', dir=tmp_dir)
+        runs.append(path)
+
+        with os.fdopen(fd, 'wb', buffering=BUFFER_SIZE) as f:
+            write_binary(f, sorted(run.items()))
+
+        run.clear()
+
+    for (key, value) in records:
+        run[key] = value
+        if len(run) >= run_size:
+            _spill()
+
+    if run:
+        _spill()
+
+
+def _tagged(f: IO[bytes], run: int) -> Iterator[Tuple[str, int, str]]:
+    for (key, value) in read_binary(f):
+        yield (key, run, value)
+
+
+def encode_record(key: str, value: str) -> bytes:
+    """Encode record as json, which is safe for a line of transport
+    """
+
+    return json.dumps(
+        [key, value], ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def _write_chunks(records: Iterable[Tuple[str, str]],
+                  writer: SnapshotWriter, max_chunk_bytes: int) -> int:
+    """Write sorted records as chunks of encoded size up to CHUNK_BYTES,
+    returns number of records
+
+    a record larger than CHUNK_BYTES is a chunk of its own.
+    """
+
+    chunk_bytes = min(CHUNK_BYTES, max_chunk_bytes)
+
+    # size of encoded chunk, `[record,record]`
+    chunk = []  # type: List[bytes]
+    size = 2
+    count = 0
+
+    for (key, value) in records:
+        record = encode_record(key, value)
+
+        # a record larger than a chunk can't be sent to peers
+        if len(record) + 2 > max_chunk_bytes:
+            raise SnapshotFormatError(
+                f'record of key {key[:100]!r} is {len(record)} bytes'
+                f' encoded, over chunk limit {max_chunk_bytes}')
+
+        if chunk and size + len(record) + 1 > chunk_bytes:
+            writer.write(b'[' + b','.join(chunk) + b']')
+            (chunk, size) = ([], 2)
+
+        chunk.append(record)
+        size += len(record) + 1
+        count += 1
+
+    if chunk:
+        writer.write(b'[' + b','.join(chunk) + b']')
+
+    return count
+
+
+def _dedupe(merged: Iterable[Tuple[str, int, str]]
+            ) -> Iterator[Tuple[str, str]]:
+    """Yields the last record of each key, of records merged in run order
+    """
+
+    pending = None  # type: Optional[Tuple[str, str]]
+
+    for (key, _, value) in merged:
+        if pending is not None and pending[0] != key:
+            yield pending
+
+        pending = (key, value)
+
+    if pending is not None:
+        yield pending
+
+
+def build_snapshot(records: Iterable[Tuple[str, str]], path: str,
+                   run_size: int = RUN_SIZE,
+                   tmp_dir: Optional[str] = None,
+                   max_chunk_bytes: int = MAX_CHUNK_BYTES) -> int:
+    """Build snapshot file of key value records, returns number of keys
+
+    records are sorted by external merge sort. runs of `run_size`
+    records are sorted and spilled to temporary files, then merged into
+    chunks of sorted records, so memory is bounded by a run. the last
+    record of a key wins.
+
+    raises SnapshotFormatError when an encoded record doesn't fit in
+    `max_chunk_bytes`, which should be less than max message size.
+    """
+
+    tmp_dir = tmp_dir or os.path.dirname(os.path.abspath(path))
+
+    runs = []  # type: List[str]
+    files = []  # type: List[IO[bytes]]
+    partial = f'{path}.partial'
+
+    try:
+        _spill_runs(records, run_size, tmp_dir, runs)
+        for run in runs:
+            files.append(open(run, 'rb', buffering=BUFFER_SIZE))
+
+        merged = heapq.merge(*[_tagged(f, i) for (i, f) in enumerate(files)])
+
+        writer = SnapshotWriter(partial)
+        try:
+            count = _write_chunks(_dedupe(merged), writer, max_chunk_bytes)
+        finally:
+            writer.close()
+
+        os.replace(partial, path)
+
+    finally:
+        for f in files:
+            f.close()
+        for run in runs:
+            os.unlink(run)
+        if os.path.exists(partial):
+            os.unlink(partial)
+
+    return count
+
+
+def decode_chunk(raw: Union[bytes, str]) -> List[Tuple[str, str]]:
+    try:
+        return [(key, value) for (key, value) in json.loads(raw)]
+
+    except (ValueError, TypeError):
+        raise SnapshotFormatError('invalid chunk')
+
+
+def _check_magic(f: IO[bytes], path: str) -> None:
+    if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        raise SnapshotFormatError(f'not a snapshot: {path}')
+
+
+def check_snapshot(path: str) -> None:
+    """Raises OSError or SnapshotFormatError when path is not a snapshot
+    """
+
+    with open(path, 'rb') as f:
+        _check_magic(f, path)
+
+
+def read_chunks(path: str) -> Iterator[bytes]:
+    """Yields encoded chunks of snapshot file
+    """
+
+    with open(path, 'rb', buffering=BUFFER_SIZE) as f:
+        _check_magic(f, path)
+
+        while (raw := _read_frame(f)) is not None:
+            yield raw
+
+
+def build_state(chunks: Iterable[Union[bytes, str]],
+                index: int) -> Tuple[Dict[str, Tuple[str, int]], SortedKeys]:
+    """Build store data and key index of encoded sorted chunks
+
+    every key has the version `index`. raises SnapshotFormatError when
+    a chunk is invalid, or keys are not sorted.
+    """
+
+    data = {}  # type: Dict[str, Tuple[str, int]]
+    keys = SortedKeys()
+
+    for raw in chunks:
+        chunk = decode_chunk(raw)
+        try:
+            keys.extend_sorted([key for (key, _) in chunk])
+
+        except ValueError:
+            raise SnapshotFormatError('keys are not sorted')
+
+        data.update((key, (value, index)) for (key, value) in chunk)
+
+    return (data, keys)
@@ -1,38 +1,387 @@
-"""
-import transport.messages as messages
+import heapq
+import math
+import threading
+import time
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
 
+from consensus.index import SortedKeys
+from consensus.session import SessionTable
 
-_STORE = {}
 
+OP_SET = 'set'
+OP_DEL = 'del'
+OP_EXPIRE = 'expire'
 
-# COMMANDS = {
-#     # log commands
-#     'set': (store.set_value, 2),
-#     'get': (store.get_value, 1)
-# }
+ERR_VERSION_MISMATCH = 'VERSION_MISMATCH'
+ERR_ABORTED = 'ABORTED'
 
 
-def get_value(key):
-    value = _STORE.get(key)
+class InvalidOperationError(ValueError):
+    pass
 
-    if not value:
-        return messages.CMD_DATAEMPTY
 
-    return f'{messages.CMD_OK} {value}'
+class DataStore(object):
+    """Key value store, state of applied entries
 
+    every applied entry increases the store index, and the version of
+    a key is the index of the entry which wrote the key last.
 
-def set_value(key, value):
-    global _STORE
+    an entry is a list of set/del operations, applied atomically.
 
-    _STORE[key] = value
+    set operation may have `expires_at` deadline. expired keys are
+    hidden from reads, and removed by `expire` operations proposed by
+    the leader, so every replica removes them at the same index.
 
-    return messages.CMD_OK
+    client sessions are registered as entries too, and the id of a
+    session is the index of its entry.
 
+    entries can be written in key partitions by worker threads, and
+    published in order after. key index and deadlines are shared by
+    partitions, so they are written under `_lock`.
+    """
 
-def del_value(key):
-    global _STORE
+    _index: int
+    _data: Dict[str, Tuple[str, int]]
+    _keys: SortedKeys
 
-    del _STORE[key]
+    _expires: Dict[str, float]
+    _deadlines: List[Tuple[float, str]]
 
-    return messages.CMD_OK
-"""
+    _listeners: List[Callable[[int, List[dict]], None]]
+
+    _sessions: SessionTable
+
+    _lock: threading.Lock
+
+    def __init__(self, max_sessions: int = 10000,
+                 session_ttl: float = 600.0) -> None:
+        self._index = 0
+        self._data = {}
+        self._keys = SortedKeys()
+
+        self._expires = {}
+        self._deadlines = []
+
+        self._listeners = []
+
+        self._sessions = SessionTable(max_sessions, session_ttl)
+
+        self._lock = threading.Lock()
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    @property
+    def sessions(self) -> SessionTable:
+        return self._sessions
+
+    def register_session(self, at: float) -> int:
+        """Register client session as an entry proposed at `at`, returns
+        the session id
+        """
+
+        self._index += 1
+        self._sessions.register(self._index, at)
+
+        return self._index
+
+    def subscribe(self, listener: Callable[[int, List[dict]], None]) -> None:
+        """Register listener, called with index and changes of each entry
+
+        listener is called in the apply path, so it should not block.
+        """
+
+        self._listeners.append(listener)
+
+    def install(self, data: Dict[str, Tuple[str, int]], keys: SortedKeys,
+                index: int) -> None:
+        """Replace state with a snapshot, as an entry at index
+
+        keys are not notified to listeners, watchers should resync.
+        client sessions are dropped, as their cached results are of the
+        replaced state, and clients should register new sessions.
+        """
+
+        self._data = data
+        self._keys = keys
+        self._index = index
+
+        self._expires = {}
+        self._deadlines = []
+
+        self._sessions.clear()
+
+    def get(self, key: str) -> Optional[Tuple[str, int]]:
+        """Returns value and version of key
+        """
+
+        if self._expires and self._is_expired(key, time.time()):
+            return None
+
+        return self._data.get(key)
+
+    def _is_expired(self, key: str, now: float) -> bool:
+        return (deadline := self._expires.get(key)) is not None and (
+            deadline <= now)
+
+    def expired(self, now: float, limit: int) -> List[Tuple[str, int]]:
+        """Returns keys and versions which deadline is passed
+
+        heap entries of overwritten or deleted keys are dropped lazily,
+        and so are duplicated entries of a key.
+        """
+
+        due = []  # type: List[Tuple[float, str]]
+        keys = set()  # type: Set[str]
+
+        while self._deadlines and len(due) < limit:
+            (deadline, key) = self._deadlines[0]
+            if deadline > now:
+                break
+
+            heapq.heappop(self._deadlines)
+            if key not in keys and self._expires.get(key) == deadline:
+                keys.add(key)
+                due.append((deadline, key))
+
+        for item in due:
+            heapq.heappush(self._deadlines, item)
+
+        return [(key, self._data[key][1]) for (_, key) in due]
+
+    def scan(self, start: str, end: Optional[str], limit: int,
+             exclusive_start: bool = False) -> List[Tuple[str, str]]:
+        """Returns key value pairs in key range [start, end)
+        """
+
+        now = time.time()
+
+        items = []  # type: List[Tuple[str, str]]
+        for key in self._keys.irange(start, end, exclusive_start):
+            if len(items) >= limit:
+                break
+            if not self._is_expired(key, now):
+                items.append((key, self._data[key][0]))
+
+        return items
+
+    def scan_prefix(self, prefix: str, limit: int,
+                    start: Optional[str] = None,
+                    exclusive_start: bool = False) -> List[Tuple[str, str]]:
+        """Returns key value pairs which key starts with prefix
+        """
+
+        if start is None or start < prefix:
+            (start, exclusive_start) = (prefix, False)
+
+        keys = self._keys.irange(start, exclusive_start=exclusive_start)
+
+        now = time.time()
+
+        items = []  # type: List[Tuple[str, str]]
+        for key in keys:
+            if len(items) >= limit or not key.startswith(prefix):
+                break
+            if not self._is_expired(key, now):
+                items.append((key, self._data[key][0]))
+
+        return items
+
+    def apply(self, ops: List[dict]) -> Tuple[bool, List[dict]]:
+        """Apply operations atomically as a single entry
+
+        operation is a dict of `op`, `key`, `value` and optional `version`
+        guard. version guard `0` means the key should not exist.
+        when any guard fails, nothing is applied.
+
+        `expire` operation deletes the key only when its version is still
+        the given `version`, and never fails the entry.
+
+        returns whether the entry is applied and results of each operation.
+        """
+
+        for op in ops:
+            validate_op(op)
+
+        results = self._check_guards(ops)
+        if results:
+            return False, results
+
+        self._index += 1
+        index = self._index
+
+        results = [self._write(op, index) for op in ops]
+        self._notify(index, ops, results)
+
+        return True, results
+
+    def write(self, writes: List[Tuple[int, dict]]) -> List[dict]:
+        """Write validated operations at the index of their entries, in
+        order, and returns results of each operation
+
+        used to write a key partition of entries without version guard.
+        partitions of distinct keys can be written concurrently, and the
+        entries are published in order by `publish` after.
+        """
+
+        return [self._write(op, index) for (index, op) in writes]
+
+    def publish(self, index: int, ops: List[dict],
+                results: List[dict]) -> None:
+        """Advance the store index to the written entry at index, and
+        notify its changes to listeners
+        """
+
+        self._index = index
+        self._notify(index, ops, results)
+
+    def _write(self, op: dict, index: int) -> dict:
+        key = op['key']
+
+        if op['op'] == OP_SET:
+            if key not in self._data:
+                with self._lock:
+                    self._keys.add(key)
+
+            self._data[key] = (op['value'], index)
+            self._set_deadline(key, op.get('expires_at'))
+            return {'ok': True, 'version': index}
+
+        if op['op'] == OP_EXPIRE:
+            expired = self._data.get(key, (None, 0))[1] == op['version']
+            if expired:
+                self._delete(key)
+
+            return {'ok': True, 'deleted': expired}
+
+        return {'ok': True, 'deleted': self._delete(key)}
+
+    def _notify(self, index: int, ops: List[dict],
+                results: List[dict]) -> None:
+        if self._listeners:
+            changes = changes_of(ops, results)
+            for listener in self._listeners:
+                listener(index, changes)
+
+    def _delete(self, key: str) -> bool:
+        if self._data.pop(key, None) is None:
+            return False
+
+        with self._lock:
+            self._keys.discard(key)
+        self._expires.pop(key, None)
+
+        return True
+
+    def _set_deadline(self, key: str, deadline: Optional[float]) -> None:
+        if deadline is None:
+            self._expires.pop(key, None)
+            return
+
+        if self._expires.get(key) == deadline:
+            return
+
+        self._expires[key] = deadline
+        with self._lock:
+            heapq.heappush(self._deadlines, (deadline, key))
+
+    def _check_guards(self, ops: List[dict]) -> List[dict]:
+        """Returns failed results if any version guard is not matched
+        """
+
+        results = []
+        failed = False
+
+        for op in ops:
+            expected = op.get('version')
+            if expected is None or op['op'] == OP_EXPIRE:
+                results.append({'ok': False, 'error': ERR_ABORTED})
+                continue
+
+            version = self._data.get(op['key'], (None, 0))[1]
+            if version != expected:
+                failed = True
+                results.append({
+                    'ok': False, 'error': ERR_VERSION_MISMATCH,
+                    'version': version})
+            else:
+                results.append({'ok': False, 'error': ERR_ABORTED})
+
+        return results if failed else []
+
+
+def changes_of(ops: List[dict], results: List[dict]) -> List[dict]:
+    """Returns change events of applied operations
+    """
+
+    changes = []
+
+    for (op, result) in zip(ops, results):
+        if op['op'] == OP_SET:
+            changes.append({
+                'op': OP_SET, 'key': op['key'], 'value': op['value'],
+                'version': result['version']})
+
+        elif result['deleted']:
+            changes.append({'op': op['op'], 'key': op['key']})
+
+    return changes
+
+
+def validate_op(op: dict) -> None:
+    if not isinstance(op, dict):
+        raise InvalidOperationError(op)
+
+    if op.get('op') not in (OP_SET, OP_DEL, OP_EXPIRE):
+        raise InvalidOperationError(op)
+
+    if not isinstance(op.get('key'), str):
+        raise InvalidOperationError(op)
+
+    if op['op'] == OP_SET and not isinstance(op.get('value'), str):
+        raise InvalidOperationError(op)
+
+    version = op.get('version')
+    if version is not None and (
+            not isinstance(version, int) or isinstance(version, bool)):
+        raise InvalidOperationError(op)
+
+    if op['op'] == OP_EXPIRE and version is None:
+        raise InvalidOperationError(op)
+
+    expires_at = op.get('expires_at')
+    if expires_at is not None and (
+            not isinstance(expires_at, (int, float))
+            or isinstance(expires_at, bool) or not math.isfinite(expires_at)):
+        raise InvalidOperationError(op)
+
+
+def resolve_ttl(ops: List[dict], now: float) -> None:
+    """Converts relative `ttl` seconds of client operations to
+    `expires_at`
+
+    deadline is resolved when the entry is proposed, so replicas apply
+    the same deadline. `expire` operations and `expires_at` are proposed
+    by the leader only, so operations of clients having them are
+    rejected.
+    """
+
+    for op in ops:
+        if not isinstance(op, dict):
+            continue
+
+        if op.get('op') == OP_EXPIRE or 'expires_at' in op:
+            raise InvalidOperationError(op)
+
+        if (ttl := op.pop('ttl', None)) is not None:
+            if not isinstance(ttl, (int, float)) or isinstance(
+                    ttl, bool) or not 0 < ttl < math.inf:
+                raise InvalidOperationError(op)
+
+            op['expires_at'] = now + ttl
@@ -0,0 +1,173 @@
+import asyncio
+from collections import deque
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from consensus.store import DataStore
+
+
+# put to watcher queue when the watcher is dropped
+RESYNC = None
+
+
+class HistoryCompactedError(RuntimeError):
+    pass
+
+
+class Watcher(object):
+    key: str
+    prefix: bool
+    queue: asyncio.Queue
+    replay: List[dict]
+    index: int
+
+    def __init__(self, key: str, prefix: bool, buffer_size: int,
+                 replay: List[dict], index: int) -> None:
+        self.key = key
+        self.prefix = prefix
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.replay = replay
+        self.index = index
+
+    def matches(self, key: str) -> bool:
+        return key_matches(key, self.key, self.prefix)
+
+
+class WatchHub(object):
+    """Dispatches applied changes of the store to watchers
+
+    changes of recent entries are retained for replaying. each watcher
+    has a bounded buffer, and a watcher which buffer is full is dropped
+    with `RESYNC` instead of blocking the apply path.
+    """
+
+    _store: DataStore
+    _buffer_size: int
+
+    _history: Deque[Tuple[int, List[dict]]]
+    _history_size: int
+    _compacted: int
+
+    _watchers: Dict[str, Set[Watcher]]
+    _prefix_watchers: Set[Watcher]
+
+    def __init__(self, store: DataStore, buffer_size: int,
+                 history_size: int) -> None:
+        self._store = store
+        self._buffer_size = buffer_size
+
+        self._history = deque()
+        self._history_size = history_size
+        self._compacted = store.index
+
+        self._watchers = {}
+        self._prefix_watchers = set()
+
+        store.subscribe(self.publish)
+
+    @property
+    def index(self) -> int:
+        return self._store.index
+
+    def watch(self, key: str, prefix: bool,
+              from_index: Optional[int] = None) -> Watcher:
+        """Register watcher, replays changes from `from_index` if given
+        """
+
+        replay = []  # type: List[dict]
+
+        if from_index is not None:
+            if from_index <= self._compacted:
+                raise HistoryCompactedError()
+
+            for (index, changes) in self._history:
+                if index < from_index:
+                    continue
+
+                replay.extend(
+                    dict(change, index=index) for change in changes
+                    if key_matches(change['key'], key, prefix))
+
+        watcher = Watcher(
+            key, prefix, self._buffer_size, replay, self._store.index)
+
+        if prefix:
+            self._prefix_watchers.add(watcher)
+        else:
+            self._watchers.setdefault(key, set()).add(watcher)
+
+        return watcher
+
+    def unwatch(self, watcher: Watcher) -> None:
+        if watcher.prefix:
+            self._prefix_watchers.discard(watcher)
+            return
+
+        if watchers := self._watchers.get(watcher.key):
+            watchers.discard(watcher)
+            if not watchers:
+                del self._watchers[watcher.key]
+
+    def publish(self, index: int, changes: List[dict]) -> None:
+        if not changes:
+            return
+
+        if self._history_size:
+            if len(self._history) >= self._history_size:
+                (self._compacted, _) = self._history.popleft()
+            self._history.append((index, changes))
+        else:
+            self._compacted = index
+
+        if not (self._watchers or self._prefix_watchers):
+            return
+
+        for change in changes:
+            key = change['key']
+
+            watchers = [w for w in self._prefix_watchers if w.matches(key)]
+            watchers.extend(self._watchers.get(key, ()))
+
+            for watcher in watchers:
+                self._notify(watcher, dict(change, index=index))
+
+    def reset(self) -> None:
+        """Drop history and every watcher, when the store is replaced
+        """
+
+        self._history.clear()
+        self._compacted = self._store.index
+
+        watchers = list(self._prefix_watchers)
+        for key_watchers in self._watchers.values():
+            watchers.extend(key_watchers)
+
+        for watcher in watchers:
+            self._drop(watcher)
+
+    def _notify(self, watcher: Watcher, event: dict) -> None:
+        try:
+            watcher.queue.put_nowait(event)
+
+        except asyncio.QueueFull:
+            # drop slow watcher, and let the client resync
+            self._drop(watcher)
+
+    def _drop(self, watcher: Watcher) -> None:
+        self.unwatch(watcher)
+
+        while not watcher.queue.empty():
+            watcher.queue.get_nowait()
+
+        watcher.queue.put_nowait(RESYNC)
+
+
+def key_matches(key: str, watch_key: str, prefix: bool) -> bool:
+    if prefix:
+        return key.startswith(watch_key)
+
+    return key == watch_key
@@ -4,21 +4,43 @@ import signal
 import sys
 import traceback
 from typing import Awaitable
+from typing import Callable
 from typing import Optional
 from types import FrameType
 
 import core.logger as logger
+from core.profiling import LoopMonitor
+from core.profiling import Profiler
+from consensus.raft.state_machine import LeadershipTransferError
 from consensus.raft.state_machine import RaftStateMachine
+from consensus.raft.state_machine import STATE_LEADER
 from consensus.raft.actor import RaftActor
 from consensus.raft.tcp_server import RaftTCPServer
 from consensus.raft.reporter import RaftStateReporter
+from consensus.raft.timing import RaftTiming
+from consensus.expirer import KeyExpirer
+from consensus.importer import SnapshotInstaller
+from consensus.pipeline import ApplyPipeline
+from consensus.store import DataStore
+from consensus.watch import WatchHub
+from transport.address import bind_address
+from transport.admission import AdmissionLimits
+
+
+class Terminated(KeyboardInterrupt):
+    pass
 
 
 def raise_sigint(signum: int, frame: Optional[FrameType]) -> None:
     raise KeyboardInterrupt()
 
 
-async def wrap_awaitable(awaitable: Awaitable) -> None:
+def raise_sigterm(signum: int, frame: Optional[FrameType]) -> None:
+    raise Terminated()
+
+
+async def wrap_awaitable(awaitable: Awaitable,
+                         on_crash: Optional[Callable] = None) -> None:
     """Wraps async generator for failfast.
     """
 
@@ -29,6 +51,9 @@ async def wrap_awaitable(awaitable: Awaitable) -> None:
         logger.critical('critical error occurred')
         traceback.print_exception(e)
 
+        if on_crash:
+            on_crash()
+
         sys.exit(255)
 
 
@@ -50,42 +75,94 @@ class Raft(object):
     _event: asyncio.Event
 
     _context: RaftStateMachine
+    _timing: RaftTiming
+    _store: DataStore
+    _watch_hub: WatchHub
     _tcp_server: RaftTCPServer
     _actor: RaftActor
 
     _reporter: RaftStateReporter
+    _monitor: LoopMonitor
+    _profiler: Profiler
+    _expirer: KeyExpirer
+    _pipeline: ApplyPipeline
+    _installer: SnapshotInstaller
+
+    _data_dir: str
 
     def __init__(
             self, name: str, addr: str, port: int,
             log_level: str, log_color: bool,
             data_dir: str, peers: str, leader_timeout: float,
-            election_timeout_jitter: float, vote_interval: float,
-            heartbeat_interval: float, report_interval: float) -> None:
-
-        peer_list = peers.split(',')
-        peer_ip_port_pairs = [
-            peer_ip_port.split(':', 1)[1] for peer_ip_port in peer_list
-            if peer_ip_port.split(':')[0] != name
-        ]
+            election_timeout_jitter: float, heartbeat_interval: float,
+            min_leader_timeout: float, min_heartbeat_interval: float,
+            adaptive_timing: bool,
+            report_interval: float,
+            admission_limits: AdmissionLimits, journal_size: int,
+            expire_interval: float, expire_batch_size: int,
+            watch_buffer_size: int, watch_history_size: int,
+            max_sessions: int, session_ttl: float, apply_batch_size: int,
+            apply_partitions: int,
+            stall_threshold: float) -> None:
+
+        # member is `name:ip:port` or `name:unix:/path`
+        members = [member.split(':', 1) for member in peers.split(',')]
+        peer_addresses = {
+            member_name: address for (member_name, address) in members
+            if member_name != name
+        }
 
         # prepare service
         prepare_service(name, log_level, log_color, data_dir)
 
+        self._data_dir = data_dir
         self._loop = asyncio.new_event_loop()
         self._event = asyncio.Event()  # type: asyncio.Event
 
         # weave components
-        self._context = RaftStateMachine(name=name, peers=peer_ip_port_pairs)
-        self._tcp_server = RaftTCPServer(
-            context=self._context, event=self._event, addr=addr, port=port)
-        self._actor = RaftActor(
-            context=self._context, event=self._event,
+        self._context = RaftStateMachine(
+            name=name, peers=list(peer_addresses.values()),
+            journal_size=journal_size, addresses=peer_addresses,
+            bind=bind_address(addr))
+        self._timing = RaftTiming(
             leader_timeout=leader_timeout,
             election_timeout_jitter=election_timeout_jitter,
-            vote_interval=vote_interval, heartbeat_interval=heartbeat_interval
-        )
+            heartbeat_interval=heartbeat_interval,
+            min_leader_timeout=min_leader_timeout,
+            min_heartbeat_interval=min_heartbeat_interval,
+            adaptive=adaptive_timing,
+            quorum_peers=self._context.quorum - 1)
+        self._store = DataStore(
+            max_sessions=max_sessions, session_ttl=session_ttl)
+        self._pipeline = ApplyPipeline(
+            store=self._store, batch_size=apply_batch_size,
+            partitions=apply_partitions)
+        self._watch_hub = WatchHub(
+            store=self._store, buffer_size=watch_buffer_size,
+            history_size=watch_history_size)
+        self._actor = RaftActor(
+            context=self._context, event=self._event, timing=self._timing)
+        self._monitor = LoopMonitor(
+            loop=self._loop, threshold=stall_threshold)
+        self._profiler = Profiler(data_dir=data_dir)
+        self._installer = SnapshotInstaller(
+            context=self._context, store=self._store,
+            pipeline=self._pipeline, watch_hub=self._watch_hub,
+            data_dir=data_dir)
+        self._tcp_server = RaftTCPServer(
+            context=self._context, event=self._event, timing=self._timing,
+            store=self._store, pipeline=self._pipeline,
+            watch_hub=self._watch_hub, addr=addr, port=port,
+            admission_limits=admission_limits,
+            transfer_leadership=self._actor.transfer_leadership,
+            profiler=self._profiler, monitor=self._monitor,
+            installer=self._installer)
         self._reporter = RaftStateReporter(
             context=self._context, report_interval=report_interval)
+        self._expirer = KeyExpirer(
+            context=self._context, store=self._store, pipeline=self._pipeline,
+            expire_interval=expire_interval,
+            expire_batch_size=expire_batch_size)
 
         logger.set_context(self._context)
 
@@ -93,22 +170,56 @@ class Raft(object):
         awaitables = [
             self._actor.create_worker(),
             self._tcp_server.create_server(),
-            self._reporter.create_reporter()
+            self._reporter.create_reporter(),
+            self._expirer.create_expirer(),
+            self._pipeline.create_applier(),
+            self._monitor.create_monitor()
         ]
 
         for awaitable in awaitables:
             self._loop.create_task(
-                wrap_awaitable(awaitable),
+                wrap_awaitable(awaitable, on_crash=self.dump_journal),
                 name=awaitable.__name__)
 
+    async def hand_over_leadership(self) -> None:
+        """Transfer leadership before shutdown, when this node is leader
+        """
+
+        if self._context._state != STATE_LEADER:
+            return
+
+        logger.info('transfer leadership before shutdown')
+
+        try:
+            peer = await asyncio.wait_for(
+                self._actor.transfer_leadership(),
+                self._timing.leader_timeout * 2)
+            logger.info(f'leadership is handed over to {peer}')
+
+        except (LeadershipTransferError, asyncio.TimeoutError) as e:
+            logger.warn(f'leadership transfer failed [{e!r}]')
+
+    def dump_journal(self) -> None:
+        """Dumps state transition journal to data directory
+        """
+
+        path = os.path.join(self._data_dir, 'journal.json')
+        logger.critical(f'dump state transition journal to {path}')
+
+        with open(path, 'w') as f:
+            f.write(self._context.journal.dumps())
+
     def run(self) -> None:
         signal.signal(signal.SIGINT, raise_sigint)
-        signal.signal(signal.SIGTERM, raise_sigint)
+        signal.signal(signal.SIGTERM, raise_sigterm)
 
         try:
             logger.trace(f'run event loop [{self._loop=}]')
             self._loop.run_forever()
 
+        except Terminated:
+            self._loop.run_until_complete(self.hand_over_leadership())
+
         except KeyboardInterrupt:
             pass
 
@@ -1,10 +1,20 @@
 import argparse
 import configparser
 from dataclasses import dataclass
+from dataclasses import fields
 from typing import Any
 from typing import Mapping
 
 
+# zero of these values is invalid, zero of other limits disables them
+POSITIVE_FIELDS = (
+    'leader_timeout', 'heartbeat_interval', 'report_interval',
+    'max_message_size', 'expire_interval', 'expire_batch_size',
+    'apply_batch_size', 'apply_partitions', 'watch_buffer_size',
+    'journal_size', 'stall_threshold', 'max_sessions', 'session_ttl',
+)
+
+
 @dataclass
 class RaftConfig(object):
     name: str = 'raft-1'
@@ -21,12 +31,36 @@ class RaftConfig(object):
     )
     leader_timeout: float = 3.0
     election_timeout_jitter: float = .3
-    vote_interval: float = 3.0
     heartbeat_interval: float = 2.0
+    min_leader_timeout: float = .15
+    min_heartbeat_interval: float = .05
     report_interval: float = 60.0
 
+    max_connections: int = 256
+    max_inflight: int = 1024
+    max_message_size: int = 64 * 1024
+    rate_limit: float = 0.0
+    rate_burst: int = 100
+
+    journal_size: int = 1024
+
+    expire_interval: float = 1.0
+    expire_batch_size: int = 1000
+
+    watch_buffer_size: int = 1024
+    watch_history_size: int = 10000
+
+    max_sessions: int = 10000
+    session_ttl: float = 600.0
+
+    apply_batch_size: int = 64
+    apply_partitions: int = 1
+
+    stall_threshold: float = .1
+
     no_color: bool = False
     no_uvloop: bool = False
+    no_adaptive_timing: bool = False
 
     def __init__(self) -> None:
         # config precedence is `cli > envvar > file > defaults`
@@ -35,15 +69,32 @@ class RaftConfig(object):
 
         config_path = cli_config.get('config')  # type: Any
         file_config = configparser.ConfigParser()
-        file_config.read(config_path)
+        if config_path:
+            file_config.read(config_path)
 
         self.override(file_config.defaults())
         self.override(cli_config)
 
+        self.validate()
+
     def override(self, args_dict: Mapping) -> None:
-        for key in self.__dataclass_fields__.keys():
-            if value := args_dict.get(key):
-                setattr(self, key, value)
+        """Override fields with given values, converted to field types
+
+        values of config file are strings, and None means not given.
+        """
+
+        for field in fields(self):
+            if (value := args_dict.get(field.name)) is not None:
+                setattr(self, field.name, convert(value, field.type))
+
+    def validate(self) -> None:
+        for field in fields(self):
+            value = getattr(self, field.name)
+            if field.type not in (int, float):
+                continue
+
+            if value < 0 or (value == 0 and field.name in POSITIVE_FIELDS):
+                raise ValueError(f'invalid {field.name}: {value}')
 
     def config_from_args(self) -> dict:
         parser = argparse.ArgumentParser(prog='Raft')
@@ -57,7 +108,8 @@ class RaftConfig(object):
 
         parser.add_argument(
             '-a', '--addr',
-            help=f'listen address (default = {RaftConfig.addr})')
+            help=('listen address, or \'unix:/path\' for unix socket'
+                  f' (default = {RaftConfig.addr})'))
         parser.add_argument(
             '-p', '--port',
             help=f'listen port (default = {RaftConfig.port})')
@@ -69,33 +121,121 @@ class RaftConfig(object):
             '-d', '--datadir',
             help=f'data directory (default = {RaftConfig.datadir})')
         parser.add_argument(
-            '-t', '--leader-timeout',
+            '-t', '--leader-timeout', type=float,
             help=('leader heartbeat timeout'
                   f' (default = {RaftConfig.leader_timeout})'))
         parser.add_argument(
-            '-e', '--election-timeout-jitter',
+            '-e', '--election-timeout-jitter', type=float,
             help=('election timeout jitter'
                   f' (default = {RaftConfig.election_timeout_jitter})'))
         parser.add_argument(
-            '-i', '--vote-interval',
-            help=('default vote interval'
-                  f' (default = {RaftConfig.vote_interval})'))
-        parser.add_argument(
-            '-b', '--heartbeat-interval',
+            '-b', '--heartbeat-interval', type=float,
             help=('heartbeat interval'
                   f' (default = {RaftConfig.heartbeat_interval})'))
         parser.add_argument(
-            '-r', '--report-interval',
+            '--min-leader-timeout', type=float,
+            help=('floor of adaptive leader heartbeat timeout'
+                  f' (default = {RaftConfig.min_leader_timeout})'))
+        parser.add_argument(
+            '--min-heartbeat-interval', type=float,
+            help=('floor of adaptive heartbeat interval'
+                  f' (default = {RaftConfig.min_heartbeat_interval})'))
+        parser.add_argument(
+            '-r', '--report-interval', type=float,
             help=('state report interval'
                   f' (default = {RaftConfig.report_interval})'))
         parser.add_argument(
             '-m', '--members',
-            help=('raft members (comma separated \'name:addr:port\' values.)'
+            help=('raft members (comma separated \'name:addr:port\''
+                  ' or \'name:unix:/path\' values.)'
                   f' (default = {RaftConfig.members})'))
         parser.add_argument(
-            '--no-color', action='store_true', help='no colored log')
+            '--max-connections', type=int,
+            help=('max client connections, 0 is unlimited'
+                  f' (default = {RaftConfig.max_connections})'))
+        parser.add_argument(
+            '--max-inflight', type=int,
+            help=('max in-flight client requests, 0 is unlimited'
+                  f' (default = {RaftConfig.max_inflight})'))
+        parser.add_argument(
+            '--max-message-size', type=int,
+            help=('max request message size in bytes'
+                  f' (default = {RaftConfig.max_message_size})'))
         parser.add_argument(
-            '--no-uvloop', action='store_true', help='don\'t use uvloop')
+            '--rate-limit', type=float,
+            help=('requests per second per client, 0 is unlimited'
+                  f' (default = {RaftConfig.rate_limit})'))
+        parser.add_argument(
+            '--rate-burst', type=int,
+            help=('request burst size per client'
+                  f' (default = {RaftConfig.rate_burst})'))
+        parser.add_argument(
+            '--journal-size', type=int,
+            help=('state transition journal size'
+                  f' (default = {RaftConfig.journal_size})'))
+        parser.add_argument(
+            '--expire-interval', type=float,
+            help=('key expiry check interval'
+                  f' (default = {RaftConfig.expire_interval})'))
+        parser.add_argument(
+            '--expire-batch-size', type=int,
+            help=('max keys expired in a single entry'
+                  f' (default = {RaftConfig.expire_batch_size})'))
+        parser.add_argument(
+            '--watch-buffer-size', type=int,
+            help=('max buffered events per watcher'
+                  f' (default = {RaftConfig.watch_buffer_size})'))
+        parser.add_argument(
+            '--watch-history-size', type=int,
+            help=('number of entries retained for watch replay'
+                  f' (default = {RaftConfig.watch_history_size})'))
+        parser.add_argument(
+            '--max-sessions', type=int,
+            help=('max client sessions, least recently active ones expire.'
+                  ' should be positive'
+                  f' (default = {RaftConfig.max_sessions})'))
+        parser.add_argument(
+            '--session-ttl', type=float,
+            help=('client session expires after idle seconds, should be'
+                  f' positive (default = {RaftConfig.session_ttl})'))
+        parser.add_argument(
+            '--apply-batch-size', type=int,
+            help=('max entries applied before yielding to other traffic'
+                  f' (default = {RaftConfig.apply_batch_size})'))
+        parser.add_argument(
+            '--apply-partitions', type=int,
+            help=('worker threads applying entries partitioned by key,'
+                  ' 1 applies in the event loop, should be positive'
+                  f' (default = {RaftConfig.apply_partitions})'))
+        parser.add_argument(
+            '--stall-threshold', type=float,
+            help=('record event loop stalls longer than threshold seconds'
+                  f' (default = {RaftConfig.stall_threshold})'))
+        # flags default to None, so they don't override the config file
+        parser.add_argument(
+            '--no-color', action='store_true', default=None,
+            help='no colored log')
+        parser.add_argument(
+            '--no-uvloop', action='store_true', default=None,
+            help='don\'t use uvloop')
+        parser.add_argument(
+            '--no-adaptive-timing', action='store_true', default=None,
+            help=('don\'t derive timing from measured peer RTT,'
+                  ' use static timing values'))
 
         args = parser.parse_args()
         return dict(args._get_kwargs())
+
+
+def convert(value: Any, field_type: Any) -> Any:
+    """Converts config value to field type, e.g. `'10'` to `10`
+    """
+
+    if field_type is bool and isinstance(value, str):
+        try:
+            return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+
+        except KeyError:
+            raise ValueError(f'not a boolean: {value}')
+
+    return field_type(value)
@@ -0,0 +1,257 @@
+import asyncio
+import cProfile
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from collections import deque
+from types import FrameType
+from typing import Any
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import core.logger as logger
+
+
+PROFILE_CPU = 'cpu'
+PROFILE_SAMPLE = 'sample'
+
+TRACEMALLOC_START = 'start'
+TRACEMALLOC_STOP = 'stop'
+TRACEMALLOC_SNAPSHOT = 'snapshot'
+
+SAMPLE_INTERVAL = .005
+STACK_LIMIT = 8
+TRACEMALLOC_TOP = 10
+
+
+class ProfilerBusyError(RuntimeError):
+    pass
+
+
+def format_stack(frame: Optional[FrameType], limit: int) -> List[str]:
+    """Returns frames from the innermost, as `file:line function`
+    """
+
+    stack = []  # type: List[str]
+    while frame is not None and len(stack) < limit:
+        code = frame.f_code
+        stack.append(
+            f'{os.path.basename(code.co_filename)}:{frame.f_lineno}'
+            f' {code.co_name}')
+        frame = frame.f_back
+
+    return stack
+
+
+class LoopMonitor(object):
+    """Event loop lag monitor
+
+    monitor coroutine beats every interval, and a watchdog thread
+    captures the running task and its stack when the beat is late more
+    than threshold. stalls are recorded when the loop is back.
+    """
+
+    _loop: asyncio.AbstractEventLoop
+    _threshold: float
+    _interval: float
+
+    _stalls: Deque[dict]
+    _pending: Optional[dict]
+    _beat_at: float
+    _thread_id: int
+
+    def __init__(self, loop: asyncio.AbstractEventLoop,
+                 threshold: float, history_size: int = 100) -> None:
+        self._loop = loop
+        self._threshold = threshold
+        self._interval = threshold / 2
+
+        self._stalls = deque(maxlen=history_size)
+        self._pending = None
+        self._beat_at = time.monotonic()
+        self._thread_id = 0
+
+    @property
+    def stalls(self) -> List[dict]:
+        return list(self._stalls)
+
+    def _watch(self, stopped: threading.Event) -> None:
+        while not stopped.wait(self._interval):
+            late = time.monotonic() - self._beat_at - self._interval
+            if late < self._threshold or self._pending is not None:
+                continue
+
+            task = asyncio.current_task(self._loop)
+            frame = sys._current_frames().get(self._thread_id)
+
+            self._pending = {
+                'task': task.get_name() if task else None,
+                'stack': format_stack(frame, STACK_LIMIT),
+            }
+
+    def create_monitor(self) -> Any:
+        async def run_monitor() -> None:
+            logger.info(f'start loop monitor [{self._threshold=}]')
+
+            self._thread_id = threading.get_ident()
+            stopped = threading.Event()
+            watchdog = threading.Thread(
+                target=self._watch, args=(stopped,),
+                name='loop_watchdog', daemon=True)
+            watchdog.start()
+
+            while True:
+                try:
+                    self._beat_at = time.monotonic()
+                    await asyncio.sleep(self._interval)
+
+                    lag = time.monotonic() - self._beat_at - self._interval
+                    if lag >= self._threshold:
+                        self._record(lag)
+
+                except asyncio.exceptions.CancelledError:
+                    logger.trace('stop monitor')
+                    break
+
+            stopped.set()
+            logger.info('monitor stopped')
+
+        return run_monitor()
+
+    def _record(self, lag: float) -> None:
+        stall = self._pending or {'task': None, 'stack': []}
+        self._pending = None
+
+        stall.update(at=time.time(), duration=lag)
+        self._stalls.append(stall)
+
+        logger.warn(
+            f'event loop stalled [{lag=:.3f}s] [task={stall["task"]}]')
+
+
+class Profiler(object):
+    """On demand profilers, results are dumped to data directory
+    """
+
+    _data_dir: str
+    _busy: bool
+
+    def __init__(self, data_dir: str) -> None:
+        self._data_dir = data_dir
+        self._busy = False
+
+    def _path(self, kind: str, ext: str) -> str:
+        filename = f'{kind}-{time.strftime("%Y%m%d-%H%M%S")}.{ext}'
+        return os.path.join(self._data_dir, filename)
+
+    async def profile(self, mode: str, seconds: float) -> str:
+        """Profile event loop thread for seconds, returns dumped path
+        """
+
+        if mode not in (PROFILE_CPU, PROFILE_SAMPLE):
+            raise ValueError(mode)
+
+        if self._busy:
+            raise ProfilerBusyError()
+
+        self._busy = True
+        try:
+            if mode == PROFILE_CPU:
+                return await self._profile_cpu(seconds)
+
+            return await self._profile_sample(seconds)
+
+        finally:
+            self._busy = False
+
+    async def _profile_cpu(self, seconds: float) -> str:
+        path = self._path('profile', 'pstats')
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+
+        profile.dump_stats(path)
+
+        return path
+
+    async def _profile_sample(self, seconds: float) -> str:
+        """Sample stacks of event loop thread from another thread
+
+        dumps folded stacks, can be rendered as a flame graph.
+        """
+
+        path = self._path('profile', 'folded')
+        thread_id = threading.get_ident()
+        stacks = Counter()  # type: Counter
+        stopped = threading.Event()
+
+        def _sample() -> None:
+            while not stopped.wait(SAMPLE_INTERVAL):
+                frame = sys._current_frames().get(thread_id)
+                stack = format_stack(frame, sys.getrecursionlimit())
+                stacks[';'.join(reversed(stack))] += 1
+
+        sampler = threading.Thread(
+            target=_sample, name='profile_sampler', daemon=True)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stopped.set()
+            await asyncio.get_running_loop().run_in_executor(
+                None, sampler.join)
+
+        with open(path, 'w') as f:
+            for (stack, count) in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+        return path
+
+    def tracemalloc(self, action: str) -> dict:
+        if action == TRACEMALLOC_START:
+            tracemalloc.start()
+            return {'tracing': True}
+
+        if action == TRACEMALLOC_STOP:
+            tracemalloc.stop()
+            return {'tracing': False}
+
+        if action == TRACEMALLOC_SNAPSHOT:
+            if not tracemalloc.is_tracing():
+                return {'tracing': False}
+
+            path = self._path('tracemalloc', 'snapshot')
+            snapshot = tracemalloc.take_snapshot()
+            snapshot.dump(path)
+
+            top = snapshot.statistics('lineno')[:TRACEMALLOC_TOP]
+            return {
+                'tracing': True,
+                'path': path,
+                'top': [str(stat) for stat in top],
+            }
+
+        raise ValueError(action)
+
+    def tasks(self) -> Dict[str, Any]:
+        """Returns count of tasks, by task name and coroutine name
+        """
+
+        tasks = asyncio.all_tasks()
+
+        return {
+            'total': len(tasks),
+            'tasks': Counter(task.get_name() for task in tasks),
+            'coroutines': Counter(
+                getattr(task.get_coro(), '__qualname__', '-')
+                for task in tasks),
+        }
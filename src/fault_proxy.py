@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""Fault injecting proxy between raft members
+
+run members with `--members` printed for each of them, and script
+faults at runtime through the control port, e.g.
+
+    set raft-1 * latency=0.005 jitter=0.001 drop=0.01
+    partition raft-1 raft-2 oneway
+    heal
+"""
+
+import argparse
+import asyncio
+import os
+
+import core.logger as logger
+from core.config import RaftConfig
+from transport.address import UNIX
+from transport.address import unix_path
+from transport.proxy import FaultProxy
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='FaultProxy')
+
+    parser.add_argument(
+        '-m', '--members', default=RaftConfig.members,
+        help='members to be proxied, `name:ip:port,...`')
+    parser.add_argument(
+        '-a', '--addr', default='127.0.0.1',
+        help=('listen address of links and control port, or'
+              ' \'unix:/dir\' to listen unix sockets in the directory'))
+    parser.add_argument(
+        '-b', '--base-port', type=int, default=3468,
+        help='first listen port of links, a port per ordered member pair')
+    parser.add_argument(
+        '-p', '--control-port', type=int, default=3467,
+        help='listen port of control commands')
+    parser.add_argument(
+        '-l', '--loglevel', default='info', help='log level')
+    parser.add_argument(
+        '--no-color', action='store_true', help='disable log color')
+
+    return parser.parse_args()
+
+
+async def main(args: argparse.Namespace) -> None:
+    proxy = FaultProxy(args.members, args.addr, args.base_port)
+
+    for member in args.members.split(','):
+        name = member.split(':')[0]
+        print(f'{name} --members {proxy.members_of(name)}', flush=True)
+
+    # control socket is next to link sockets in unix socket mode
+    control_addr = args.addr
+    if (path := unix_path(args.addr)) is not None:
+        control_addr = f'{UNIX}:{os.path.join(path, "control.sock")}'
+
+    await asyncio.gather(
+        proxy.run(),
+        proxy.create_control_server(control_addr, args.control_port))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    logger.set_logger('proxy', args.loglevel.upper(), color=not args.no_color)
+
+    try:
+        asyncio.run(main(args))
+
+    except KeyboardInterrupt:
+        pass
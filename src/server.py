@@ -4,6 +4,7 @@ import uvloop
 
 from core.application import Raft
 from core.config import RaftConfig
+from transport.admission import AdmissionLimits
 
 
 if __name__ == '__main__':
@@ -25,10 +26,34 @@ if __name__ == '__main__':
         peers=config.members,
         leader_timeout=config.leader_timeout,
         election_timeout_jitter=config.election_timeout_jitter,
-        vote_interval=config.vote_interval,
         heartbeat_interval=config.heartbeat_interval,
+        min_leader_timeout=config.min_leader_timeout,
+        min_heartbeat_interval=config.min_heartbeat_interval,
+        adaptive_timing=not config.no_adaptive_timing,
 
         report_interval=config.report_interval,
+
+        admission_limits=AdmissionLimits(
+            max_connections=config.max_connections,
+            max_inflight=config.max_inflight,
+            max_message_size=config.max_message_size,
+            rate_limit=config.rate_limit,
+            rate_burst=config.rate_burst,
+        ),
+        journal_size=config.journal_size,
+
+        expire_interval=config.expire_interval,
+        expire_batch_size=config.expire_batch_size,
+
+        watch_buffer_size=config.watch_buffer_size,
+        watch_history_size=config.watch_history_size,
+
+        max_sessions=config.max_sessions,
+        session_ttl=config.session_ttl,
+        apply_batch_size=config.apply_batch_size,
+        apply_partitions=config.apply_partitions,
+
+        stall_threshold=config.stall_threshold,
     )
 
     app.run()
@@ -0,0 +1,63 @@
+import asyncio
+from asyncio.streams import StreamReader
+from asyncio.streams import StreamWriter
+from pathlib import Path
+from typing import List
+
+from transport.address import BIND_SUFFIX
+from transport.address import bind_address
+from transport.address import client_key
+from transport.address import member_key
+from transport.address import open_connection
+from transport.address import parse_address
+from transport.address import peer_address
+from transport.address import start_server
+
+
+def test_parse_address() -> None:
+    assert parse_address('127.0.0.1:2468') == ('127.0.0.1', 2468)
+    assert parse_address('unix:/tmp/raft.sock') == ('unix', '/tmp/raft.sock')
+
+
+def test_unix_clients_are_keyed_by_bound_path(tmp_path: Path) -> None:
+    addr = f'unix:{tmp_path / "raft.sock"}'
+    member = f'unix:{tmp_path / "member.sock"}'
+
+    async def _run() -> List[str]:
+        clients = []  # type: List[str]
+
+        async def _handle(reader: StreamReader, writer: StreamWriter) -> None:
+            clients.append(client_key(*peer_address(writer)))
+            await reader.read()
+            writer.close()
+
+        server = await start_server(_handle, addr, 0)
+        async with server:
+            # connections open at the same time, bound to the same path
+            connections = [
+                await open_connection(*parse_address(addr), bind=bind)
+                for bind in (None, None, bind_address(member),
+                             bind_address(member))
+            ]
+            for (reader, writer) in connections:
+                writer.close()
+            while len(clients) < 4:
+                await asyncio.sleep(.01)
+
+        return clients
+
+    clients = asyncio.run(_run())
+
+    assert sorted(clients) == sorted(
+        ['unix:', 'unix:', member_key(member), member_key(member)])
+    assert member_key(member) != 'unix:'
+    assert not (tmp_path / f'member.sock{BIND_SUFFIX}').exists()
+
+
+def test_tcp_member_is_keyed_by_ip() -> None:
+    assert member_key('10.0.0.2:2468') == client_key('10.0.0.2', 50000)
+    assert bind_address('10.0.0.2:2468') is None
+
+
+def test_tcp_clients_are_keyed_by_ip() -> None:
+    assert client_key('10.0.0.9', 50000) == client_key('10.0.0.9', 50001)
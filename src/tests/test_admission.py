@@ -0,0 +1,106 @@
+import time
+from typing import Any
+
+from transport.address import client_key
+from transport.address import member_key
+from transport.admission import AdmissionControl
+from transport.admission import AdmissionLimits
+
+
+PEER = '10.0.0.2'
+CLIENT = '10.0.0.9'
+
+
+def create_admission(**limits: Any) -> AdmissionControl:
+    return AdmissionControl(
+        AdmissionLimits(**limits), priority=('heartbeat', 'vote'),
+        peers=[PEER])
+
+
+def test_connection_limit() -> None:
+    admission = create_admission(max_connections=2)
+
+    assert admission.connect(CLIENT)
+    assert admission.connect(CLIENT)
+    assert not admission.connect(CLIENT)
+
+    admission.disconnect(CLIENT)
+    admission.disconnect(CLIENT)
+    assert admission.connect(CLIENT)
+
+
+def test_zero_limits_are_unlimited() -> None:
+    admission = create_admission(
+        max_connections=0, max_inflight=0, rate_limit=0)
+
+    for _ in range(1000):
+        assert admission.connect(CLIENT)
+        assert admission.acquire(CLIENT, priority=False)
+
+
+def test_inflight_limit() -> None:
+    admission = create_admission(max_inflight=1)
+
+    assert admission.acquire(CLIENT, priority=False)
+    assert not admission.acquire(CLIENT, priority=False)
+    assert admission.acquire(PEER, priority=True)
+
+    admission.release()
+    admission.release()
+    assert admission.acquire(CLIENT, priority=False)
+
+
+def test_rate_limit_per_client() -> None:
+    admission = create_admission(rate_limit=1, rate_burst=2)
+
+    assert admission.acquire(CLIENT, priority=False)
+    assert admission.acquire(CLIENT, priority=False)
+    assert not admission.acquire(CLIENT, priority=False)
+
+    # other clients have their own bucket
+    assert admission.acquire('10.0.0.10', priority=False)
+
+
+def test_bucket_outlives_connection() -> None:
+    admission = create_admission(rate_limit=1, rate_burst=1)
+
+    # a connection per request does not reset the bucket
+    for accepted in (True, False, False):
+        admission.connect(CLIENT)
+        assert admission.acquire(CLIENT, priority=False) is accepted
+        admission.disconnect(CLIENT)
+
+    assert CLIENT in admission._buckets
+
+
+def test_refilled_bucket_is_dropped() -> None:
+    admission = create_admission(rate_limit=1, rate_burst=1)
+
+    admission.connect(CLIENT)
+    admission.acquire(CLIENT, priority=False)
+    # emptied a second ago, refilled now
+    admission._buckets[CLIENT] = (0.0, time.monotonic() - 1.0)
+    admission.disconnect(CLIENT)
+
+    assert CLIENT not in admission._buckets
+    assert not admission._idle
+
+
+def test_priority_only_for_peers() -> None:
+    admission = create_admission()
+
+    assert admission.is_priority(PEER, 'heartbeat 1 0.1 raft-1\n')
+    assert admission.is_priority(PEER, 'vote 2 raft-2\n')
+    assert not admission.is_priority(PEER, 'set a 1\n')
+
+    assert not admission.is_priority(CLIENT, 'heartbeat 1 0.1 raft-1\n')
+
+
+def test_priority_only_for_unix_peers() -> None:
+    admission = AdmissionControl(
+        AdmissionLimits(), priority=('heartbeat',),
+        peers=[member_key('unix:/tmp/raft-2.sock')])
+
+    assert admission.is_priority(
+        client_key('unix', '/tmp/raft-2.sock.peer'), 'heartbeat\n')
+    assert not admission.is_priority(client_key('unix', ''), 'heartbeat\n')
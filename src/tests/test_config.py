@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from core.config import RaftConfig
+
+
+def load_config(monkeypatch: pytest.MonkeyPatch, *args: str) -> RaftConfig:
+    monkeypatch.setattr(sys, 'argv', ['server.py', *args])
+
+    return RaftConfig()
+
+
+def test_zero_overrides_default(monkeypatch: pytest.MonkeyPatch) -> None:
+    config = load_config(
+        monkeypatch, '--max-connections', '0', '--max-inflight', '0',
+        '--rate-burst', '0')
+
+    assert config.max_connections == 0
+    assert config.max_inflight == 0
+    assert config.rate_burst == 0
+
+
+def test_file_values_are_converted(monkeypatch: pytest.MonkeyPatch,
+                                   tmp_path: Path) -> None:
+    path = tmp_path / 'raft.ini'
+    path.write_text(
+        '[DEFAULT]\n'
+        'max_connections = 10\n'
+        'rate_limit = 2.5\n'
+        'port = 2500\n'
+        'no_color = true\n')
+
+    config = load_config(monkeypatch, '-c', str(path))
+
+    assert config.max_connections == 10
+    assert config.rate_limit == 2.5
+    assert config.port == 2500
+    assert config.no_color is True
+
+
+def test_cli_overrides_file(monkeypatch: pytest.MonkeyPatch,
+                            tmp_path: Path) -> None:
+    path = tmp_path / 'raft.ini'
+    path.write_text('[DEFAULT]\nmax_connections = 10\nno_color = true\n')
+
+    config = load_config(
+        monkeypatch, '-c', str(path), '--max-connections', '20')
+
+    assert config.max_connections == 20
+    # flag which is not given doesn't override the file
+    assert config.no_color is True
+
+
+@pytest.mark.parametrize('args', [
+    ('--max-message-size', '0'),
+    ('--max-connections', '-1'),
+    ('--expire-batch-size', '0'),
+    ('--watch-buffer-size', '0'),
+    ('--journal-size', '0'),
+    ('--stall-threshold', '0'),
+    ('--max-sessions', '0'),
+    ('--session-ttl', '0'),
+    ('--apply-partitions', '0'),
+])
+def test_invalid_values(monkeypatch: pytest.MonkeyPatch,
+                        args: tuple) -> None:
+    with pytest.raises(ValueError):
+        load_config(monkeypatch, *args)
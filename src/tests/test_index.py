@@ -0,0 +1,63 @@
+import random
+from typing import Optional
+
+import pytest
+
+from consensus.index import SortedKeys
+
+
+def test_add_keeps_order() -> None:
+    keys = SortedKeys(load=2)
+    for key in ['d', 'b', 'f', 'a', 'e', 'c', 'g']:
+        keys.add(key)
+
+    assert list(keys) == ['a', 'b', 'c', 'd', 'e', 'f', 'g']
+    assert len(keys) == 7
+
+
+def test_discard() -> None:
+    keys = SortedKeys(load=2)
+    for key in 'abcdefg':
+        keys.add(key)
+
+    for key in ['a', 'd', 'g', 'x', 'a']:
+        keys.discard(key)
+
+    assert list(keys) == ['b', 'c', 'e', 'f']
+    assert len(keys) == 4
+
+
+@pytest.mark.parametrize(('start', 'end', 'exclusive_start', 'expected'), [
+    ('a', None, False, ['b', 'c', 'e', 'f']),
+    ('c', 'f', False, ['c', 'e']),
+    ('c', 'f', True, ['e']),
+    ('d', 'e', False, []),
+    ('g', None, False, []),
+])
+def test_irange(start: str, end: Optional[str], exclusive_start: bool,
+                expected: list) -> None:
+    keys = SortedKeys(load=2)
+    for key in 'bcef':
+        keys.add(key)
+
+    assert list(keys.irange(start, end, exclusive_start)) == expected
+
+
+def test_random_operations_match_sorted_list() -> None:
+    rand = random.Random(42)
+    keys = SortedKeys(load=8)
+    expected = set()
+
+    for _ in range(5000):
+        key = f'{rand.randrange(500):04d}'
+        if key in expected and rand.random() < .5:
+            keys.discard(key)
+            expected.discard(key)
+        elif key not in expected:
+            keys.add(key)
+            expected.add(key)
+
+    assert list(keys) == sorted(expected)
+    assert len(keys) == len(expected)
+    assert list(keys.irange('0100', '0200')) == [
+        key for key in sorted(expected) if '0100' <= key < '0200']
@@ -0,0 +1,61 @@
+import json
+
+from consensus.raft.journal import TransitionJournal
+
+
+STATES = ['follower', 'candidate', 'leader']
+
+
+def record(journal: TransitionJournal, count: int) -> None:
+    for term in range(count):
+        journal.record(
+            term, 'follower', 'candidate', None, f'cause-{term}')
+
+
+def test_events_are_oldest_first() -> None:
+    journal = TransitionJournal(STATES, size=4)
+    journal.record(1, 'follower', 'candidate', None, 'election_timeout')
+    journal.record(1, 'candidate', 'leader', 'raft-1', 'elected')
+
+    events = journal.events()
+
+    assert len(journal) == 2
+    assert [e['seq'] for e in events] == [0, 1]
+    assert events[1] == {
+        'seq': 1,
+        'timestamp': events[1]['timestamp'],
+        'term': 1,
+        'old_state': 'candidate',
+        'new_state': 'leader',
+        'leader': 'raft-1',
+        'cause': 'elected',
+    }
+    assert events[0]['timestamp'] <= events[1]['timestamp']
+
+
+def test_ring_wraps_around() -> None:
+    journal = TransitionJournal(STATES, size=4)
+    record(journal, 10)
+
+    events = journal.events()
+
+    assert len(journal) == 4
+    assert [e['seq'] for e in events] == [6, 7, 8, 9]
+    assert [e['term'] for e in events] == [6, 7, 8, 9]
+    assert [e['cause'] for e in events] == [
+        'cause-6', 'cause-7', 'cause-8', 'cause-9']
+
+
+def test_empty_journal() -> None:
+    journal = TransitionJournal(STATES, size=4)
+
+    assert len(journal) == 0
+    assert journal.events() == []
+    assert journal.dumps() == '[]'
+
+
+def test_dumps() -> None:
+    journal = TransitionJournal(STATES, size=2)
+    record(journal, 3)
+
+    assert json.loads(journal.dumps()) == journal.events()
@@ -0,0 +1,202 @@
+import asyncio
+import time
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import List
+from typing import Tuple
+
+import pytest
+
+from consensus.expirer import KeyExpirer
+from consensus.pipeline import ApplyPipeline
+from consensus.raft.state_machine import RaftStateMachine
+from consensus.store import DataStore
+from consensus.store import InvalidOperationError
+from consensus.store import OP_DEL
+from consensus.store import OP_SET
+
+
+def run_pipeline(
+        pipeline: ApplyPipeline,
+        fn: Callable[[ApplyPipeline], Awaitable[Any]]) -> Any:
+    async def _run() -> Any:
+        applier = asyncio.create_task(pipeline.create_applier())
+        try:
+            return await fn(pipeline)
+        finally:
+            applier.cancel()
+            await asyncio.gather(applier, return_exceptions=True)
+
+    return asyncio.run(_run())
+
+
+def set_op(key: str, value: str) -> dict:
+    return {'op': OP_SET, 'key': key, 'value': value}
+
+
+@pytest.mark.parametrize('partitions', [1, 4])
+def test_entries_are_applied_in_submitted_order(partitions: int) -> None:
+    store = DataStore()
+
+    async def _submit(pipeline: ApplyPipeline) -> List[int]:
+        results = await asyncio.gather(*[
+            pipeline.apply([set_op('a', str(i))]) for i in range(10)
+        ])
+        return [index for (index, _, _) in results]
+
+    pipeline = ApplyPipeline(store, partitions=partitions)
+    assert run_pipeline(pipeline, _submit) == list(range(1, 11))
+    assert store.get('a') == ('9', 10)
+
+
+def test_partitions_publish_entries_in_order() -> None:
+    store = DataStore()
+    published = []  # type: List[Tuple[int, int, List[dict]]]
+    store.subscribe(lambda index, changes: published.append(
+        (index, store.index, changes)))
+
+    async def _submit(pipeline: ApplyPipeline) -> list:
+        return list(await asyncio.gather(*[
+            pipeline.apply([set_op(f'k{i}', str(i)), set_op('k0', str(i))])
+            for i in range(50)
+        ]))
+
+    results = run_pipeline(ApplyPipeline(store, partitions=4), _submit)
+
+    assert [index for (index, _, _) in results] == list(range(1, 51))
+    assert [index for (index, _, _) in published] == list(range(1, 51))
+    # store index is published with each entry
+    assert all(index == current for (index, current, _) in published)
+    assert published[9][2] == [
+        {'op': OP_SET, 'key': 'k9', 'value': '9', 'version': 10},
+        {'op': OP_SET, 'key': 'k0', 'value': '9', 'version': 10},
+    ]
+    assert store.get('k0') == ('49', 50)
+    assert store.scan('', None, 100) == sorted(
+        [(f'k{i}', str(i)) for i in range(1, 50)] + [('k0', '49')])
+
+
+def test_partitions_delete_in_order() -> None:
+    store = DataStore()
+
+    async def _submit(pipeline: ApplyPipeline) -> list:
+        return list(await asyncio.gather(
+            pipeline.apply([{'op': OP_DEL, 'key': 'a'}]),
+            pipeline.apply([set_op('a', '1')]),
+            pipeline.apply([{'op': OP_DEL, 'key': 'a'}])))
+
+    results = run_pipeline(ApplyPipeline(store, partitions=4), _submit)
+
+    assert [entry[2][0]['deleted'] for entry in (results[0], results[2])] == [
+        False, True]
+    assert store.get('a') is None
+    assert store.index == 3
+
+
+def test_guarded_entry_waits_for_partitions() -> None:
+    store = DataStore()
+
+    async def _submit(pipeline: ApplyPipeline) -> list:
+        return list(await asyncio.gather(
+            pipeline.apply([set_op('a', '1')]),
+            pipeline.apply([{**set_op('a', '2'), 'version': 1}]),
+            pipeline.apply([{**set_op('a', '3'), 'version': 1}])))
+
+    (first, guarded, stale) = run_pipeline(
+        ApplyPipeline(store, partitions=4), _submit)
+
+    assert guarded[:2] == (2, True)
+    assert stale[1] is False
+    assert store.get('a') == ('2', 2)
+
+
+def test_invalid_entry_is_not_partitioned() -> None:
+    store = DataStore()
+
+    async def _submit(pipeline: ApplyPipeline) -> list:
+        return list(await asyncio.gather(
+            pipeline.apply([{'op': 'bogus', 'key': 'a'}]),
+            pipeline.apply([set_op('a', '1')]),
+            return_exceptions=True))
+
+    (invalid, applied) = run_pipeline(
+        ApplyPipeline(store, partitions=4), _submit)
+
+    assert isinstance(invalid, InvalidOperationError)
+    assert applied[0] == 1
+
+
+def test_session_is_registered_in_order() -> None:
+    store = DataStore()
+
+    async def _submit(pipeline: ApplyPipeline) -> list:
+        return list(await asyncio.gather(
+            pipeline.apply([set_op('a', '1')]),
+            pipeline.register_session(),
+            pipeline.apply([set_op('b', '1')])))
+
+    (first, session_id, last) = run_pipeline(ApplyPipeline(store), _submit)
+
+    assert (first[0], session_id, last[0]) == (1, 2, 3)
+    assert session_id in store.sessions
+
+
+@pytest.mark.parametrize('partitions', [1, 4])
+def test_session_retry_is_applied_once(partitions: int) -> None:
+    store = DataStore()
+
+    async def _submit(pipeline: ApplyPipeline) -> list:
+        session_id = await pipeline.register_session()
+        session = (session_id, 1)
+        return list(await asyncio.gather(
+            pipeline.apply([set_op('a', '1')], session),
+            pipeline.apply([set_op('a', '1')], session)))
+
+    (first, retry) = run_pipeline(
+        ApplyPipeline(store, partitions=partitions), _submit)
+
+    assert first == retry
+    assert store.index == 2
+
+
+def test_expirer_applies_through_pipeline() -> None:
+    store = DataStore()
+    pipeline = ApplyPipeline(store)
+    expirer = KeyExpirer(
+        context=RaftStateMachine(name='raft-1', peers=[]), store=store,
+        pipeline=pipeline, expire_interval=1.0, expire_batch_size=2)
+
+    async def _expire(pipeline: ApplyPipeline) -> List[int]:
+        await pipeline.apply([
+            {**set_op(key, '1'), 'expires_at': 1.0} for key in 'abc'])
+        return [await expirer.expire() for _ in range(3)]
+
+    assert run_pipeline(pipeline, _expire) == [2, 1, 0]
+    assert store.index == 3
+    assert store.scan('', None, 10) == []
+
+
+def test_reads_wait_for_partitions(monkeypatch: pytest.MonkeyPatch) -> None:
+    store = DataStore()
+    write = store.write
+
+    def _slow_write(writes: List[Tuple[int, dict]]) -> List[dict]:
+        time.sleep(.05)
+        return write(writes)
+
+    monkeypatch.setattr(store, 'write', _slow_write)
+
+    async def _read(pipeline: ApplyPipeline) -> Tuple[Any, int]:
+        applying = asyncio.create_task(pipeline.apply([set_op('a', '1')]))
+
+        # the partition is being written
+        await asyncio.sleep(.01)
+        await pipeline.settled()
+        read = (store.get('a'), store.index)
+
+        await applying
+        return read
+
+    pipeline = ApplyPipeline(store, partitions=2)
+    assert run_pipeline(pipeline, _read) == (('1', 1), 1)
@@ -0,0 +1,88 @@
+from typing import List
+
+import pytest
+
+from transport.proxy import Link
+
+
+class Clock(object):
+    now: float = 100.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr('transport.proxy.time', clock)
+
+    return clock
+
+
+def test_no_faults_deliver_now(clock: Clock) -> None:
+    link = Link('a', 'b')
+
+    assert link.schedule(10) == clock.now
+
+
+def test_latency(clock: Clock) -> None:
+    link = Link('a', 'b')
+    link.faults.latency = .05
+
+    assert link.schedule(10) == pytest.approx(clock.now + .05)
+
+
+def test_jitter_keeps_order(clock: Clock) -> None:
+    link = Link('a', 'b')
+    link.faults.latency = .01
+    link.faults.jitter = .05
+
+    deliver_at = []  # type: List[float]
+    for _ in range(100):
+        sent_at = clock.now
+        t = link.schedule(10)
+
+        assert t is not None
+        assert sent_at + .01 <= t <= sent_at + .06
+        deliver_at.append(t)
+
+        clock.now += .001
+
+    assert deliver_at == sorted(deliver_at)
+
+
+def test_bandwidth_serializes_messages(clock: Clock) -> None:
+    link = Link('a', 'b')
+    link.faults.bandwidth = 1000.0
+
+    # messages queue behind each other on the link
+    assert link.schedule(100) == pytest.approx(clock.now + .1)
+    assert link.schedule(100) == pytest.approx(clock.now + .2)
+
+    # idle link sends immediately
+    clock.now += 1.0
+    assert link.schedule(500) == pytest.approx(clock.now + .5)
+
+
+@pytest.mark.parametrize('drop, down, dropped', [
+    (0.0, False, False),
+    (1.0, False, True),
+    (0.0, True, True),
+])
+def test_drop(clock: Clock, drop: float, down: bool, dropped: bool) -> None:
+    link = Link('a', 'b')
+    link.faults.drop = drop
+    link.faults.down = down
+
+    assert (link.schedule(10) is None) == dropped
+
+
+def test_dropped_message_does_not_hold_link(clock: Clock) -> None:
+    link = Link('a', 'b')
+    link.faults.bandwidth = 1000.0
+    link.faults.down = True
+    assert link.schedule(100) is None
+
+    link.faults.down = False
+    assert link.schedule(100) == pytest.approx(clock.now + .1)
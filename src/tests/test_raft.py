@@ -0,0 +1,289 @@
+import asyncio
+import time
+from typing import List
+from typing import Optional
+
+import pytest
+
+from consensus.raft.actor import ERR_TRANSFER_FAILED
+from consensus.raft.actor import RaftActor
+from consensus.raft.actor import count_responses
+from consensus.raft.state_machine import AlreadyVoted
+from consensus.raft.state_machine import ERR_NOT_LEADER
+from consensus.raft.state_machine import ERR_TRANSFERRING
+from consensus.raft.state_machine import LeaderIsAlive
+from consensus.raft.state_machine import LeadershipTransferError
+from consensus.raft.state_machine import RaftStateMachine
+from consensus.raft.state_machine import STATE_FOLLOWER
+from consensus.raft.state_machine import STATE_LEADER
+from consensus.raft.state_machine import TermIsLowerThanCurrent
+from consensus.raft.timing import RaftTiming
+
+
+def create_context(peers: int = 2) -> RaftStateMachine:
+    return RaftStateMachine(
+        name='raft-1', peers=[f'127.0.0.1:{2469 + i}' for i in range(peers)])
+
+
+def create_actor(context: RaftStateMachine) -> RaftActor:
+    timing = RaftTiming(
+        leader_timeout=.1, election_timeout_jitter=.01,
+        heartbeat_interval=.01, min_leader_timeout=.05,
+        min_heartbeat_interval=.01)
+
+    return RaftActor(context=context, event=asyncio.Event(), timing=timing)
+
+
+async def elect(context: RaftStateMachine) -> None:
+    await context.promote_to_candidate()
+    await context.promote_to_leader(context._term)
+
+
+@pytest.mark.parametrize('peers, quorum', [
+    (0, 1), (1, 2), (2, 2), (3, 3), (4, 3),
+])
+def test_quorum_is_majority(peers: int, quorum: int) -> None:
+    assert create_context(peers).quorum == quorum
+
+
+def test_vote_once_a_term() -> None:
+    context = create_context()
+
+    async def _vote() -> None:
+        assert await context.vote_from_candidate(1, 'raft-2') == 'raft-1'
+        # retry of the same candidate is granted again
+        assert await context.vote_from_candidate(1, 'raft-2') == 'raft-1'
+
+        with pytest.raises(AlreadyVoted):
+            await context.vote_from_candidate(1, 'raft-3')
+
+        assert await context.vote_from_candidate(2, 'raft-3') == 'raft-1'
+
+        with pytest.raises(TermIsLowerThanCurrent):
+            await context.vote_from_candidate(1, 'raft-2')
+
+    asyncio.run(_vote())
+
+    assert (context._term, context._voted_for) == (2, 'raft-3')
+
+
+def test_vote_of_higher_term_steps_down() -> None:
+    context = create_context()
+
+    async def _vote() -> None:
+        await elect(context)
+        await context.vote_from_candidate(context._term + 1, 'raft-2')
+
+    asyncio.run(_vote())
+
+    assert context._state == STATE_FOLLOWER
+    assert context._leader is None
+    assert context.journal.events()[-1]['cause'] == 'higher_term'
+
+
+def test_prevote_needs_higher_term() -> None:
+    context = create_context()
+    context._term = 3
+
+    with pytest.raises(TermIsLowerThanCurrent):
+        context.prevote_from_candidate(3, 'raft-2', leader_timeout=1.0)
+
+    assert context.prevote_from_candidate(
+        4, 'raft-2', leader_timeout=1.0) == 'raft-1'
+    # pre-vote doesn't change state
+    assert (context._term, context._voted_for) == (3, None)
+
+
+def test_prevote_is_rejected_while_leader_is_alive() -> None:
+    context = create_context()
+    context._term = 3
+    context._leader = 'raft-3'
+    context._heartbeat_at = time.monotonic()
+
+    with pytest.raises(LeaderIsAlive):
+        context.prevote_from_candidate(4, 'raft-2', leader_timeout=1.0)
+
+    context._heartbeat_at = time.monotonic() - 2.0
+    assert context.prevote_from_candidate(
+        4, 'raft-2', leader_timeout=1.0) == 'raft-1'
+
+
+def test_leader_rejects_prevote() -> None:
+    context = create_context()
+    asyncio.run(elect(context))
+
+    with pytest.raises(LeaderIsAlive):
+        context.prevote_from_candidate(
+            context._term + 1, 'raft-2', leader_timeout=1.0)
+
+
+def test_count_responses() -> None:
+    messages = [
+        '+OK:raft-2\r\n',
+        '-ERR:TERM_IS_LOWER 5\r\n',
+        '-ERR:TERM_IS_LOWER 3\r\n',
+        '-ERR:ALREADY_VOTED\r\n',
+        '+OK:raft-3\r\n',
+    ]
+
+    assert count_responses(messages) == (2, 5)
+    assert count_responses([]) == (0, 0)
+
+
+def run_leader(monkeypatch: pytest.MonkeyPatch,
+               responses: List[str], duration: float) -> RaftStateMachine:
+    """Runs leader loop of 3 members with heartbeat responses, until it
+    steps down or duration is passed
+    """
+
+    context = create_context()
+    actor = create_actor(context)
+
+    async def _heartbeats(heartbeat_interval: float) -> List[str]:
+        actor._timing.observe_leader_interval(heartbeat_interval)
+        return responses
+
+    monkeypatch.setattr(actor, 'send_heartbeats_to_peers', _heartbeats)
+
+    async def _run() -> None:
+        await elect(context)
+        try:
+            await asyncio.wait_for(actor._act_as_leader(), duration)
+
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(_run())
+
+    return context
+
+
+def test_check_quorum_steps_down(monkeypatch: pytest.MonkeyPatch) -> None:
+    context = run_leader(monkeypatch, [], 1.0)
+
+    assert context._state == STATE_FOLLOWER
+    assert context.journal.events()[-1]['cause'] == 'check_quorum'
+
+
+def test_leader_with_quorum_keeps_leadership(
+        monkeypatch: pytest.MonkeyPatch) -> None:
+    context = run_leader(monkeypatch, ['+OK:raft-2\r\n'], .2)
+
+    assert context._state == STATE_LEADER
+
+
+def transfer(monkeypatch: pytest.MonkeyPatch, accepts: List[str],
+             target: Optional[str] = None) -> List[str]:
+    """Transfers leadership of 3 members, where only peers in `accepts`
+    take over leadership. returns peers tried in order
+    """
+
+    context = create_context()
+    actor = create_actor(context)
+    (fast, slow) = context._peers
+    actor._timing.observe_rtt(fast, .01)
+    actor._timing.observe_rtt(slow, .05)
+
+    tried = []  # type: List[str]
+
+    async def _transfer_to(peer: str) -> bool:
+        tried.append(peer)
+        if peer in accepts:
+            await context.step_down('timeout_now')
+            return True
+        return False
+
+    monkeypatch.setattr(actor, '_transfer_to', _transfer_to)
+
+    async def _run() -> None:
+        await elect(context)
+        assert await actor.transfer_leadership(target) == tried[-1]
+
+    asyncio.run(_run())
+
+    assert context._state == STATE_FOLLOWER
+    assert not context._transferring
+
+    return tried
+
+
+def test_transfer_to_fastest_peer(monkeypatch: pytest.MonkeyPatch) -> None:
+    (fast, slow) = create_context()._peers
+
+    assert transfer(monkeypatch, [fast, slow]) == [fast]
+    assert transfer(monkeypatch, [slow]) == [fast, slow]
+
+
+def test_transfer_to_target(monkeypatch: pytest.MonkeyPatch) -> None:
+    (fast, slow) = create_context()._peers
+
+    assert transfer(monkeypatch, [fast, slow], target=slow) == [slow]
+
+
+def test_transfer_is_rejected() -> None:
+    context = create_context()
+    actor = create_actor(context)
+
+    async def _transfer() -> None:
+        await actor.transfer_leadership()
+
+    with pytest.raises(LeadershipTransferError, match=ERR_NOT_LEADER):
+        asyncio.run(_transfer())
+
+    asyncio.run(elect(context))
+    context._transferring = True
+
+    with pytest.raises(LeadershipTransferError, match=ERR_TRANSFERRING):
+        asyncio.run(_transfer())
+
+
+def test_transfer_fails_without_taker(
+        monkeypatch: pytest.MonkeyPatch) -> None:
+    context = create_context()
+    actor = create_actor(context)
+
+    async def _transfer_to(peer: str) -> bool:
+        return False
+
+    monkeypatch.setattr(actor, '_transfer_to', _transfer_to)
+
+    async def _run() -> None:
+        await elect(context)
+        await actor.transfer_leadership()
+
+    with pytest.raises(LeadershipTransferError, match=ERR_TRANSFER_FAILED):
+        asyncio.run(_run())
+
+    # leader keeps leadership, and accepts proposals again
+    assert context._state == STATE_LEADER
+    assert not context._transferring
+
+
+@pytest.mark.parametrize('responses, transferred', [
+    (['+OK:raft-2', '+OK:raft-2'], True),
+    (['+OK:raft-2', '-ERR:TERM_IS_LOWER 3'], False),
+    (['-ERR:TERM_IS_LOWER 3'], False),
+])
+def test_transfer_to_peer(monkeypatch: pytest.MonkeyPatch,
+                          responses: List[str], transferred: bool) -> None:
+    context = create_context()
+    actor = create_actor(context)
+    messages = []  # type: List[str]
+
+    async def _call(ip: str, port: int, message: str,
+                    bind: Optional[str] = None) -> str:
+        messages.append(message.split()[0])
+        response = responses[len(messages) - 1]
+        # target is elected, and steps the leader down
+        if message.startswith('timeout_now') and response.startswith('+'):
+            await context.step_down('higher_term')
+        return response
+
+    monkeypatch.setattr('consensus.raft.actor.call', _call)
+
+    async def _run() -> bool:
+        await elect(context)
+        return await actor._transfer_to(context._peers[0])
+
+    assert asyncio.run(_run()) == transferred
+    assert messages == ['heartbeat', 'timeout_now'][:len(responses)]
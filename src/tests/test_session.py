@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from consensus.pipeline import ApplyPipeline
+from consensus.session import SessionExpiredError
+from consensus.session import SessionTable
+from consensus.session import StaleSequenceError
+from consensus.store import DataStore
+from consensus.store import OP_SET
+
+
+def test_retry_is_answered_from_cache() -> None:
+    table = SessionTable()
+    table.register(1, at=100.0)
+
+    assert table.lookup(1, 1) is None
+    table.record(1, 1, 'result')
+
+    assert table.lookup(1, 1) == 'result'
+    assert table.lookup(1, 2) is None
+
+
+def test_stale_sequence() -> None:
+    table = SessionTable()
+    table.register(1, at=100.0)
+    table.record(1, 3, 'result')
+
+    with pytest.raises(StaleSequenceError):
+        table.lookup(1, 2)
+
+
+def test_unknown_session() -> None:
+    with pytest.raises(SessionExpiredError):
+        SessionTable().lookup(1, 1)
+
+
+def test_idle_session_expires_at_entry_time() -> None:
+    table = SessionTable(ttl=10.0)
+    table.register(1, at=100.0)
+    table.register(2, at=105.0)
+
+    assert table.expire(109.0) == 0
+    assert table.expire(110.0) == 1
+    assert 1 not in table
+    assert 2 in table
+
+
+def test_activity_keeps_session() -> None:
+    table = SessionTable(ttl=10.0)
+    table.register(1, at=100.0)
+    table.register(2, at=101.0)
+
+    table.expire(108.0)
+    table.lookup(1, 1)
+
+    assert table.expire(112.0) == 1
+    assert list(table._sessions) == [1]
+
+
+def test_time_does_not_go_backward() -> None:
+    table = SessionTable(ttl=10.0)
+    table.register(1, at=100.0)
+
+    # entry proposed earlier is applied later
+    table.register(2, at=50.0)
+
+    assert table.expire(110.0) == 2
+
+
+def test_least_recently_active_session_is_evicted() -> None:
+    table = SessionTable(max_sessions=2)
+    for session_id in (1, 2):
+        table.register(session_id, at=100.0)
+    table.lookup(1, 1)
+
+    table.register(3, at=100.0)
+
+    assert 1 in table
+    assert 2 not in table
+    assert 3 in table
+
+
+def test_pipeline_expires_sessions_by_entry_time() -> None:
+    store = DataStore(session_ttl=10.0)
+    op = {'op': OP_SET, 'key': 'a', 'value': '1'}
+
+    async def _run() -> None:
+        pipeline = ApplyPipeline(store)
+        applier = asyncio.create_task(pipeline.create_applier())
+        try:
+            session_id = await pipeline.register_session(at=100.0)
+            await pipeline.apply([op], (session_id, 1), at=105.0)
+
+            # entry without session advances time of the table too
+            await pipeline.apply([op], at=120.0)
+
+            with pytest.raises(SessionExpiredError):
+                await pipeline.apply([op], (session_id, 2), at=120.0)
+
+        finally:
+            applier.cancel()
+            await asyncio.gather(applier, return_exceptions=True)
+
+    asyncio.run(_run())
+
+    assert store.index == 3
@@ -0,0 +1,252 @@
+import asyncio
+import io
+import json
+import os
+from pathlib import Path
+from typing import List
+from typing import Tuple
+
+import pytest
+
+from consensus.importer import SnapshotInstaller
+from consensus.importer import SnapshotInstallError
+from consensus.pipeline import ApplyPipeline
+from consensus.raft.state_machine import RaftStateMachine
+from consensus.snapshot import CHUNK_BYTES
+from consensus.snapshot import SnapshotFormatError
+from consensus.snapshot import build_snapshot
+from consensus.snapshot import build_state
+from consensus.snapshot import decode_chunk
+from consensus.snapshot import read_binary
+from consensus.snapshot import read_chunks
+from consensus.snapshot import read_ndjson
+from consensus.snapshot import write_binary
+from consensus.store import DataStore
+from consensus.store import OP_SET
+from consensus.watch import WatchHub
+
+
+def create_installer(store: DataStore, pipeline: ApplyPipeline,
+                     data_dir: Path) -> SnapshotInstaller:
+    # a follower of raft-1 at term 3
+    context = RaftStateMachine(name='raft-2', peers=[])
+    context._term = 3
+    context._leader = 'raft-1'
+
+    return SnapshotInstaller(
+        context=context, store=store, pipeline=pipeline,
+        watch_hub=WatchHub(store, buffer_size=10, history_size=10),
+        data_dir=str(data_dir))
+
+
+def read_records(path: Path) -> List[Tuple[str, str]]:
+    return [
+        record for raw in read_chunks(str(path))
+        for record in decode_chunk(raw)
+    ]
+
+
+def test_records_are_sorted_and_last_wins(tmp_path: Path) -> None:
+    path = tmp_path / 'data.snap'
+    records = [('c', '1'), ('a', '1'), ('b', '1'), ('a', '2'), ('c', '3')]
+
+    count = build_snapshot(records, str(path), run_size=2)
+
+    assert count == 3
+    assert read_records(path) == [('a', '2'), ('b', '1'), ('c', '3')]
+    assert sorted(os.listdir(tmp_path)) == ['data.snap']
+
+
+def test_chunks_are_capped_by_encoded_size(tmp_path: Path) -> None:
+    path = tmp_path / 'data.snap'
+    # escaped and multi-byte characters are larger encoded
+    records = [(f'{i:04d}', '"한글"' * 200) for i in range(200)]
+
+    build_snapshot(records, str(path))
+
+    chunks = list(read_chunks(str(path)))
+    assert len(chunks) > 1
+    assert all(len(raw) <= CHUNK_BYTES for raw in chunks)
+    assert read_records(path) == records
+
+
+def test_oversize_record_is_rejected(tmp_path: Path) -> None:
+    path = tmp_path / 'data.snap'
+    records = [('a', '1'), ('b', 'x' * 70000)]
+
+    with pytest.raises(SnapshotFormatError, match="'b'"):
+        build_snapshot(records, str(path), run_size=1)
+
+    # runs and partial file are removed
+    assert os.listdir(tmp_path) == []
+
+
+def test_runs_are_removed_when_records_fail(tmp_path: Path) -> None:
+    path = tmp_path / 'data.snap'
+    lines = io.BytesIO(b'{"key": "a", "value": "1"}\nnot json\n')
+
+    with pytest.raises(SnapshotFormatError):
+        build_snapshot(read_ndjson(lines), str(path), run_size=1)
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_binary_records() -> None:
+    f = io.BytesIO()
+    write_binary(f, [('a', '1'), ('한', '글')])
+    f.seek(0)
+
+    assert list(read_binary(f)) == [('a', '1'), ('한', '글')]
+
+
+def test_build_state() -> None:
+    chunks = ['[["a","1"],["b","2"]]', '[["c","3"]]']
+
+    (data, keys) = build_state(chunks, index=7)
+
+    assert data == {'a': ('1', 7), 'b': ('2', 7), 'c': ('3', 7)}
+    assert list(keys) == ['a', 'b', 'c']
+
+
+@pytest.mark.parametrize('chunks', [
+    ['[["b","1"]]', '[["a","1"]]'],
+    ['[["a","1"],["a","2"]]'],
+    ['{"a": "1"}'],
+])
+def test_build_state_rejects_invalid_chunks(chunks: List[str]) -> None:
+    with pytest.raises(SnapshotFormatError):
+        build_state(chunks, index=1)
+
+
+def test_staged_snapshot_is_installed_at_index(tmp_path: Path) -> None:
+    store = DataStore()
+    pipeline = ApplyPipeline(store)
+    installer = create_installer(store, pipeline, tmp_path)
+
+    async def _run() -> int:
+        applier = asyncio.create_task(pipeline.create_applier())
+        try:
+            session_id = await pipeline.register_session(at=100.0)
+            await pipeline.apply(
+                [{'op': OP_SET, 'key': 'old', 'value': '1'}],
+                (session_id, 1), at=100.0)
+
+            installer.begin('t-1', 3, 'raft-1')
+            installer.stage('t-1', json.dumps([['a', '1'], ['b', '2']]))
+            installer.stage('t-1', json.dumps([['c', '3']]))
+            assert len(os.listdir(tmp_path)) == 1
+
+            return await installer.commit('t-1', 10)
+
+        finally:
+            applier.cancel()
+            await asyncio.gather(applier, return_exceptions=True)
+
+    assert asyncio.run(_run()) == 3
+    assert store.index == 10
+    assert store.get('b') == ('2', 10)
+    assert store.get('old') is None
+    assert len(store.sessions) == 0
+    # staged file is removed after install
+    assert os.listdir(tmp_path) == []
+
+
+def test_new_transfer_drops_staged_one(tmp_path: Path) -> None:
+    store = DataStore()
+    installer = create_installer(store, ApplyPipeline(store), tmp_path)
+
+    installer.begin('t-1', 3, 'raft-1')
+    installer.stage('t-1', '[["a","1"]]')
+    installer.begin('t-2', 3, 'raft-1')
+
+    with pytest.raises(SnapshotInstallError):
+        installer.stage('t-1', '[["b","1"]]')
+
+    assert installer.stage('t-2', '[["b","1"]]') == 1
+    assert len(os.listdir(tmp_path)) == 1
+
+    installer.abort('t-2')
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize(('term', 'leader_name'), [
+    (2, 'raft-1'), (4, 'raft-1'), (3, 'raft-3'), (3, 'raft-2'),
+])
+def test_transfer_of_other_leader_is_rejected(
+        tmp_path: Path, term: int, leader_name: str) -> None:
+    store = DataStore()
+    installer = create_installer(store, ApplyPipeline(store), tmp_path)
+
+    with pytest.raises(SnapshotInstallError, match='NOT_CURRENT_LEADER'):
+        installer.begin('t-1', term, leader_name)
+
+    assert os.listdir(tmp_path) == []
+
+
+def run_commit(installer: SnapshotInstaller, pipeline: ApplyPipeline,
+               index: int) -> int:
+    async def _run() -> int:
+        applier = asyncio.create_task(pipeline.create_applier())
+        try:
+            return await installer.commit('t-1', index)
+
+        finally:
+            applier.cancel()
+            await asyncio.gather(applier, return_exceptions=True)
+
+    return asyncio.run(_run())
+
+
+def test_commit_after_leader_changed_is_rejected(tmp_path: Path) -> None:
+    store = DataStore()
+    pipeline = ApplyPipeline(store)
+    installer = create_installer(store, pipeline, tmp_path)
+
+    installer.begin('t-1', 3, 'raft-1')
+    installer.stage('t-1', '[["a","1"]]')
+    installer._context._term = 4
+
+    with pytest.raises(SnapshotInstallError, match='NOT_CURRENT_LEADER'):
+        run_commit(installer, pipeline, 10)
+
+    assert store.get('a') is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_commit_lower_than_store_index_is_rejected(tmp_path: Path) -> None:
+    store = DataStore()
+    store.apply([{'op': OP_SET, 'key': key, 'value': '1'} for key in 'ab'])
+    store.apply([{'op': OP_SET, 'key': 'c', 'value': '1'}])
+    pipeline = ApplyPipeline(store)
+    installer = create_installer(store, pipeline, tmp_path)
+
+    installer.begin('t-1', 3, 'raft-1')
+    installer.stage('t-1', '[["x","1"]]')
+
+    with pytest.raises(SnapshotInstallError, match='STALE_INDEX'):
+        run_commit(installer, pipeline, 1)
+
+    assert store.index == 2
+    assert store.get('x') is None
+
+
+@pytest.mark.parametrize('path', [
+    '/etc/passwd', '../outside.snap', 'sub/../../outside.snap',
+])
+def test_import_path_out_of_data_dir_is_rejected(
+        tmp_path: Path, path: str) -> None:
+    store = DataStore()
+    installer = create_installer(store, ApplyPipeline(store), tmp_path)
+
+    with pytest.raises(SnapshotInstallError, match='INVALID_PATH'):
+        installer.resolve_path(path)
+
+
+def test_import_path_in_data_dir(tmp_path: Path) -> None:
+    store = DataStore()
+    installer = create_installer(store, ApplyPipeline(store), tmp_path)
+
+    assert installer.resolve_path('data.snap') == os.path.realpath(
+        tmp_path / 'data.snap')
+    assert installer.resolve_path(str(tmp_path / 'data.snap')) == (
+        os.path.realpath(tmp_path / 'data.snap'))
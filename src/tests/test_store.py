@@ -0,0 +1,228 @@
+from typing import List
+from typing import Tuple
+
+import pytest
+
+from consensus.store import DataStore
+from consensus.store import ERR_ABORTED
+from consensus.store import ERR_VERSION_MISMATCH
+from consensus.store import InvalidOperationError
+from consensus.store import OP_DEL
+from consensus.store import OP_EXPIRE
+from consensus.store import OP_SET
+from consensus.store import resolve_ttl
+
+
+def set_op(key: str, value: str, **kwargs: object) -> dict:
+    return {'op': OP_SET, 'key': key, 'value': value, **kwargs}
+
+
+def del_op(key: str, **kwargs: object) -> dict:
+    return {'op': OP_DEL, 'key': key, **kwargs}
+
+
+def test_version_is_index_of_entry() -> None:
+    store = DataStore()
+
+    assert store.apply([set_op('a', '1'), set_op('b', '2')]) == (
+        True, [{'ok': True, 'version': 1}, {'ok': True, 'version': 1}])
+    store.apply([set_op('a', '3')])
+
+    assert store.index == 2
+    assert store.get('a') == ('3', 2)
+    assert store.get('b') == ('2', 1)
+
+
+def test_delete() -> None:
+    store = DataStore()
+    store.apply([set_op('a', '1')])
+
+    assert store.apply([del_op('a'), del_op('b')]) == (True, [
+        {'ok': True, 'deleted': True}, {'ok': True, 'deleted': False}])
+    assert store.get('a') is None
+    assert store.scan('', None, 10) == []
+
+
+def test_version_guard() -> None:
+    store = DataStore()
+    store.apply([set_op('a', '1')])
+
+    (applied, results) = store.apply([
+        set_op('a', '2', version=1), set_op('b', '1', version=0)])
+
+    assert applied
+    assert [r['version'] for r in results] == [2, 2]
+
+
+def test_failed_guard_applies_nothing() -> None:
+    store = DataStore()
+    store.apply([set_op('a', '1')])
+
+    (applied, results) = store.apply([
+        set_op('b', '1'), set_op('a', '2', version=5), del_op('a')])
+
+    assert not applied
+    assert results == [
+        {'ok': False, 'error': ERR_ABORTED},
+        {'ok': False, 'error': ERR_VERSION_MISMATCH, 'version': 1},
+        {'ok': False, 'error': ERR_ABORTED},
+    ]
+    assert store.index == 1
+    assert store.get('a') == ('1', 1)
+    assert store.get('b') is None
+
+
+def test_create_only_guard() -> None:
+    store = DataStore()
+
+    assert store.apply([set_op('a', '1', version=0)])[0]
+    assert not store.apply([set_op('a', '2', version=0)])[0]
+    assert store.get('a') == ('1', 1)
+
+
+@pytest.mark.parametrize('op', [
+    {'op': 'incr', 'key': 'a'},
+    {'op': OP_SET, 'key': 'a'},
+    {'op': OP_SET, 'key': 1, 'value': '1'},
+    {'op': OP_SET, 'key': 'a', 'value': '1', 'version': True},
+    {'op': 'expire', 'key': 'a'},
+])
+def test_invalid_operation(op: dict) -> None:
+    store = DataStore()
+
+    with pytest.raises(InvalidOperationError):
+        store.apply([set_op('b', '1'), op])
+
+    assert store.index == 0
+    assert store.get('b') is None
+
+
+def test_listener_gets_changes_of_entry() -> None:
+    store = DataStore()
+    entries = []  # type: List[Tuple[int, List[dict]]]
+    store.subscribe(lambda index, changes: entries.append((index, changes)))
+
+    store.apply([set_op('a', '1'), del_op('missing')])
+    store.apply([del_op('a')])
+
+    assert entries == [
+        (1, [{'op': OP_SET, 'key': 'a', 'value': '1', 'version': 1}]),
+        (2, [{'op': OP_DEL, 'key': 'a'}]),
+    ]
+
+
+def test_scan_range() -> None:
+    store = DataStore()
+    store.apply([set_op(key, key.upper()) for key in 'abcde'])
+
+    assert store.scan('b', 'd', 10) == [('b', 'B'), ('c', 'C')]
+    assert store.scan('b', None, 2, exclusive_start=True) == [
+        ('c', 'C'), ('d', 'D')]
+
+
+def test_scan_prefix() -> None:
+    store = DataStore()
+    store.apply([set_op(key, '1') for key in ['a', 'ab/1', 'ab/2', 'b']])
+
+    assert store.scan_prefix('ab/', 10) == [('ab/1', '1'), ('ab/2', '1')]
+    assert store.scan_prefix('ab/', 10, start='ab/1',
+                             exclusive_start=True) == [('ab/2', '1')]
+    assert store.scan_prefix('c', 10) == []
+
+
+def expire_op(key: str, version: int) -> dict:
+    return {'op': OP_EXPIRE, 'key': key, 'version': version}
+
+
+def test_expired_key_is_hidden() -> None:
+    store = DataStore()
+    store.apply([
+        set_op('a', '1', expires_at=1.0), set_op('b', '1', expires_at=1e12)])
+
+    assert store.get('a') is None
+    assert store.get('b') == ('1', 1)
+    assert store.scan('', None, 10) == [('b', '1')]
+
+
+def test_expired_returns_due_keys_in_deadline_order() -> None:
+    store = DataStore()
+    store.apply([set_op('a', '1', expires_at=20.0)])
+    store.apply([set_op('b', '1', expires_at=10.0)])
+    store.apply([set_op('c', '1', expires_at=30.0)])
+
+    assert store.expired(25.0, limit=10) == [('b', 2), ('a', 1)]
+    assert store.expired(25.0, limit=1) == [('b', 2)]
+    # keys are reported until expire entry is applied
+    assert store.expired(25.0, limit=10) == [('b', 2), ('a', 1)]
+
+
+def test_expired_reports_key_once() -> None:
+    store = DataStore()
+    store.apply([
+        set_op('u', '1', expires_at=10.0), set_op('u', '2', expires_at=10.0)])
+    store.apply([del_op('u')])
+    store.apply([set_op('u', '3', expires_at=10.0)])
+    store.apply([set_op('u', '4', expires_at=10.0)])
+
+    assert store.expired(20.0, limit=10) == [('u', 4)]
+
+
+def test_overwritten_deadline_is_dropped() -> None:
+    store = DataStore()
+    store.apply([set_op('a', '1', expires_at=10.0)])
+    store.apply([set_op('a', '2')])
+    store.apply([set_op('b', '1', expires_at=10.0)])
+    store.apply([del_op('b')])
+
+    assert store.expired(20.0, limit=10) == []
+    assert store.get('a') == ('2', 2)
+
+
+def test_expire_checks_version() -> None:
+    store = DataStore()
+    store.apply([set_op('a', '1', expires_at=10.0)])
+    store.apply([set_op('b', '1', expires_at=10.0)])
+    # key is written again after it is found expired
+    store.apply([set_op('b', '2')])
+
+    (applied, results) = store.apply([expire_op('a', 1), expire_op('b', 2)])
+
+    assert applied
+    assert results == [
+        {'ok': True, 'deleted': True}, {'ok': True, 'deleted': False}]
+    assert store.get('a') is None
+    assert store.get('b') == ('2', 3)
+    assert store.expired(20.0, limit=10) == []
+
+
+def test_resolve_ttl() -> None:
+    ops = [set_op('a', '1', ttl=5), set_op('b', '1')]
+    resolve_ttl(ops, now=100.0)
+
+    assert ops[0]['expires_at'] == 105.0
+    assert 'ttl' not in ops[0]
+    assert 'expires_at' not in ops[1]
+
+
+@pytest.mark.parametrize('ttl', [0, -1, '5', True, float('nan'),
+                                 float('inf')])
+def test_invalid_ttl(ttl: object) -> None:
+    with pytest.raises(InvalidOperationError):
+        resolve_ttl([set_op('a', '1', ttl=ttl)], now=100.0)
+
+
+@pytest.mark.parametrize('op', [
+    expire_op('a', 1),
+    set_op('a', '1', expires_at=1e12),
+    set_op('a', '1', expires_at=float('nan')),
+])
+def test_client_cannot_propose_expiry(op: dict) -> None:
+    with pytest.raises(InvalidOperationError):
+        resolve_ttl([set_op('b', '1'), op], now=100.0)
+
+
+def test_non_finite_deadline_is_invalid() -> None:
+    store = DataStore()
+
+    with pytest.raises(InvalidOperationError):
+        store.apply([set_op('a', '1', expires_at=float('nan'))])
@@ -0,0 +1,79 @@
+import asyncio
+from pathlib import Path
+from typing import AsyncIterator
+from typing import List
+
+from transport.address import open_connection
+from transport.address import start_server
+from transport.admission import AdmissionControl
+from transport.admission import AdmissionLimits
+from transport.tcp import get_handler
+from transport.tcp import parse_message
+from transport.tcp import response_ok
+
+
+async def handle_get(key: str) -> bytes:
+    return response_ok(key)
+
+
+async def handle_scan(count: str) -> AsyncIterator[bytes]:
+    async def _pages() -> AsyncIterator[bytes]:
+        for i in range(int(count)):
+            yield response_ok(str(i))
+
+    return _pages()
+
+
+COMMANDS = {
+    'get': (handle_get, 1),
+    'scan': (handle_scan, 1),
+}
+
+
+def run_session(tmp_path: Path, messages: List[bytes],
+                lines: List[int]) -> List[bytes]:
+    """Send each of messages on a connection, and read its response lines
+    before sending the next
+    """
+
+    async def _run() -> List[bytes]:
+        handler = get_handler(
+            name='test', commands=COMMANDS,
+            admission=AdmissionControl(AdmissionLimits()))
+        path = str(tmp_path / 'test.sock')
+        server = await start_server(handler, f'unix:{path}', 0)
+
+        responses = []
+        async with server:
+            (reader, writer) = await open_connection('unix', path)
+
+            for (message, count) in zip(messages, lines):
+                writer.write(message)
+                for _ in range(count):
+                    responses.append(
+                        await asyncio.wait_for(reader.readline(), 1.0))
+
+            writer.close()
+
+        return responses
+
+    return asyncio.run(_run())
+
+
+def test_command_after_stream(tmp_path: Path) -> None:
+    responses = run_session(
+        tmp_path, [b'scan 2\n', b'get a\n', b'get b\n'], [2, 1, 1])
+
+    assert responses == [
+        b'+OK:0\r\n', b'+OK:1\r\n', b'+OK:a\r\n', b'+OK:b\r\n']
+
+
+def test_command_pipelined_after_stream(tmp_path: Path) -> None:
+    responses = run_session(tmp_path, [b'scan 2\nget a\nget b\n'], [4])
+
+    assert responses == [
+        b'+OK:0\r\n', b'+OK:1\r\n', b'+OK:a\r\n', b'+OK:b\r\n']
+
+
+def test_parse_message() -> None:
+    assert parse_message(COMMANDS, 'get a b\n') == (handle_get, ['a b'])
@@ -0,0 +1,115 @@
+from typing import Optional
+
+import pytest
+
+from consensus.raft.timing import RTT_VAR_FACTOR
+from consensus.raft.timing import TIMEOUT_BACKOFF
+from consensus.raft.timing import RaftTiming
+
+
+def create_timing(adaptive: bool = True,
+                  quorum_peers: Optional[int] = None) -> RaftTiming:
+    return RaftTiming(
+        leader_timeout=3.0, election_timeout_jitter=.3,
+        heartbeat_interval=2.0, min_leader_timeout=.15,
+        min_heartbeat_interval=.05, adaptive=adaptive,
+        quorum_peers=quorum_peers)
+
+
+def test_static_timing_before_measurement() -> None:
+    timing = create_timing()
+
+    assert timing.rto is None
+    assert timing.heartbeat_interval == 2.0
+    assert timing.leader_timeout == 3.0
+
+
+def test_first_sample_and_smoothing() -> None:
+    timing = create_timing()
+
+    timing.observe_rtt('a', .1)
+    assert timing._rtts['a'] == (.1, .05)
+    assert timing.rto == pytest.approx(.1 + RTT_VAR_FACTOR * .05)
+
+    timing.observe_rtt('a', .1)
+    (srtt, rttvar) = timing._rtts['a']
+    assert srtt == pytest.approx(.1)
+    assert rttvar == pytest.approx(.75 * .05)
+
+
+def test_rto_is_slowest_peer() -> None:
+    timing = create_timing()
+    timing.observe_rtt('a', .01)
+    timing.observe_rtt('b', .1)
+
+    assert timing.rto == pytest.approx(.1 + RTT_VAR_FACTOR * .05)
+
+
+def test_rto_is_slowest_of_quorum_peers() -> None:
+    timing = create_timing(quorum_peers=1)
+    timing.observe_rtt('a', .01)
+    timing.observe_rtt('b', .1)
+
+    assert timing.rto == pytest.approx(.01 + RTT_VAR_FACTOR * .005)
+
+
+@pytest.mark.parametrize('rtt, interval', [
+    (.001, .05),  # floor
+    (.01, .12),
+    (1.0, 2.0),  # ceiling
+])
+def test_heartbeat_interval_is_clamped(rtt: float, interval: float) -> None:
+    timing = create_timing()
+    timing.observe_rtt('a', rtt)
+
+    assert timing.heartbeat_interval == pytest.approx(interval)
+
+
+@pytest.mark.parametrize('interval, leader_timeout', [
+    (.01, .15),  # floor
+    (.1, .3),
+    (2.0, 3.0),  # ceiling
+])
+def test_leader_timeout_is_clamped(
+        interval: float, leader_timeout: float) -> None:
+    timing = create_timing()
+    timing.observe_leader_interval(interval)
+
+    assert timing.leader_timeout == pytest.approx(leader_timeout)
+
+
+def test_static_timing_without_adaptive() -> None:
+    timing = create_timing(adaptive=False)
+    timing.observe_rtt('a', .001)
+    timing.observe_leader_interval(.01)
+
+    assert timing.heartbeat_interval == 2.0
+    assert timing.leader_timeout == 3.0
+
+
+def test_timeout_backs_off_until_response() -> None:
+    timing = create_timing()
+    timing.observe_rtt('a', .01)
+
+    timing.observe_rtt('a', .05, timed_out=True)
+    assert timing.rto == .05 * TIMEOUT_BACKOFF
+    assert timing._rtts['a'] == (.01, .005)
+
+    timing.observe_rtt('a', .01)
+    assert timing.rto == pytest.approx(.01 + RTT_VAR_FACTOR * .00375)
+
+
+def test_unreachable_peer_does_not_slow_quorum() -> None:
+    timing = create_timing(quorum_peers=1)
+    timing.observe_rtt('a', .01)
+    timing.observe_rtt('b', 3.0, timed_out=True)
+
+    assert timing.rto == pytest.approx(.01 + RTT_VAR_FACTOR * .005)
+
+
+def test_election_timeout_jitter_is_bounded() -> None:
+    timing = create_timing()
+    timing.observe_leader_interval(.01)
+
+    for _ in range(100):
+        assert 0 <= timing.election_timeout() <= .15
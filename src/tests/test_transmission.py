@@ -0,0 +1,55 @@
+import asyncio
+from asyncio.streams import StreamReader
+from asyncio.streams import StreamWriter
+from pathlib import Path
+from typing import List
+from typing import Tuple
+
+from transport.address import start_server
+from transport.transmission import broadcast
+
+
+def test_timed_out_call_is_observed(tmp_path: Path) -> None:
+    observed = []  # type: List[Tuple[str, float, bool]]
+
+    def _observe(peer: str, rtt: float, timed_out: bool) -> None:
+        observed.append((peer, rtt, timed_out))
+
+    async def _respond(reader: StreamReader, writer: StreamWriter) -> None:
+        await reader.readline()
+        writer.write(b'+OK:fast\r\n')
+        await writer.drain()
+        writer.close()
+
+    async def _hang(reader: StreamReader, writer: StreamWriter) -> None:
+        await reader.readline()
+        await asyncio.sleep(1)
+        writer.close()
+
+    async def _run() -> List[str]:
+        fast = f'unix:{tmp_path / "fast.sock"}'
+        slow = f'unix:{tmp_path / "slow.sock"}'
+        servers = [
+            await start_server(_respond, fast, 0),
+            await start_server(_hang, slow, 0),
+        ]
+
+        try:
+            return await broadcast(
+                [fast, slow], 'ping',
+                observe=_observe,
+                timeout=.05)
+
+        finally:
+            for server in servers:
+                server.close()
+
+    assert asyncio.run(_run()) == ['+OK:fast\r\n']
+
+    observed_by_peer = {peer: args for (peer, *args) in observed}
+
+    (rtt, timed_out) = observed_by_peer[f'unix:{tmp_path / "fast.sock"}']
+    assert rtt < .05 and not timed_out
+
+    (rtt, timed_out) = observed_by_peer[f'unix:{tmp_path / "slow.sock"}']
+    assert rtt == .05 and timed_out
@@ -0,0 +1,134 @@
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import pytest
+
+from consensus.store import DataStore
+from consensus.store import OP_DEL
+from consensus.store import OP_SET
+from consensus.watch import HistoryCompactedError
+from consensus.watch import RESYNC
+from consensus.watch import Watcher
+from consensus.watch import WatchHub
+
+
+def set_op(key: str, value: str) -> dict:
+    return {'op': OP_SET, 'key': key, 'value': value}
+
+
+def del_op(key: str) -> dict:
+    return {'op': OP_DEL, 'key': key}
+
+
+def create_hub(buffer_size: int = 16,
+               history_size: int = 16) -> Tuple[DataStore, WatchHub]:
+    store = DataStore()
+    hub = WatchHub(store, buffer_size=buffer_size, history_size=history_size)
+
+    return (store, hub)
+
+
+def drain(watcher: Watcher) -> List[Optional[dict]]:
+    events = []
+    while not watcher.queue.empty():
+        events.append(watcher.queue.get_nowait())
+
+    return events
+
+
+def test_watch_key_and_prefix() -> None:
+    (store, hub) = create_hub()
+    key_watcher = hub.watch('a', prefix=False)
+    prefix_watcher = hub.watch('user/', prefix=True)
+
+    store.apply([set_op('a', '1'), set_op('user/1', 'x')])
+    store.apply([set_op('ab', '2'), del_op('user/1')])
+
+    assert drain(key_watcher) == [
+        {'op': OP_SET, 'key': 'a', 'value': '1', 'version': 1, 'index': 1},
+    ]
+    assert drain(prefix_watcher) == [
+        {'op': OP_SET, 'key': 'user/1', 'value': 'x', 'version': 1,
+         'index': 1},
+        {'op': OP_DEL, 'key': 'user/1', 'index': 2},
+    ]
+
+
+def test_unwatch() -> None:
+    (store, hub) = create_hub()
+    watcher = hub.watch('a', prefix=False)
+    hub.unwatch(watcher)
+
+    store.apply([set_op('a', '1')])
+
+    assert drain(watcher) == []
+    assert hub._watchers == {}
+
+
+def test_replay_from_index() -> None:
+    (store, hub) = create_hub()
+    for i in range(1, 5):
+        store.apply([set_op('a', str(i)), set_op('b', str(i))])
+
+    watcher = hub.watch('a', prefix=False, from_index=3)
+
+    assert watcher.index == 4
+    assert [(e['index'], e['value']) for e in watcher.replay] == [
+        (3, '3'), (4, '4')]
+
+
+def test_replay_of_compacted_history() -> None:
+    (store, hub) = create_hub(history_size=2)
+    for i in range(1, 5):
+        store.apply([set_op('a', str(i))])
+
+    # entries 3 and 4 are retained
+    assert len(hub.watch('a', prefix=False, from_index=3).replay) == 2
+
+    with pytest.raises(HistoryCompactedError):
+        hub.watch('a', prefix=False, from_index=2)
+
+
+def test_replay_without_history() -> None:
+    (store, hub) = create_hub(history_size=0)
+    store.apply([set_op('a', '1')])
+
+    with pytest.raises(HistoryCompactedError):
+        hub.watch('a', prefix=False, from_index=1)
+
+    assert hub.watch('a', prefix=False, from_index=2).replay == []
+
+
+def test_slow_watcher_is_dropped() -> None:
+    (store, hub) = create_hub(buffer_size=2)
+    slow = hub.watch('a', prefix=False)
+    other = hub.watch('a', prefix=True)
+
+    for i in range(2):
+        store.apply([set_op('a', str(i))])
+    assert len(drain(other)) == 2
+
+    # buffer of slow watcher is full, it is dropped with resync
+    store.apply([set_op('a', '2')])
+    assert drain(slow) == [RESYNC]
+    assert 'a' not in hub._watchers
+    assert drain(other) == [
+        {'op': OP_SET, 'key': 'a', 'value': '2', 'version': 3, 'index': 3}]
+
+    store.apply([set_op('a', '3')])
+    assert drain(slow) == []
+
+
+def test_reset_drops_every_watcher() -> None:
+    (store, hub) = create_hub()
+    store.apply([set_op('a', '1')])
+    watchers = [hub.watch('a', prefix=False), hub.watch('', prefix=True)]
+
+    hub.reset()
+
+    assert [drain(watcher) for watcher in watchers] == [[RESYNC], [RESYNC]]
+    assert (hub._watchers, hub._prefix_watchers) == ({}, set())
+
+    with pytest.raises(HistoryCompactedError):
+        hub.watch('a', prefix=False, from_index=1)
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import socket
+from asyncio.streams import StreamReader
+from asyncio.streams import StreamWriter
+from typing import Any
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+
+UNIX = 'unix'
+# suffix of socket path, which members bind unix connections to peers to
+BIND_SUFFIX = '.peer'
+
+
+def unix_path(addr: str) -> Optional[str]:
+    """Returns socket path of `unix:/path` address, None for TCP address
+    """
+
+    if addr.startswith(f'{UNIX}:'):
+        return addr[len(UNIX) + 1:]
+
+    return None
+
+
+def parse_address(address: str) -> Tuple[str, Union[int, str]]:
+    """Parse `ip:port` or `unix:/path` address to host and port
+
+    port of unix socket address is the socket path.
+    """
+
+    (host, port) = address.split(':', 1)
+    if host == UNIX:
+        return (host, port)
+
+    return (host, int(port))
+
+
+def bind_address(address: str) -> Optional[str]:
+    """Returns unix address which member listening at `address` binds its
+    connections to peers to, None for TCP address
+    """
+
+    if (path := unix_path(address)) is not None:
+        return f'{UNIX}:{path}{BIND_SUFFIX}'
+
+    return None
+
+
+def peer_address(writer: StreamWriter) -> Tuple[str, Any]:
+    """Returns peer ip and port of connection, `unix` and bound socket
+    path of peer for unix socket connections, empty when not bound.
+    """
+
+    peername = writer.get_extra_info('peername')
+    if isinstance(peername, tuple):
+        return (peername[0], peername[1])
+
+    return (UNIX, peername or '')
+
+
+def client_key(host: str, port: Any) -> str:
+    """Returns key of client for admission control
+
+    TCP clients are keyed by ip. unix socket clients are keyed by bound
+    socket path, and clients without bound path share a key, as TCP
+    clients of a host do.
+    """
+
+    if host == UNIX:
+        return f'{host}:{port}'
+
+    return host
+
+
+def member_key(address: str) -> str:
+    """Returns client key of connections from member at `address`
+
+    unix members bind connections to `bind_address`, so they are told
+    apart by path. TCP members are keyed by ip, so clients on the host
+    of a member cannot be told apart from the member.
+    """
+
+    return client_key(*parse_address(bind_address(address) or address))
+
+
+async def open_connection(
+        host: str, port: Union[int, str], bind: Optional[str] = None,
+        **kwargs: Any) -> Tuple[StreamReader, StreamWriter]:
+    """Open connection, unix socket connection is bound to `bind` address
+    """
+
+    if host == UNIX:
+        if bind is None or (path := unix_path(bind)) is None:
+            return await asyncio.open_unix_connection(str(port), **kwargs)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # connection keeps the bound path after the file is removed,
+            # so the path can be bound by the next connection.
+            remove_socket_file(bind)
+            sock.bind(path)
+            remove_socket_file(bind)
+
+            sock.setblocking(False)
+            await asyncio.get_running_loop().sock_connect(sock, str(port))
+
+        except OSError:
+            sock.close()
+            raise
+
+        return await asyncio.open_unix_connection(sock=sock, **kwargs)
+
+    return await asyncio.open_connection(host, port, **kwargs)
+
+
+async def start_server(handler: Any, addr: str, port: Union[int, str],
+                       **kwargs: Any) -> asyncio.Server:
+    """Start TCP server, or unix socket server for `unix:/path` address
+    """
+
+    if (path := unix_path(addr)) is not None:
+        return await asyncio.start_unix_server(handler, path, **kwargs)
+
+    return await asyncio.start_server(handler, addr, port, **kwargs)
+
+
+def remove_socket_file(addr: str) -> None:
+    if (path := unix_path(addr)) is not None and os.path.exists(path):
+        os.unlink(path)
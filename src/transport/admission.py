@@ -0,0 +1,149 @@
+import time
+from dataclasses import dataclass
+from typing import Dict
+from typing import FrozenSet
+from typing import Iterable
+from typing import Tuple
+
+
+@dataclass
+class AdmissionLimits(object):
+    """Admission control limits for tcp server
+
+    zero value disables the limit.
+    """
+
+    max_connections: int = 256
+    max_inflight: int = 1024
+    max_message_size: int = 64 * 1024
+    rate_limit: float = 0.0
+    rate_burst: int = 100
+
+
+class AdmissionControl(object):
+    """Tracks connections, in-flight requests and per client rate.
+
+    commands listed in `priority` (consensus traffic) from `peers` client
+    keys are never rejected by connection, in-flight or rate limits. the
+    same commands from other clients are limited as usual. TCP clients on
+    the host of a peer share its key, so they are not told apart from it.
+
+    requests are handled one by one on each connection, so in-flight
+    requests per connection is always bounded to one. rate bucket of a
+    client outlives its connections until refilled, so clients which
+    open a connection per request are limited too.
+    """
+
+    _limits: AdmissionLimits
+    _priority: FrozenSet[str]
+    _peers: FrozenSet[str]
+
+    _connections: int
+    _inflight: int
+    _clients: Dict[str, int]
+    _buckets: Dict[str, Tuple[float, float]]
+    # refilled time of buckets of disconnected clients, disconnected first
+    _idle: Dict[str, float]
+
+    def __init__(self, limits: AdmissionLimits,
+                 priority: Iterable[str] = (),
+                 peers: Iterable[str] = ()) -> None:
+        self._limits = limits
+        self._priority = frozenset(priority)
+        self._peers = frozenset(peers)
+
+        self._connections = 0
+        self._inflight = 0
+        self._clients = {}
+        self._buckets = {}
+        self._idle = {}
+
+    @property
+    def max_message_size(self) -> int:
+        return self._limits.max_message_size
+
+    def is_priority(self, client: str, message: str) -> bool:
+        return client in self._peers and (
+            message.split(' ', 1)[0].strip() in self._priority)
+
+    def connect(self, client: str) -> bool:
+        """Register connection, returns False when connections are full.
+
+        rejected connection is still registered, and only can serve
+        priority commands.
+        """
+
+        self._connections += 1
+        self._clients[client] = self._clients.get(client, 0) + 1
+        self._idle.pop(client, None)
+
+        max_connections = self._limits.max_connections
+        return not max_connections or self._connections <= max_connections
+
+    def disconnect(self, client: str) -> None:
+        self._connections -= 1
+
+        if (count := self._clients.get(client, 0) - 1) > 0:
+            self._clients[client] = count
+
+        else:
+            self._clients.pop(client, None)
+
+            if (bucket := self._buckets.get(client)) is not None:
+                (tokens, updated_at) = bucket
+                burst = float(self._limits.rate_burst or 1)
+                self._idle[client] = (
+                    updated_at + (burst - tokens) / self._limits.rate_limit)
+
+        self._drop_refilled(time.monotonic())
+
+    def _drop_refilled(self, now: float) -> None:
+        """Drop refilled buckets of disconnected clients
+
+        buckets are refilled in `burst / rate` seconds at most, so
+        dropping stops at the first bucket not refilled yet.
+        """
+
+        while self._idle:
+            client = next(iter(self._idle))
+            if self._idle[client] > now:
+                break
+
+            del self._idle[client]
+            self._buckets.pop(client, None)
+
+    def acquire(self, client: str, priority: bool) -> bool:
+        """Take in-flight slot and rate token for the request.
+        """
+
+        if not priority:
+            max_inflight = self._limits.max_inflight
+            if max_inflight and self._inflight >= max_inflight:
+                return False
+
+            if self._limits.rate_limit and not self._take_token(client):
+                return False
+
+        self._inflight += 1
+        return True
+
+    def release(self) -> None:
+        self._inflight -= 1
+
+    def _take_token(self, client: str) -> bool:
+        """Token bucket rate limiter per client
+        """
+
+        now = time.monotonic()
+        burst = float(self._limits.rate_burst or 1)
+        tokens, updated_at = self._buckets.get(client, (burst, now))
+
+        tokens = min(
+            burst, tokens + (now - updated_at) * self._limits.rate_limit)
+
+        if tokens < 1.0:
+            self._buckets[client] = (tokens, now)
+            return False
+
+        self._buckets[client] = (tokens - 1.0, now)
+        return True
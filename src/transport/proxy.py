@@ -0,0 +1,342 @@
+import asyncio
+import json
+import os
+import random
+import time
+from asyncio.streams import StreamReader
+from asyncio.streams import StreamWriter
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import fields
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+import core.logger as logger
+from transport.address import UNIX
+from transport.address import bind_address
+from transport.address import open_connection
+from transport.address import parse_address
+from transport.address import remove_socket_file
+from transport.address import start_server
+from transport.address import unix_path
+from transport.tcp import response_err
+from transport.tcp import response_ok
+from transport.tcp import run_server
+
+
+ERR_UNKNOWN_LINK = 'UNKNOWN_LINK'
+ERR_INVALID_ARGUMENT = 'INVALID_ARGUMENT'
+
+ANY_MEMBER = '*'
+
+# stream buffer limit, larger than max message size of members
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+@dataclass
+class LinkFaults(object):
+    """Faults of a one-way link between members
+
+    latency and jitter are seconds, bandwidth is bytes per second.
+    drop is probability of dropping a message. zero value disables.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    bandwidth: float = 0.0
+    drop: float = 0.0
+    down: bool = False
+
+
+class Link(object):
+    """One-way link, delays and drops messages from src to dst
+
+    messages are lines of raft transport, so a dropped message never
+    breaks framing. messages are delivered in order.
+    """
+
+    src: str
+    dst: str
+    faults: LinkFaults
+
+    _busy_until: float
+    _delivered_at: float
+
+    def __init__(self, src: str, dst: str) -> None:
+        self.src = src
+        self.dst = dst
+        self.faults = LinkFaults()
+
+        self._busy_until = 0.0
+        self._delivered_at = 0.0
+
+    def schedule(self, size: int) -> Optional[float]:
+        """Returns monotonic deliver time of message, None when dropped
+        """
+
+        faults = self.faults
+        if faults.down or random.random() < faults.drop:
+            return None
+
+        now = time.monotonic()
+
+        sent_at = now
+        if faults.bandwidth:
+            sent_at = max(now, self._busy_until) + size / faults.bandwidth
+            self._busy_until = sent_at
+
+        delay = faults.latency + random.uniform(0, faults.jitter)
+
+        # keep order of messages
+        self._delivered_at = max(self._delivered_at, sent_at + delay)
+
+        return self._delivered_at
+
+
+async def pump(reader: StreamReader, writer: StreamWriter, link: Link) -> None:
+    queue = asyncio.Queue()  # type: asyncio.Queue
+
+    async def _deliver() -> None:
+        try:
+            while (item := await queue.get()) is not None:
+                (deliver_at, message) = item
+
+                if (delay := deliver_at - time.monotonic()) > 0:
+                    await asyncio.sleep(delay)
+
+                writer.write(message)
+                await writer.drain()
+
+        except ConnectionError:
+            pass
+
+        finally:
+            writer.close()
+
+    deliver = asyncio.create_task(_deliver(), name='proxy_deliver')
+
+    try:
+        while message := await reader.readline():
+            if (deliver_at := link.schedule(len(message))) is not None:
+                queue.put_nowait((deliver_at, message))
+
+    except ConnectionError:
+        pass
+
+    finally:
+        queue.put_nowait(None)
+        await deliver
+
+
+class FaultProxy(object):
+    """Loopback proxy between raft members, injects faults per link
+
+    listens a port for each ordered member pair. member `src` should
+    reach member `dst` through the port of link (src, dst), so each
+    member has its own members config. with `unix:/dir` addr, links
+    listen unix sockets in the directory instead of ports.
+    """
+
+    _addr: str
+    _base_port: int
+    _members: Dict[str, Tuple[str, Union[int, str]]]
+    _links: Dict[Tuple[str, str], Link]
+    _addresses: Dict[Tuple[str, str], str]
+
+    def __init__(self, members: str, addr: str = '127.0.0.1',
+                 base_port: int = 3468) -> None:
+        self._addr = addr
+        self._base_port = base_port
+
+        self._members = {}
+        for member in members.split(','):
+            (name, address) = member.split(':', 1)
+            self._members[name] = parse_address(address)
+
+        self._links = {}
+        self._addresses = {}
+        for src in self._members:
+            for dst in self._members:
+                if src != dst:
+                    self._addresses[(src, dst)] = self._link_address(
+                        src, dst, base_port + len(self._links))
+                    self._links[(src, dst)] = Link(src, dst)
+
+    def _link_address(self, src: str, dst: str, port: int) -> str:
+        if (path := unix_path(self._addr)) is not None:
+            return f'{UNIX}:{os.path.join(path, f"{src}-{dst}.sock")}'
+
+        return f'{self._addr}:{port}'
+
+    def members_of(self, name: str) -> str:
+        """Returns members config of member, peers are proxied
+        """
+
+        members = []
+        for (member, (ip, port)) in self._members.items():
+            if member != name:
+                address = self._addresses[(name, member)]
+            else:
+                address = f'{ip}:{port}'
+            members.append(f'{member}:{address}')
+
+        return ','.join(members)
+
+    def links(self, src: str, dst: str) -> List[Link]:
+        """Returns links matched, `*` matches any member
+        """
+
+        return [
+            link for ((s, d), link) in self._links.items()
+            if src in (s, ANY_MEMBER) and dst in (d, ANY_MEMBER)
+        ]
+
+    def set_faults(self, src: str, dst: str, **faults: Any) -> int:
+        links = self.links(src, dst)
+        for link in links:
+            for (key, value) in faults.items():
+                setattr(link.faults, key, value)
+
+        return len(links)
+
+    def partition(self, a: str, b: str, oneway: bool = False) -> int:
+        """Cut link a to b, and b to a unless oneway
+        """
+
+        count = self.set_faults(a, b, down=True)
+        if not oneway:
+            count += self.set_faults(b, a, down=True)
+
+        return count
+
+    def heal(self) -> None:
+        for link in self._links.values():
+            link.faults.down = False
+
+    def _handler(self, link: Link) -> Any:
+        async def _handle(reader: StreamReader, writer: StreamWriter) -> None:
+            (ip, port) = self._members[link.dst]
+            # bound as the address of src, which dst knows
+            bind = bind_address(self._addresses[(link.dst, link.src)])
+
+            try:
+                (upstream_reader, upstream_writer) = (
+                    await open_connection(
+                        ip, port, bind=bind, limit=STREAM_LIMIT))
+
+            except OSError:
+                writer.close()
+                return
+
+            # responses go through the reverse link
+            reverse = self._links[(link.dst, link.src)]
+            try:
+                await asyncio.gather(
+                    pump(reader, upstream_writer, link),
+                    pump(upstream_reader, writer, reverse))
+
+            except asyncio.exceptions.CancelledError:
+                upstream_writer.close()
+                writer.close()
+
+        return _handle
+
+    async def run(self) -> None:
+        servers = []
+        for (pair, link) in self._links.items():
+            address = self._addresses[pair]
+            (host, port) = parse_address(address)
+            # unix socket server is started by `unix:/path` address
+            servers.append(await start_server(
+                self._handler(link), address if host == UNIX else host,
+                port, limit=STREAM_LIMIT))
+            logger.info(
+                f'proxy {link.src} -> {link.dst} listen at {address}')
+
+        try:
+            await asyncio.gather(*[
+                server.serve_forever() for server in servers
+            ])
+
+        except asyncio.exceptions.CancelledError:
+            for server in servers:
+                server.close()
+
+        finally:
+            for address in self._addresses.values():
+                remove_socket_file(address)
+
+    async def handle_set(self, src: str, dst: str, raw_faults: str) -> bytes:
+        """set faults of links, e.g. `set raft-1 * latency=0.005 drop=0.01`
+        """
+
+        field_types = {f.name: f.type for f in fields(LinkFaults)}
+        faults = {}  # type: Dict[str, Union[bool, float]]
+
+        try:
+            for pair in raw_faults.split():
+                (key, value) = pair.split('=', 1)
+                if field_types[key] in (bool, 'bool'):
+                    faults[key] = value.lower() in ('1', 'true', 'yes')
+                else:
+                    faults[key] = float(value)
+
+        except (KeyError, ValueError):
+            return response_err(ERR_INVALID_ARGUMENT)
+
+        if not (count := self.set_faults(src, dst, **faults)):
+            return response_err(ERR_UNKNOWN_LINK)
+
+        return response_ok(str(count))
+
+    async def handle_partition(self, a: str, b: str,
+                               mode: str = 'full') -> bytes:
+        """cut links between members, `oneway` only cuts a to b
+        """
+
+        if not (count := self.partition(a, b, oneway=mode == 'oneway')):
+            return response_err(ERR_UNKNOWN_LINK)
+
+        return response_ok(str(count))
+
+    async def handle_heal(self) -> bytes:
+        self.heal()
+
+        return response_ok('healed')
+
+    async def handle_reset(self) -> bytes:
+        for link in self._links.values():
+            link.faults = LinkFaults()
+
+        return response_ok('reset')
+
+    async def handle_show(self) -> bytes:
+        links = {
+            f'{src}>{dst}': asdict(link.faults)
+            for ((src, dst), link) in self._links.items()
+        }
+
+        return response_ok(json.dumps(links, separators=(',', ':')))
+
+    async def handle_members(self, name: str) -> bytes:
+        if name not in self._members:
+            return response_err(ERR_UNKNOWN_LINK)
+
+        return response_ok(self.members_of(name))
+
+    def create_control_server(self, addr: str, port: int) -> Any:
+        return run_server(
+            name='proxy', addr=addr, port=port,
+            commands={
+                'set': (self.handle_set, 3),
+                'partition': (self.handle_partition, 3),
+                'heal': (self.handle_heal, 0),
+                'reset': (self.handle_reset, 0),
+                'show': (self.handle_show, 0),
+                'members': (self.handle_members, 1),
+            }
+        )
@@ -1,47 +1,77 @@
 import asyncio
 from asyncio.streams import StreamReader
 from asyncio.streams import StreamWriter
+from typing import Any
+from typing import AsyncIterator
 from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
 
 import core.logger as logger
+from transport.admission import AdmissionControl
+from transport.admission import AdmissionLimits
+from transport.address import client_key
+from transport.address import peer_address
+from transport.address import remove_socket_file
+from transport.address import start_server
 
 
 CMD_OK = '+OK'
 CMD_ERR = '-ERR'
 
+ERR_BUSY = 'BUSY'
+ERR_MESSAGE_TOO_LARGE = 'MESSAGE_TOO_LARGE'
+
 
 class ParseMessageError(RuntimeError):
     pass
 
 
-async def run_server(name: str, addr: str, port: int, commands: dict) -> None:
+async def run_server(name: str, addr: str, port: int, commands: dict,
+                     admission: Optional[AdmissionControl] = None) -> None:
     logger.info(f'[{name=}] start tcp server')
 
-    # create TCP server
-    handler = get_handler(name=name, commands=commands)
-    server = await asyncio.start_server(handler, addr, port)
+    if admission is None:
+        admission = AdmissionControl(AdmissionLimits())
+
+    # create TCP server, or unix socket server for `unix:/path` address
+    handler = get_handler(name=name, commands=commands, admission=admission)
+    server = await start_server(
+        handler, addr, port, limit=admission.max_message_size)
 
     try:
         async with server:
-            (_ip, _port) = server.sockets[0].getsockname()
-            logger.info(f'[{name=}] server listen at {_ip}:{_port}')
+            logger.info(
+                f'[{name=}] server listen at'
+                f' {server.sockets[0].getsockname()}')
             await server.serve_forever()
 
     except asyncio.exceptions.CancelledError:
         logger.trace(f'[{name=}] close server')
         server.close()
 
+    finally:
+        remove_socket_file(addr)
+
     logger.info(f'[{name=}] server closed')
 
 
-def parse_message(commands: dict, message: str) -> tuple:
-    try:
-        (cmd, raw_args) = message.split('\n')[0].split(maxsplit=1)
+def parse_message(commands: dict,
+                  message: str) -> Tuple[Callable[..., Any], List[str]]:
+    """Parse message to command method and arguments
 
-        if method_arg_length := commands.get(cmd):
-            method, length = method_arg_length
+    last argument takes the rest of the line.
+    """
 
-        args = raw_args.split(maxsplit=length)
+    try:
+        (cmd, *raw_args) = message.split('\n')[0].strip().split(maxsplit=1)
+        (method, length) = commands[cmd]
+
+        args = []  # type: list
+        if raw_args and length:
+            args = raw_args[0].split(maxsplit=length - 1)
 
     except Exception:
         logger.error(f'parse message error [{message=}]')
@@ -64,40 +94,167 @@ def response_err(message: str) -> bytes:
     return f'{CMD_ERR}:{message}\r\n'.encode()
 
 
-def get_handler(name: str, commands: dict) -> Callable:
+def get_handler(name: str, commands: dict,
+                admission: AdmissionControl) -> Callable:
     async def _handle_request(
             reader: StreamReader, writer: StreamWriter) -> None:
 
-        (ip, port) = writer.get_extra_info('peername')
+        (ip, port) = peer_address(writer)
+        client = client_key(ip, port)
         logger.trace(f'[{name}] client {ip}:{port} is connected')
 
-        while True:
-            buffer = await reader.readline()
-            message = buffer.decode()
+        # over-limit connections only serve a priority command and close
+        admitted = admission.connect(client)
+        if not admitted:
+            logger.warn(f'[{name}] too many connections [{ip}:{port}]')
+
+        # start of the next message, read while streaming responses
+        received = b''
+        response: Union[bytes, AsyncIterator[bytes]]
+
+        try:
+            while True:
+                try:
+                    buffer = received
+                    if not buffer.endswith(b'\n'):
+                        buffer += await reader.readline()
+                    received = b''
+
+                except ValueError:
+                    logger.warn(
+                        f'[{name}] message too large from {ip}:{port}')
+                    writer.write(response_err(ERR_MESSAGE_TOO_LARGE))
+                    await close_connection(writer)
+                    break
+
+                message = buffer.decode()
+
+                if not message:
+                    logger.trace(f'[{name}] client {ip}:{port} closed')
+                    await close_connection(writer)
+                    break
+
+                priority = admission.is_priority(client, message)
+
+                if not (admitted or priority):
+                    writer.write(response_err(ERR_BUSY))
+                    await close_connection(writer)
+                    break
+
+                if not admission.acquire(client, priority):
+                    response = response_err(ERR_BUSY)
+
+                else:
+                    try:
+                        response = await _dispatch(message, ip, port)
+                    finally:
+                        admission.release()
+
+                # streaming responses (e.g. watch) can last long,
+                # so they don't hold in-flight slot.
+                if not isinstance(response, bytes):
+                    received = await _stream(
+                        reader, writer, response, ip, port)
+                    response = b''
 
-            if not message:
-                logger.trace(f'[{name}] client {ip}:{port} closed')
-                await close_connection(writer)
-                break
+                logger.trace(
+                    f'[{name}] send to client {ip}:{port}'
+                    f' message: {response!r}')
+                writer.write(response)
+                await writer.drain()
 
-            try:
-                (method, args) = parse_message(commands, message)
-                logger.debug(f'[{name}] {method.__name__=}, {args}')
+                if not admitted:
+                    await close_connection(writer)
+                    break
 
-                response = await method(*args)
-                logger.trace(
-                    f'[{name}] msg from client {ip}:{port} : {message!r}')
+        except ConnectionError:
+            logger.trace(f'[{name}] client {ip}:{port} connection lost')
+
+        finally:
+            admission.disconnect(client)
+
+    async def _dispatch(
+            message: str, ip: str,
+            port: int) -> Union[bytes, AsyncIterator[bytes]]:
+        """Run command method
+
+        method returns response bytes, or async iterator of response
+        bytes for streaming multiple responses.
+        """
 
-            except ParseMessageError:
-                response = response_err('UNKNOWN_COMMAND')
+        response: Union[bytes, AsyncIterator[bytes]]
 
-            except Exception as e:
-                response = response_err('UNKNOWN_ERROR')
-                logger.error(
-                    f'[{name}] [{ip}:{port}] error occurred. [{message=}] {e}')
+        try:
+            (method, args) = parse_message(commands, message)
+            logger.debug(f'[{name}] {method.__name__=}, {args}')
 
+            response = await method(*args)
             logger.trace(
-                f'[{name}] send to client {ip}:{port} message: {response!r}')
-            writer.write(response)
+                f'[{name}] msg from client {ip}:{port} : {message!r}')
+
+        except ParseMessageError:
+            response = response_err('UNKNOWN_COMMAND')
+
+        except Exception as e:
+            response = response_err('UNKNOWN_ERROR')
+            logger.error(
+                f'[{name}] [{ip}:{port}] error occurred. [{message=}] {e}')
+
+        return response
+
+    async def _stream(reader: StreamReader, writer: StreamWriter,
+                      responses: AsyncIterator[bytes],
+                      ip: str, port: int) -> bytes:
+        """Write streaming responses until done, or the client is closed
+
+        long-lived streams (e.g. watch) may write nothing for a long time,
+        so the connection is read to notice the closed client. returns
+        bytes read from the client while streaming.
+        """
+
+        async def _write() -> None:
+            async for response in responses:
+                writer.write(response)
+                await writer.drain()
+
+        async def _read() -> bytes:
+            try:
+                return await reader.read(1)
+
+            except ConnectionError:
+                return b''
+
+        writing = asyncio.create_task(_write())
+        reading = asyncio.create_task(_read())
+
+        try:
+            await asyncio.wait(
+                (writing, reading), return_when=asyncio.FIRST_COMPLETED)
+
+            if not writing.done() and not reading.result():
+                raise ConnectionResetError()
+
+            await writing
+
+        except ConnectionError:
+            raise
+
+        except Exception as e:
+            writer.write(response_err('UNKNOWN_ERROR'))
+            logger.error(
+                f'[{name}] [{ip}:{port}] error occurred while streaming. {e}')
+
+        finally:
+            # the reader is free for the next message only when the
+            # cancelled read is done
+            reading.cancel()
+            if not writing.done():
+                writing.cancel()
+            await asyncio.wait((reading, writing))
+
+            if aclose := getattr(responses, 'aclose', None):
+                await aclose()
+
+        return b'' if reading.cancelled() else reading.result()
 
     return _handle_request
@@ -1,49 +1,87 @@
 import asyncio
+import time
+from typing import Callable
 from typing import List
+from typing import Optional
+from typing import Union
 
 import core.logger as logger
+from transport.address import open_connection
+from transport.address import parse_address
 
 
-async def call(ip: str, port: int, message: str) -> str:
+async def call(ip: str, port: Union[int, str], message: str,
+               bind: Optional[str] = None) -> str:
+    """send & receive response, `ip` is `unix` for unix socket path
+
+    unix socket connection is bound to `bind` address, when given.
+    """
+
     logger.trace(f'[{ip}:{port}] open connection')
-    reader, writer = await asyncio.open_connection(ip, port)
+    reader, writer = await open_connection(ip, port, bind=bind)
     logger.trace(f'[{ip}:{port}] connection opened')
 
-    payload = f'{message}\n'.encode()
-    logger.trace(f'[{ip}:{port}] write: {payload.decode()!r}')
+    # close connection even when the call is cancelled by timeout
+    try:
+        payload = f'{message}\n'.encode()
+        logger.trace(f'[{ip}:{port}] write: {payload.decode()!r}')
 
-    writer.write(payload)
-    await writer.drain()
+        writer.write(payload)
+        await writer.drain()
 
-    data = await reader.readline()
-    logger.trace(f'[{ip}:{port}] received: {data.decode()!r}')
+        data = await reader.readline()
+        logger.trace(f'[{ip}:{port}] received: {data.decode()!r}')
+
+    finally:
+        logger.trace(f'[{ip}:{port}] close connection')
+        writer.close()
 
-    logger.trace(f'[{ip}:{port}] close connection')
-    writer.close()
     await writer.wait_closed()
     logger.trace(f'[{ip}:{port}] connection closed')
 
     return data.decode()
 
 
-async def broadcast(ip_ports: List[str], message: str) -> List[str]:
-    """send & receive response from ip port list
-    """
-
-    responses = []
+async def broadcast(
+        ip_ports: List[str], message: str,
+        observe: Optional[Callable[[str, float, bool], None]] = None,
+        timeout: Optional[float] = None,
+        bind: Optional[str] = None) -> List[str]:
+    """send & receive response from ip port list concurrently
 
-    for ip_port in ip_ports:
+    `observe` is called with ip port, elapsed seconds and whether the call
+    is timed out. peers which are not responded in `timeout` seconds are
+    skipped, and observed with the timeout as elapsed.
+    """
 
-        ip, port = ip_port.split(':')
+    async def _call(ip_port: str) -> Optional[str]:
+        ip, port = parse_address(ip_port)
         logger.trace(f'dialup {ip}:{port}')
 
         try:
-            response = await call(ip, int(port), message)
+            started_at = time.perf_counter()
+            response = await asyncio.wait_for(
+                call(ip, port, message, bind=bind), timeout)
             logger.debug(f'got message from {ip}:{port} [{response=!r}]')
 
-            responses.append(response)
+            if observe:
+                observe(ip_port, time.perf_counter() - started_at, False)
+
+            return response
+
+        except asyncio.TimeoutError:
+            logger.warn(f'call timeout {ip}:{port}')
 
-        except ConnectionRefusedError:
+            if observe and timeout is not None:
+                observe(ip_port, timeout, True)
+
+        except OSError:
             logger.warn(f'dialup failed {ip}:{port}')
 
-    return responses
+        return None
+
+    responses = await asyncio.gather(*[
+        _call(ip_port) for ip_port in ip_ports
+    ])
+
+    return [response for response in responses if response is not None]